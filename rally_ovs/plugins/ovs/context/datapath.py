@@ -21,10 +21,18 @@ from rally.common import logging
 from rally.task import context
 
 from rally_ovs.plugins.ovs import ovnclients
+from rally_ovs.plugins.ovs import records
 
 
 LOG = logging.getLogger(__name__)
 
+BATCH_SCHEMA = {
+    "anyOf": [
+        {"type": "integer", "minimum": 1},
+        {"enum": ["auto"]},
+    ]
+}
+
 
 @context.configure(name="datapath", order=115)
 class Datapath(ovnclients.OvnClientMixin, context.Context):
@@ -42,7 +50,10 @@ class Datapath(ovnclients.OvnClientMixin, context.Context):
                 "type": "object",
                 "properties": {
                     "amount": {"type": "integer", "minimum": 0},
-                    "batch": {"type": "integer", "minimum": 1},
+                    "batch": BATCH_SCHEMA,
+                    "batch_min": {"type": "integer", "minimum": 1},
+                    "batch_max": {"type": "integer", "minimum": 1},
+                    "batch_max_latency": {"type": "number", "minimum": 0},
                 },
                 "additionalProperties": False,
             },
@@ -50,7 +61,10 @@ class Datapath(ovnclients.OvnClientMixin, context.Context):
                 "type": "object",
                 "properties": {
                     "amount": {"type": "integer", "minimum": 0},
-                    "batch": {"type": "integer", "minimum": 1},
+                    "batch": BATCH_SCHEMA,
+                    "batch_min": {"type": "integer", "minimum": 1},
+                    "batch_max": {"type": "integer", "minimum": 1},
+                    "batch_max_latency": {"type": "number", "minimum": 0},
                     "start_cidr": {"type": "string"},
                 },
                 "additionalProperties": False,
@@ -89,7 +103,7 @@ class Datapath(ovnclients.OvnClientMixin, context.Context):
             "routers": routers,
             "lswitches": lswitches,
         }
-        self.context["ovs-internal-ports"] = {}
+        self.context["ovs-internal-ports"] = records.PortRegistry()
 
     def cleanup(self):
         pass  # Not implemented
@@ -26,17 +26,31 @@ from rally_ovs.plugins.ovs import utils
 
 LOG = logging.getLogger(__name__)
 
+OVSDB_CLIENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string"},
+        "remote": {"type": "string"},
+        "privkey": {"type": "string"},
+        "cert": {"type": "string"},
+        "cacert": {"type": "string"},
+        "pipeline": {"type": "integer", "minimum": 1},
+        "write_behind": {"type": "integer", "minimum": 0},
+        "coalesce_create": {"type": "boolean"},
+    },
+    "required": ["type"],
+    "additionalProperties": False,
+}
 
 
 def get_ovn_multihost_info(deploy_uuid, controller_name):
 
-    deployments = db.deployment_list(parent_uuid=deploy_uuid)
+    inventory = utils.get_inventory(deploy_uuid)
 
     multihost_info = {"controller" : {}, "farms" : {}, "install_method" : "sandbox"}
 
-    for dep in deployments:
-        cred = db.resource_get_all(dep["uuid"], type=ResourceType.CREDENTIAL)[0]
-        cred = copy.deepcopy(cred.info)
+    for dep in inventory.deployments:
+        cred = copy.deepcopy(dep["credential"])
         name = dep["name"]
 
         info = { "name" : name, "credential" :  cred}
@@ -46,8 +60,8 @@ def get_ovn_multihost_info(deploy_uuid, controller_name):
         else:
             multihost_info["farms"][name] = info
 
-        if 'install_method' in dep.config:
-            multihost_info["install_method"] = dep.config["install_method"]
+        if 'install_method' in dep["config"]:
+            multihost_info["install_method"] = dep["config"]["install_method"]
 
     return multihost_info
 
@@ -60,6 +74,22 @@ class OvnMultihost(context.Context):
         "$schema": consts.JSON_SCHEMA,
         "properties": {
             "log_cmd": {"type": "boolean"},
+            "farm_concurrency": {"type": "integer", "minimum": 1},
+            "ssh_pool": {
+                "type": "object",
+                "properties": {
+                    "size": {"type": "integer", "minimum": 1},
+                    "idle_timeout": {"type": "number", "minimum": 0},
+                    "compress_threshold": {"type": "integer", "minimum": 0},
+                    "retries": {"type": "integer", "minimum": 0},
+                    "retry_backoff": {"type": "number", "minimum": 0},
+                    "breaker_threshold": {"type": "integer", "minimum": 0},
+                    "breaker_timeout": {"type": "number", "minimum": 0},
+                },
+                "additionalProperties": False,
+            },
+            "nb_client": OVSDB_CLIENT_SCHEMA,
+            "sb_client": OVSDB_CLIENT_SCHEMA,
         },
         "additionalProperties": True
     }
@@ -74,6 +104,10 @@ class OvnMultihost(context.Context):
         controller_name = self.config["controller"]
 
         multihost_info = get_ovn_multihost_info(multihost_uuid, controller_name)
+        multihost_info["ssh_pool"] = self.config.get("ssh_pool", {})
+        if "farm_concurrency" in self.config:
+            multihost_info["farm_concurrency"] = \
+                self.config["farm_concurrency"]
         self.context["ovn_multihost"] = multihost_info
 
         try:
@@ -90,6 +124,8 @@ class OvnMultihost(context.Context):
 
         self.context["controller"] = res["info"]
         self.context["log_cmd"] = self.config.get("log_cmd", False)
+        self.context["nb_client"] = self.config.get("nb_client", {})
+        self.context["sb_client"] = self.config.get("sb_client", {})
 
 
 
@@ -18,32 +18,49 @@ from rally.common import logging
 from rally import consts
 from rally.task import context
 from rally_ovs.plugins.ovs import ovnclients
+from rally_ovs.plugins.ovs import records
 
 LOG = logging.getLogger(__name__)
 
 
 @context.configure(name="ovn_nb", order=120)
 class OvnNorthboundContext(ovnclients.OvnClientMixin, context.Context):
+    """Put the logical switches of the NB database in context["ovn-nb"].
+
+    The NB is dumped by the first ovn_nb context of a task only, later
+    ones reuse the topology kept up to date by the OvnClientMixin
+    helpers, unless a runner process changed the NB. Only switches whose
+    name starts with lswitch_prefix are listed.
+    """
+
     CONFIG_SCHEMA = {
         "type": "object",
         "$schema": consts.JSON_SCHEMA,
         "properties": {
+            "lswitch_prefix": {"type": "string"},
+            "use_cache": {"type": "boolean"},
         },
         "additionalProperties": True
     }
 
     DEFAULT_CONFIG = {
+        "lswitch_prefix": "lswitch_",
+        "use_cache": True,
     }
 
     @logging.log_task_wrapper(LOG.info, _("Enter context: `ovn_nb`"))
     def setup(self):
         super(OvnNorthboundContext, self).setup()
 
-        ovn_nbctl = self._get_ovn_controller(self.install_method)
-        lswitches = ovn_nbctl.show()
+        topology = self._get_nb_topology()
+        if not (self.config["use_cache"] and topology.is_current()):
+            ovn_nbctl = self._get_ovn_controller(self.install_method)
+            topology.load(ovn_nbctl.show())
+
+        lswitches = topology.get_lswitches(self.config["lswitch_prefix"])
 
         self.context["ovn-nb"] = lswitches
-        self.context["ovs-internal-ports"] = {}
+        self.context["ovs-internal-ports"] = records.PortRegistry()
 
     @logging.log_task_wrapper(LOG.info, _("Exit context: `ovn_nb`"))
     def cleanup(self):
@@ -0,0 +1,135 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import time
+
+import six
+
+from rally.common.i18n import _
+from rally.common import logging
+from rally import consts
+from rally import exceptions
+from rally.task import context
+from rally_ovs.plugins.ovs import ovnclients
+from rally_ovs.plugins.ovs import ovsdb
+from rally_ovs.plugins.ovs import utils
+
+LOG = logging.getLogger(__name__)
+
+CONTROLLER = "controller"
+
+
+@context.configure(name="ovn_warmup", order=111)
+class OvnWarmup(ovnclients.OvnClientMixin, context.Context):
+    """Open and probe the controller and farm connections up front.
+
+    Every host is reached in parallel before the first iteration, so that
+    SSH setup is not timed by the workload: the controller must answer an
+    NB database read, each farm an ovs-vsctl read in each of its
+    sandboxes. The task fails right away if a host does not.
+    """
+
+    CONFIG_SCHEMA = {
+        "type": "object",
+        "$schema": consts.JSON_SCHEMA,
+        "properties": {
+            "probe_timeout": {"type": "integer", "minimum": 1},
+            "probe_sandboxes": {"type": "boolean"},
+        },
+        "additionalProperties": False
+    }
+
+    DEFAULT_CONFIG = {
+        "probe_timeout": 30,
+        "probe_sandboxes": True,
+    }
+
+    def _connect(self, ssh):
+        start = time.time()
+        ssh.run("true", timeout=self.config["probe_timeout"])
+        return time.time() - start
+
+    def _probe_controller(self):
+        latency = {"connect": self._connect(self.controller_client("ssh"))}
+
+        start = time.time()
+        ovn_nbctl = self._get_ovn_controller(self.install_method)
+        if isinstance(ovn_nbctl, ovsdb.OvsdbClientMixin):
+            ovn_nbctl.get("NB_Global", ".", "nb_cfg",
+                          timeout=self.config["probe_timeout"])
+        else:
+            ovn_nbctl.run("get",
+                          opts=["--timeout=%d" % self.config["probe_timeout"]],
+                          args=["NB_Global", ".", "nb_cfg"],
+                          stdout=six.moves.StringIO())
+        latency["probe"] = time.time() - start
+        return latency
+
+    def _probe_farm(self, farm, sandboxes):
+        latency = {"connect": self._connect(self.farm_clients(farm, "ssh"))}
+
+        start = time.time()
+        ovs_vsctl = self.farm_clients(farm, "ovs-vsctl")
+        for sandbox in sandboxes:
+            ovs_vsctl.set_sandbox(sandbox["name"], self.install_method,
+                                  sandbox["host_container"])
+            ovs_vsctl.enable_batch_mode(False)
+            ovs_vsctl.run("get",
+                          opts=["--timeout=%d" % self.config["probe_timeout"]],
+                          args=["Open_vSwitch", ".", "_uuid"],
+                          stdout=six.moves.StringIO())
+        latency["probe"] = time.time() - start
+        return latency
+
+    def _probe(self, host):
+        try:
+            if host == CONTROLLER:
+                return self._probe_controller()
+            return self._probe_farm(host, self._farm_sandboxes[host])
+        except Exception as e:
+            LOG.error("Probe of %s failed: %s" % (host, e))
+            return e
+
+    @logging.log_task_wrapper(LOG.info, _("Enter context: `ovn_warmup`"))
+    def setup(self):
+        super(OvnWarmup, self).setup()
+
+        self._farm_sandboxes = collections.defaultdict(list)
+        for farm in self.context["ovn_multihost"]["farms"]:
+            self._farm_sandboxes[farm] = []
+        if self.config["probe_sandboxes"]:
+            for sandbox in self.context.get("sandboxes", []):
+                self._farm_sandboxes[sandbox["farm"]].append(sandbox)
+
+        hosts = [CONTROLLER] + sorted(self._farm_sandboxes)
+        results = utils.run_in_parallel(self._probe, hosts,
+                                        self.farm_concurrency)
+
+        failed = []
+        for host, (result, duration) in zip(hosts, results):
+            if isinstance(result, Exception):
+                failed.append("%s (%s)" % (host, result))
+                continue
+            LOG.info("Warmed up %s in %.3fs: connect %.3fs, probe %.3fs" % (
+                host, duration, result["connect"], result["probe"]))
+
+        if failed:
+            raise exceptions.ContextSetupFailure(
+                ctx_name=self.get_name(),
+                msg="unreachable hosts: %s" % ", ".join(failed))
+
+    @logging.log_task_wrapper(LOG.info, _("Exit context: `ovn_warmup`"))
+    def cleanup(self):
+        pass
@@ -33,22 +33,57 @@ class OvnNbctlDaemonContext(ovnclients.OvnClientMixin, context.Context):
             "privkey": {"type": "string"},
             "cert": {"type": "string"},
             "cacert": {"type": "string"},
+            "daemons": {"type": "integer", "minimum": 1},
+            "selection": {"enum": ["hash", "least-loaded"]},
+            "pin_to_members": {"type": "boolean"},
         },
         "additionalProperties": True
     }
 
     DEFAULT_CONFIG = {
         "daemon_mode": True,
+        "daemons": 1,
+        "selection": "hash",
+        "pin_to_members": False,
     }
 
+    def _get_daemon_configs(self):
+        daemons = self.config["daemons"]
+        if daemons == 1:
+            return [self.config]
+
+        members = [ip.strip() for ip in
+                   self.config.get("remote", "").split("-") if ip.strip()]
+        configs = []
+        for i in range(daemons):
+            config = dict(self.config, name="ovn-nbctl-%d" % i)
+            if self.config["pin_to_members"] and members:
+                config["remote"] = members[i % len(members)]
+                config["pinned"] = True
+            configs.append(config)
+        return configs
+
     @logging.log_task_wrapper(LOG.info, _("Enter context: `ovn-nbctld`"))
     def setup(self):
         super(OvnNbctlDaemonContext, self).setup()
 
-        if self.config["daemon_mode"]:
-            self.context["daemon_socket"] = self._start_daemon(self.config)
+        if not self.config["daemon_mode"]:
+            return
+
+        sockets = [self._start_daemon(config)
+                   for config in self._get_daemon_configs()]
+        if len(sockets) == 1:
+            self.context["daemon_socket"] = sockets[0]
+        else:
+            self.context["daemon_sockets"] = sockets
+            self.context["daemon_selection"] = self.config["selection"]
 
     @logging.log_task_wrapper(LOG.info, _("Exit context: `ovn-nbctld`"))
     def cleanup(self):
-        if self.config["daemon_mode"]:
+        if not self.config["daemon_mode"]:
+            return
+
+        for socket in self.context.get("daemon_sockets", []):
+            self._stop_daemon(socket)
+        if "daemon_socket" in self.context:
             self._stop_daemon()
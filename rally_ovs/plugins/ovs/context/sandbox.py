@@ -13,14 +13,12 @@
 # under the License.
 
 
-import six
 from rally.common.i18n import _
 from rally.common import logging
-from rally.common import db
 from rally import consts
 from rally.task import context
 
-from rally_ovs.plugins.ovs.consts import ResourceType
+from rally_ovs.plugins.ovs import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -53,26 +51,11 @@ class Sandbox(context.Context):
 
         LOG.debug("Setup ovn sandbox context")
         deploy_uuid = self.task["deployment_uuid"]
-        deployments = db.deployment_list(parent_uuid=deploy_uuid)
-
         farm = self.config.get("farm", "")
         tag = self.config.get("tag", "")
 
-        sandboxes = []
-        for dep in deployments:
-            res = db.resource_get_all(dep["uuid"], type=ResourceType.SANDBOXES)
-            if len(res) == 0 or len(res[0].info["sandboxes"]) == 0:
-                continue
-
-            info = res[0].info
-            if farm and farm != info["farm"]:
-                continue
-
-            for k,v in six.iteritems(info["sandboxes"]):
-                if tag == "all" or v == tag:
-                    sandbox = {"name": k, "tag": v, "farm": info["farm"],
-                               "host_container": info["host_container"]}
-                    sandboxes.append(sandbox)
+        inventory = utils.get_inventory(deploy_uuid)
+        sandboxes = inventory.sandboxes(farm, None if tag == "all" else tag)
 
         self.context["sandboxes"] = sandboxes
 
@@ -64,6 +64,9 @@ class OvnSandboxControllerEngine(SandboxEngine):
             "type": {"type": "string"},
             "install_method": {"type": "string"},
             "host_container": {"type": "string"},
+            "transport": {"enum": ["ssh", "local"]},
+            "agent": {"type": "boolean"},
+            "docker_exec_sessions": {"type": "boolean"},
             "deployment_name": {"type": "string"},
             "http_proxy": {"type": "string"},
             "https_proxy": {"type": "string"},
@@ -120,9 +123,11 @@ class OvnSandboxControllerEngine(SandboxEngine):
             print("Invalid install method for controller")
             exit(1)
 
+        credential = self._update_credential(ovs_server.get_credentials())
+
         self.deployment.add_resource(provider_name="OvnSandboxControllerEngine",
                                  type=ResourceType.CREDENTIAL,
-                                 info=ovs_server.get_credentials())
+                                 info=credential)
 
         self.deployment.add_resource(provider_name="OvnSandboxControllerEngine",
                             type=ResourceType.CONTROLLER,
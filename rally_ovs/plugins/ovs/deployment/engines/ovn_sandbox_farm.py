@@ -61,6 +61,9 @@ class OvnSandboxFarmEngine(SandboxEngine):
             "type": {"type": "string"},
             "deployment_name": {"type": "string"},
             "host_container": {"type": "string"},
+            "transport": {"enum": ["ssh", "local"]},
+            "agent": {"type": "boolean"},
+            "docker_exec_sessions": {"type": "boolean"},
             "http_proxy": {"type": "string"},
             "https_proxy": {"type": "string"},
             "ovs_repo": {"type": "string"},
@@ -98,6 +101,7 @@ class OvnSandboxFarmEngine(SandboxEngine):
         ovs_user = self.config.get("ovs_user", OVS_USER)
         credential = server.get_credentials()
         credential["user"] = ovs_user
+        self._update_credential(credential)
 
         self.deployment.add_resource(provider_name="OvnSandboxFarmEngine",
                                  type=ResourceType.CREDENTIAL,
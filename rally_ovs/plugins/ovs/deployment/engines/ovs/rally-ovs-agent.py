@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Command execution agent for farm and controller nodes.
+
+Started once per task over a single SSH channel. Reads one JSON request
+per line from stdin:
+
+    {"id": 1, "cmds": [{"cmd": "ovs-vsctl show",
+                        "env_file": "sandbox-1/sandbox.rc",
+                        "stdin": null, "timeout": 60}]}
+
+and writes one JSON reply per line to stdout:
+
+    {"id": 1, "results": [{"exit_status": 0, "stdout": "...",
+                           "stderr": "", "duration": 0.004}]}
+
+The environment set up by an "env_file" is captured once and reused by
+all the later commands using the same file. A command still running
+after its "timeout" seconds is killed, with its children, and its result
+gets "timed_out": true.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+env_cache = {}
+
+
+def get_env(env_file):
+    if not env_file:
+        return None
+
+    if env_file not in env_cache:
+        out = subprocess.check_output(
+            [
+                "/bin/bash", "-c",
+                '. "$0" > /dev/null && env -0', os.path.expanduser(env_file)
+            ])
+        env = {}
+        for entry in out.split(b"\0"):
+            if b"=" in entry:
+                k, v = entry.decode("utf8").split("=", 1)
+                env[k] = v
+        env_cache[env_file] = env
+
+    return env_cache[env_file]
+
+
+def kill(proc, timed_out):
+    timed_out.append(True)
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def run_cmd(request):
+    start = time.time()
+    stdin = request.get("stdin")
+    timeout = request.get("timeout")
+    timer = None
+    timed_out = []
+    try:
+        # In its own process group, to kill the whole command on timeout.
+        proc = subprocess.Popen(["/bin/bash", "-c", request["cmd"]],
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                env=get_env(request.get("env_file")),
+                                preexec_fn=os.setsid)
+        if timeout:
+            timer = threading.Timer(timeout, kill, [proc, timed_out])
+            timer.start()
+        out, err = proc.communicate(stdin.encode("utf8") if stdin else None)
+        exit_status = proc.returncode
+    except Exception as e:
+        out, err, exit_status = b"", str(e).encode("utf8"), 255
+    finally:
+        if timer:
+            timer.cancel()
+
+    return {
+        "exit_status": exit_status,
+        "stdout": out.decode("utf8", "replace"),
+        "stderr": err.decode("utf8", "replace"),
+        "duration": time.time() - start,
+        "timed_out": bool(timed_out),
+    }
+
+
+def main():
+    os.environ["PATH"] += ":/usr/local/sbin:/usr/sbin"
+    os.chdir(os.path.expanduser("~"))
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+
+        request = json.loads(line)
+        reply = {
+            "id": request.get("id"),
+            "results": [run_cmd(cmd) for cmd in request.get("cmds", [])],
+        }
+        sys.stdout.write(json.dumps(reply) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,8 @@ from rally_ovs.plugins.ovs.deployment.engines import OVS_REPO
 from rally_ovs.plugins.ovs.deployment.engines import OVS_BRANCH
 from rally_ovs.plugins.ovs.deployment.engines import OVN_REPO
 from rally_ovs.plugins.ovs.deployment.engines import OVN_BRANCH
+from rally_ovs.plugins.ovs.transport import AGENT_SCRIPT
+from rally_ovs.plugins.ovs.transport import put_file_cached
 
 
 
@@ -56,9 +58,7 @@ class SandboxEngine(engine.Engine):
 
     def _put_file(self, server, filename, mode=None):
         localpath = get_script_path(filename)
-        server.ssh.put_file(localpath, filename)
-        if mode:
-            server.ssh.run("chmod %s %s" % (mode, filename))
+        put_file_cached(server.ssh, localpath, filename, mode)
 
 
 
@@ -111,3 +111,21 @@ EOF''' % (http_proxy, https_proxy)
         if install_method == "sandbox":
             self._prepare(server, ovs_user)
             self._install_ovs(server)
+
+        if self.config.get("agent", False):
+            self._put_file(get_updated_server(server, user=ovs_user),
+                           AGENT_SCRIPT, "755")
+
+
+    '''
+        add the transport options from the engine config to the credential
+        stored for the node, so clients know how to reach it
+    '''
+    def _update_credential(self, credential):
+        if "transport" in self.config:
+            credential["transport"] = self.config["transport"]
+        if self.config.get("agent", False):
+            credential["agent"] = True
+        if self.config.get("docker_exec_sessions", False):
+            credential["docker_exec_sessions"] = True
+        return credential
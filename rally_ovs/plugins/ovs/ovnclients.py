@@ -12,49 +12,258 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import multiprocessing
+import os
+import threading
+
 import netaddr
 
 from rally.common import logging
 from rally.common.utils import RandomNameGeneratorMixin
+from rally.task import scenario
 
 from rally_ovs.plugins.ovs import ovsclients
+from rally_ovs.plugins.ovs import records
 from rally_ovs.plugins.ovs import utils
 
 
 LOG = logging.getLogger(__name__)
 
+_daemon_rings = {}
+_daemon_clients = collections.Counter()
+_daemon_lock = threading.Lock()
+
+
+def select_daemon_socket(sockets, key, selection="hash"):
+    """Pick the ovn-nbctl daemon a client sends its commands to.
+
+    "hash" maps `key' to a daemon by consistent hashing, "least-loaded"
+    picks the daemon currently held by the fewest clients of this process
+    (runner processes do not see each other's clients). Every socket
+    returned must be given back with release_daemon_socket().
+    """
+    with _daemon_lock:
+        if selection == "least-loaded":
+            socket = min(sockets, key=lambda s: _daemon_clients[s])
+        else:
+            ring = _daemon_rings.get(tuple(sockets))
+            if ring is None:
+                ring = _daemon_rings[tuple(sockets)] = utils.HashRing(sockets)
+            socket = ring.get(key)
+        _daemon_clients[socket] += 1
+    return socket
+
+
+def release_daemon_socket(socket):
+    with _daemon_lock:
+        if _daemon_clients[socket] > 0:
+            _daemon_clients[socket] -= 1
+
+
+class NbTopology(object):
+    """Logical switches and ports of the NB database, as seen by a task.
+
+    It is loaded once from ovn-nbctl show, then kept up to date by the
+    OvnClientMixin helpers creating and deleting switches and ports, so
+    that the ovn_nb context of later subtasks does not dump the database
+    again.
+
+    Scenarios may run in runner processes forked from the one that
+    loaded the topology, where changes only reach a copy. Those processes
+    also bump the shared _nb_topology_changes counter, which makes the
+    loaded topology stale.
+    """
+
+    def __init__(self, task_uuid):
+        self.task_uuid = task_uuid
+        self.loaded = False
+        self._pid = None
+        self._generation = None
+        self._lock = threading.Lock()
+        self._lswitches = collections.OrderedDict()
+        self._lport_lswitch = {}
+
+    def load(self, lswitches):
+        """Replace the topology with the output of show()."""
+        with self._lock:
+            self._lswitches.clear()
+            self._lport_lswitch.clear()
+            for lswitch in lswitches:
+                self._add_lswitch(lswitch)
+                for lport in lswitch["lports"]:
+                    self._add_lport(lswitch["name"], lport["name"])
+            self.loaded = True
+            self._pid = os.getpid()
+            self._generation = _nb_topology_changes.value
+
+    def is_current(self):
+        """Whether the topology is loaded and no other process changed it."""
+        return (self.loaded and
+                self._generation == _nb_topology_changes.value)
+
+    def _changed(self):
+        if self.loaded and self._pid != os.getpid():
+            with _nb_topology_changes.get_lock():
+                _nb_topology_changes.value += 1
+
+    def _add_lswitch(self, lswitch):
+        self._lswitches[lswitch["name"]] = records.LSwitch(
+            lswitch["name"], lswitch.get("uuid"), lswitch.get("cidr", ""),
+            collections.OrderedDict())
+
+    def _add_lport(self, lswitch_name, lport_name):
+        lswitch = self._lswitches.get(lswitch_name)
+        if lswitch is None:
+            return
+        lswitch.lports[lport_name] = True
+        self._lport_lswitch[lport_name] = lswitch_name
+
+    def add_lswitches(self, lswitches):
+        self._changed()
+        with self._lock:
+            for lswitch in lswitches:
+                self._add_lswitch(lswitch)
+
+    def add_lports(self, lswitch_name, lports):
+        self._changed()
+        with self._lock:
+            for lport in lports:
+                self._add_lport(lswitch_name, lport["name"])
+
+    def remove_lswitches(self, lswitches):
+        self._changed()
+        with self._lock:
+            for lswitch in lswitches:
+                removed = self._lswitches.pop(lswitch["name"], None)
+                for lport_name in removed.lports if removed else []:
+                    self._lport_lswitch.pop(lport_name, None)
+
+    def remove_lports(self, lports):
+        self._changed()
+        with self._lock:
+            for lport in lports:
+                lswitch_name = self._lport_lswitch.pop(lport["name"], None)
+                if lswitch_name in self._lswitches:
+                    self._lswitches[lswitch_name].lports.pop(lport["name"],
+                                                             None)
+
+    def get_lswitches(self, prefix=""):
+        """Return the switches whose name starts with prefix, like show()."""
+        with self._lock:
+            return [records.LSwitch(lswitch.name, lswitch.uuid, lswitch.cidr,
+                                    [records.LPort(name)
+                                     for name in lswitch.lports])
+                    for lswitch in self._lswitches.values()
+                    if lswitch.name.startswith(prefix)]
+
+
+_nb_topology = None
+_nb_topology_lock = threading.Lock()
+_nb_topology_changes = multiprocessing.Value("I", 0)
+
+
+def get_nb_topology(task_uuid):
+    """Return the NB topology of a task, a new one for a new task."""
+    global _nb_topology
+    with _nb_topology_lock:
+        if _nb_topology is None or _nb_topology.task_uuid != task_uuid:
+            _nb_topology = NbTopology(task_uuid)
+        return _nb_topology
+
 
 class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
+    def _get_ovsdb_client(self, config, default_type, install_method):
+        client = self.controller_client(config.get("type", default_type))
+        client.set_sandbox("controller-sandbox", install_method,
+                           self.context['controller']['host_container'])
+        client.set_log_cmd(self.context.get("log_cmd", False))
+        if "remote" in config:
+            client.set_remote(config["remote"], config.get("privkey"),
+                              config.get("cert"), config.get("cacert"))
+        if "pipeline" in config:
+            client.set_pipeline_depth(config["pipeline"])
+        if "write_behind" in config:
+            client.set_write_behind(config["write_behind"])
+        if "coalesce_create" in config:
+            client.set_coalesce_create(config["coalesce_create"])
+        return client
+
     def _get_ovn_controller(self, install_method="sandbox"):
-        ovn_nbctl = self.controller_client("ovn-nbctl")
-        ovn_nbctl.set_sandbox("controller-sandbox", install_method,
-                              self.context['controller']['host_container'])
-        ovn_nbctl.set_daemon_socket(self.context.get("daemon_socket", None))
-        ovn_nbctl.set_log_cmd(self.context.get("log_cmd", False))
+        ovn_nbctl = self._get_ovsdb_client(self.context.get("nb_client", {}),
+                                           "ovn-nbctl", install_method)
+        ovn_nbctl.set_daemon_socket(self._get_daemon_socket())
         return ovn_nbctl
 
+    def _get_daemon_socket(self):
+        sockets = self.context.get("daemon_sockets")
+        if not sockets:
+            return self.context.get("daemon_socket", None)
+
+        if getattr(self, "_daemon_socket", None) is None:
+            self._daemon_socket = select_daemon_socket(
+                sockets, self.context.get("iteration", 0),
+                self.context.get("daemon_selection", "hash"))
+        return self._daemon_socket
+
+    def cleanup_clients(self):
+        if getattr(self, "_daemon_socket", None) is not None:
+            release_daemon_socket(self._daemon_socket)
+            self._daemon_socket = None
+        super(OvnClientMixin, self).cleanup_clients()
+
+    def _get_nb_topology(self):
+        return get_nb_topology(self.task["uuid"])
+
+    def _get_ovn_sb_controller(self, install_method="sandbox"):
+        return self._get_ovsdb_client(self.context.get("sb_client", {}),
+                                      "ovn-sbctl", install_method)
+
     def _start_daemon(self, nbctld_config):
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         return ovn_nbctl.start_daemon(nbctld_config)
 
-    def _stop_daemon(self):
+    def _stop_daemon(self, socket=None):
         ovn_nbctl = self._get_ovn_controller(self.install_method)
+        if socket:
+            ovn_nbctl.set_daemon_socket(socket)
         ovn_nbctl.stop_daemon()
 
     def _restart_daemon(self, nbctld_config):
         self._stop_daemon()
         return self._start_daemon(nbctld_config)
 
+    def _report_batch_sizes(self, title, flusher):
+        """Add the flush sizes chosen by an "auto" batch to task output."""
+        if not flusher.auto:
+            return
+        if not isinstance(self, scenario.Scenario):
+            LOG.info("%s batch sizes: %s" % (title, flusher.sizes))
+            return
+
+        self.add_output(complete={
+            "title": "%s batch size" % title,
+            "description": "Objects committed by each flush with "
+                           "\"batch\": \"auto\"",
+            "chart_plugin": "Lines",
+            "axis_label": "Flush",
+            "label": "Batch size",
+            "data": [["batch", [[i + 1, size]
+                                for i, size in enumerate(flusher.sizes)]]]
+        })
+
     def _get_gw_ip(self, network_cidr, offset=1):
         # Use the last IP (- offset) in the CIDR as gateway IP.
         return netaddr.IPAddress(network_cidr.last - offset)
 
+    def _allocate_macs(self, count=1):
+        return utils.get_mac_allocator(self.task["uuid"]).allocate(count)
+
     def _create_lswitches(self, lswitch_create_args, num_switches=-1):
         self.RESOURCE_NAME_FORMAT = "lswitch_XXXXXX_XXXXXX"
 
         if (num_switches == -1):
             num_switches = lswitch_create_args.get("amount", 1)
-        batch = lswitch_create_args.get("batch", num_switches)
 
         start_cidr = lswitch_create_args.get("start_cidr", "")
         if start_cidr:
@@ -68,7 +277,8 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode()
 
-        flush_count = batch
+        flusher = utils.BatchFlusher(ovn_nbctl, lswitch_create_args,
+                                     num_switches)
         lswitches = []
         for i in range(num_switches):
             name = self.generate_random_name()
@@ -91,40 +301,34 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
             LOG.info("create %(name)s %(cidr)s" % \
                       {"name": name, "cidr": lswitch.get("cidr", "")})
             lswitches.append(lswitch)
+            flusher.step()
 
-            flush_count -= 1
-            if flush_count < 1:
-                ovn_nbctl.flush()
-                flush_count = batch
-
-        ovn_nbctl.flush() # ensure all commands be run
+        flusher.finish() # ensure all commands be run
         ovn_nbctl.enable_batch_mode(False)
+        self._report_batch_sizes("Logical switch", flusher)
+        self._get_nb_topology().add_lswitches(lswitches)
         return lswitches
 
     def _create_routers(self, router_create_args):
         self.RESOURCE_NAME_FORMAT = "lrouter_XXXXXX_XXXXXX"
 
         amount = router_create_args.get("amount", 1)
-        batch = router_create_args.get("batch", 1)
 
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode()
 
-        flush_count = batch
+        flusher = utils.BatchFlusher(ovn_nbctl, router_create_args, 1)
         lrouters = []
 
         for i in range(amount):
             name = self.generate_random_name()
             lrouter = ovn_nbctl.lrouter_add(name)
             lrouters.append(lrouter)
+            flusher.step()
 
-            flush_count -= 1
-            if flush_count < 1:
-                ovn_nbctl.flush()
-                flush_count = batch
-
-        ovn_nbctl.flush() # ensure all commands be run
+        flusher.finish() # ensure all commands be run
         ovn_nbctl.enable_batch_mode(False)
+        self._report_batch_sizes("Logical router", flusher)
 
         return lrouters
 
@@ -132,19 +336,15 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         LOG.info("Connect network %s to router %s" % (network["name"], router["name"]))
 
         ovn_nbctl = self._get_ovn_controller(self.install_method)
-        ovn_nbctl.enable_batch_mode(False)
+        ovn_nbctl.enable_batch_mode()
 
 
-        base_mac = [i[:2] for i in self.task["uuid"].split('-')]
-        base_mac[0] = str(hex(int(base_mac[0], 16) & 254))
-        base_mac[3:] = ['00']*3
-        mac = utils.get_random_mac(base_mac)
+        mac = self._allocate_macs()[0]
 
         gw = self._get_gw_ip(network["cidr"])
         lrouter_port_ip = '{}/{}'.format(gw, network["cidr"].prefixlen)
         lrouter_port = ovn_nbctl.lrouter_port_add(router["name"], network["name"], mac,
                                                   lrouter_port_ip)
-        ovn_nbctl.flush()
 
 
         switch_router_port = "rp-" + network["name"]
@@ -154,6 +354,8 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
                          ('type', 'router'),
                          ('address', 'router'))
         ovn_nbctl.flush()
+        ovn_nbctl.enable_batch_mode(False)
+        self._get_nb_topology().add_lports(network["name"], [lport])
 
     def _connect_networks_to_routers(self, lnetworks, lrouters, networks_per_router):
         for lrouter in lrouters:
@@ -168,9 +370,7 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode(value=batch)
 
-        base_mac = [i[:2] for i in self.task["uuid"].split('-')]
-        base_mac[0] = str(hex(int(base_mac[0], 16) & 254))
-        base_mac[3:] = ['00']*3
+        macs = self._allocate_macs(3)
 
         # Create a join switch to connect the GW router to the cluster router.
         join_switch_name = "join_" + str(gw_cidr)
@@ -181,8 +381,7 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         rp_gw = self._get_gw_ip(gw_cidr, 1)
         router_port_join_switch_ip = '{}/{}'.format(rp_gw, gw_cidr.prefixlen)
         ovn_nbctl.lrouter_port_add(router["name"], router_port_join_switch,
-                                   utils.get_random_mac(base_mac),
-                                   router_port_join_switch_ip)
+                                   macs[0], router_port_join_switch_ip)
 
         join_switch_router_port = "jrp-" + str(gw_cidr)
         ovn_nbctl.lswitch_port_add(join_switch_name, join_switch_router_port)
@@ -202,8 +401,7 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         gr_gw = self._get_gw_ip(gw_cidr, 2)
         grouter_port_join_switch_ip = '{}/{}'.format(gr_gw, gw_cidr.prefixlen)
         ovn_nbctl.lrouter_port_add(gw_router_name, grouter_port_join_switch,
-                                   utils.get_random_mac(base_mac),
-                                   grouter_port_join_switch_ip)
+                                   macs[1], grouter_port_join_switch_ip)
 
         join_switch_gw_router_port = "jrpg-" + str(gw_cidr)
         ovn_nbctl.lswitch_port_add(join_switch_name, join_switch_gw_router_port)
@@ -223,8 +421,7 @@ class OvnClientMixin(ovsclients.ClientsMixin, RandomNameGeneratorMixin):
         gr_def_gw = self._get_gw_ip(ext_cidr, 2)
         grouter_port_ext_switch_ip = '{}/{}'.format(gw, ext_cidr.prefixlen)
         ovn_nbctl.lrouter_port_add(gw_router_name, grouter_port_ext_switch,
-                                   utils.get_random_mac(base_mac),
-                                   grouter_port_ext_switch_ip)
+                                   macs[2], grouter_port_ext_switch_ip)
     
         ext_switch_gw_router_port = "erpg-" + str(ext_cidr)
         ovn_nbctl.lswitch_port_add(ext_switch_name, ext_switch_gw_router_port)
@@ -14,18 +14,28 @@
 
 import abc
 import collections
+import itertools
+import json
+import pipes
 import six
+import threading
 import re
 import netaddr
 import logging
 
 from rally.common.plugin import plugin
+from rally import exceptions
 from rally.task import scenario
+from rally_ovs.plugins.ovs import records
+from rally_ovs.plugins.ovs import transport
+from rally_ovs.plugins.ovs import utils
 from utils import py_to_val
 from io import StringIO
 
 _NAMESPACE = "ovs"
 
+DEFAULT_FARM_CONCURRENCY = 16
+
 LOG = logging.getLogger(__name__)
 
 def configure(name):
@@ -39,6 +49,230 @@ class OvsClientLogger(object):
         if self.log_cmd:
             LOG.info(cmds)
 
+# Batches up to this size are flushed as is, without probing the host.
+SAFE_CMD_SIZE = 32768
+
+
+class BatchSplitMixin(object):
+    """Split batched commands that would not fit in one command line."""
+
+    def _split_batch(self, cmds, sep=" "):
+        size = sum(len(cmd.encode("utf8")) + len(sep) for cmd in cmds)
+        if size <= SAFE_CMD_SIZE:
+            return [cmds]
+
+        chunks = utils.split_cmds(cmds, utils.get_cmd_size_limit(self.ssh),
+                                  sep)
+        if len(chunks) > 1:
+            LOG.info("Splitting a %d bytes batch in %d commands" %
+                     (size, len(chunks)))
+        return chunks
+
+
+# Commands creating a named row, and the table they insert into.
+COALESCE_CREATE_CMDS = {
+    "ls-add": "Logical_Switch",
+    "lr-add": "Logical_Router",
+    "lsp-add": "Logical_Switch_Port",
+}
+
+# Port commands that only write one column of the port.
+COALESCE_LSP_COLUMNS = {
+    "lsp-set-addresses": "addresses",
+    "lsp-set-port-security": "port_security",
+    "lsp-set-type": "type",
+    "lsp-set-options": "options",
+}
+
+
+class _BatchedCmd(object):
+    def __init__(self, cmds, cmd, opts, args):
+        self.cmds = cmds
+        self.index = len(cmds)
+        self.cmd = cmd
+        self.opts = list(opts)
+        self.args = list(args)
+        self.columns = []
+        # Unique within the batch, even once it is split.
+        self.row_id = "row%d" % self.index
+
+    def render(self):
+        if not self.columns:
+            return " ".join(itertools.chain([" -- "], self.opts, [self.cmd],
+                                            self.args))
+
+        table = COALESCE_CREATE_CMDS[self.cmd]
+        name = pipes.quote('name="%s"' % self.args[-1])
+        create = ["create", table, name] + self.columns
+        if self.cmd != "lsp-add":
+            return " ".join([" -- "] + create)
+
+        return " ".join([" -- ", "--id=@" + self.row_id] + create +
+                        ["--", "add", "Logical_Switch", self.args[0],
+                         "ports", "@" + self.row_id])
+
+
+def _lsp_column_args(cmd, args):
+    column = COALESCE_LSP_COLUMNS[cmd]
+    if column == "options":
+        return ["options:" + arg for arg in args]
+    if column == "type":
+        return ["type=%s" % py_to_val(args[0])]
+
+    values = ['"%s"' % arg.replace("\\ ", " ") for arg in args]
+    return [pipes.quote("%s=%s" % (column, ",".join(values) or "[]"))]
+
+
+class CoalesceMixin(object):
+    """Merge successive batched commands writing to the same row.
+
+    Consecutive `set' commands on one record become a single `set'.
+    After set_coalesce_create(), the `set' and lsp-set-* commands
+    following ls-add, lr-add or lsp-add on the new row are also folded in
+    a `create' of the row with all its columns, which saves ovn-nbctl a
+    lookup by name per command. Unlike the *-add commands, `create' does
+    not refuse duplicate names, hence it is off by default.
+    """
+
+    coalesce_create = False
+    _last_batched = None
+
+    def set_coalesce_create(self, value=True):
+        self.coalesce_create = value
+
+    def _batch(self, cmd, opts, args):
+        if self._coalesce(cmd, opts, args):
+            return
+
+        entry = _BatchedCmd(self.cmds, cmd, opts, args)
+        self.cmds.append(entry.render())
+        self._last_batched = entry
+
+    def _coalesce(self, cmd, opts, args):
+        last = self._last_batched
+        if (last is None or last.cmds is not self.cmds or
+                last.index != len(self.cmds) - 1 or opts or last.opts):
+            return False
+
+        if cmd == "set" and len(args) > 2:
+            if last.cmd == "set" and last.args[:2] == args[:2]:
+                last.args += args[2:]
+            elif (self.coalesce_create and
+                  self._creates(last, args[0], args[1])):
+                last.columns += args[2:]
+            else:
+                return False
+        elif cmd in COALESCE_LSP_COLUMNS and args and self.coalesce_create:
+            if not self._creates(last, "Logical_Switch_Port", args[0]):
+                return False
+            last.columns += _lsp_column_args(cmd, args[1:])
+        else:
+            return False
+
+        self.cmds[-1] = last.render()
+        return True
+
+    @staticmethod
+    def _creates(entry, table, name):
+        nargs = 2 if entry.cmd == "lsp-add" else 1
+        return (COALESCE_CREATE_CMDS.get(entry.cmd) == table and
+                len(entry.args) == nargs and entry.args[-1] == name)
+
+
+# Seconds an idle write-behind worker waits before exiting.
+WRITE_BEHIND_IDLE_TIMEOUT = 5
+
+
+class WriteBehindError(exceptions.RallyException):
+    msg_fmt = "Write-behind flush failed: %(error)s"
+
+    def __init__(self, error, batch):
+        super(WriteBehindError, self).__init__(error=error)
+        self.batch = batch
+
+
+class WriteBehindWorker(object):
+    """Run batches from a background thread.
+
+    submit() blocks while `depth' batches are queued. Once a batch fails
+    the following ones are dropped, they may depend on it, and barrier()
+    raises a WriteBehindError carrying the failed batch.
+    """
+
+    def __init__(self, func, depth):
+        self.func = func
+        self.queue = six.moves.queue.Queue(maxsize=depth)
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                batch = self.queue.get(timeout=WRITE_BEHIND_IDLE_TIMEOUT)
+            except six.moves.queue.Empty:
+                with self._lock:
+                    if self.queue.empty():
+                        self._thread = None
+                        return
+                continue
+
+            try:
+                if self.error is None:
+                    self.func(batch)
+            except Exception as e:
+                LOG.error("Write-behind flush failed: %s" % e)
+                self.error = WriteBehindError(error=e, batch=batch)
+            finally:
+                self.queue.task_done()
+
+    def submit(self, batch):
+        self.queue.put(batch)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+    def barrier(self):
+        self.queue.join()
+        error, self.error = self.error, None
+        if error:
+            raise error
+
+
+class WriteBehindMixin(object):
+    """Optionally hand flushed batches to a WriteBehindWorker.
+
+    The client flushes each batch with _flush(batch), and must call
+    barrier() before any command that has to see the previous ones.
+    """
+
+    write_behind = None
+    write_behind_depth = 0
+
+    def set_write_behind(self, depth=0):
+        # Called for every helper getting the client, only a new depth
+        # waits for the batches in flight.
+        if depth == self.write_behind_depth:
+            return
+        self.barrier()
+        self.write_behind_depth = depth
+        self.write_behind = WriteBehindWorker(self._flush, depth) \
+            if depth else None
+
+    def _flush_batch(self, batch):
+        if self.write_behind:
+            self.write_behind.submit(batch)
+        else:
+            self._flush(batch)
+
+    def barrier(self):
+        """Wait for the batches in flight, raise if one of them failed."""
+        if self.write_behind:
+            self.write_behind.barrier()
+
+
 class OvsClient(plugin.Plugin):
     def __init__(self, credential, cache_obj):
         self.credential = credential
@@ -58,16 +292,62 @@ class OvsClient(plugin.Plugin):
         key = "{0}{1}{2}".format(self.get_name(),
                                  str(args) if args else "",
                                  str(kwargs) if kwargs else "")
-        if key not in self.cache:
-            self.cache[key] = self.create_client(*args, **kwargs)
-        return self.cache[key]
-
+        return self.cache.get(key,
+                              lambda: self.create_client(*args, **kwargs))
+
+
+# Client instances kept by each Clients object.
+CLIENT_CACHE_SIZE = 64
+
+
+class ClientCache(object):
+    """Client instances, private to the thread that created them.
+
+    Clients keep batching state (pending commands, batch mode, daemon
+    socket), so each thread gets its own instances while the transports
+    underneath stay pooled. Past `size' instances those of finished
+    threads are evicted. Instances of live threads are never evicted,
+    they may hold pending commands.
+    """
+
+    def __init__(self, size=CLIENT_CACHE_SIZE):
+        self.size = size
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, key, create):
+        thread = threading.current_thread()
+        key = (thread.ident, key)
+        with self._lock:
+            entry = self._clients.pop(key, None)
+            # Thread idents are reused once a thread is gone.
+            if entry and entry[0] is thread:
+                self._clients[key] = entry
+                return entry[1]
+
+        client = create()
+        with self._lock:
+            self._clients[key] = (thread, client)
+            self._evict()
+        return client
+
+    def _evict(self):
+        if len(self._clients) <= self.size:
+            return
+        for key, (thread, _) in list(self._clients.items()):
+            if not thread.is_alive():
+                LOG.debug("Evicting client %s of thread %s" % (key[1],
+                                                               key[0]))
+                del self._clients[key]
 
 
 class Clients(object):
     def __init__(self, credential):
         self.credential = credential
-        self.cache = {}
+        self.cache = ClientCache()
 
     def __getattr__(self, client_name):
         return OvsClient.get(client_name)(self.credential, self.cache)
@@ -76,7 +356,7 @@ class Clients(object):
 
     def clear(self):
         """Remove all cached client handles."""
-        self.cache = {}
+        self.cache = ClientCache()
 
 
 class ClientsMixin(object):
@@ -105,6 +385,10 @@ class ClientsMixin(object):
             self._farm_clients[k] = Clients(cred)
 
         self.install_method = multihost_info["install_method"]
+        self.farm_concurrency = multihost_info.get("farm_concurrency",
+                                                   DEFAULT_FARM_CONCURRENCY)
+
+        transport.get_pool().configure(**multihost_info.get("ssh_pool", {}))
 
     def __del__(self):
         self.cleanup_clients()
@@ -125,51 +409,70 @@ class ClientsMixin(object):
             clients.clear()
 
 
-'''
-    lswitch 48732e5d-b018-4bad-a1b6-8dbc762f4126 (lswitch_c52f4c_xFG42O)
-        lport lport_c52f4c_LXzXCE
-        lport lport_c52f4c_dkZSDg
-    lswitch 7f55c582-c007-4fba-810d-a14ead480851 (lswitch_c52f4c_Rv0Jcj)
-        lport lport_c52f4c_cm8SIf
-        lport lport_c52f4c_8h7hn2
-    lswitch 9fea76cf-d73e-4dc8-a2a3-1e98b9d8eab0 (lswitch_c52f4c_T0m6Ce)
-        lport lport_c52f4c_X3px3u
-        lport lport_c52f4c_92dhqb
 
-'''
+def from_datum(datum):
+    """Convert an OVSDB datum to a python value.
 
-def get_lswitch_info(info):
-    '''
-    @param info output of 'ovn-nbctl show'
-    '''
+    Datums are decoded the same way whether they come from the JSON-RPC
+    protocol or from the "--format=json --data=json" output of a ctl
+    command: uuids become strings, sets lists and maps dicts.
+    """
+    if isinstance(datum, list):
+        kind, value = datum
+        if kind in ("uuid", "named-uuid"):
+            return value
+        if kind == "set":
+            return [from_datum(v) for v in value]
+        if kind == "map":
+            return {from_datum(k): from_datum(v) for k, v in value}
+    return datum
 
-    lswitches = []
 
-    lswitch = None
-    for line in info.splitlines():
-        tokens = line.strip().split(" ")
-        if tokens[0] == "switch":
-            if tokens[2].startswith('(lswitch_'):
-                start_cidr = re.sub("\(lswitch_|\)", "", tokens[2])
-                if len(start_cidr):
-                    cidr = netaddr.IPNetwork(start_cidr)
-                else:
-                    cidr = ""
-                name = tokens[2][1:-1]
-                lswitch = {"name":name, "uuid":tokens[1], "lports":[], "cidr":cidr}
-                lswitches.append(lswitch)
-            else:
-                lswitch = None
-        elif tokens[0] == "port" and lswitch:
-            name = tokens[1][1:-1]
-            lswitch["lports"].append({"name":name})
+def set_value(value):
+    """Return a decoded set column as a list.
 
-    return lswitches
+    OVSDB encodes a set with exactly one element as the bare atom.
+    """
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def parse_json_table(output):
+    """Decode the output of a "--format=json --data=json" list or find.
+
+    Returns one dict per row, keyed by column name.
+    """
+    if not output.strip():
+        return []
+    table = json.loads(output)
+    headings = table["headings"]
+    return [dict(zip(headings, [from_datum(cell) for cell in row]))
+            for row in table["data"]]
+
+
+def get_lswitch_info(switches, ports):
+    '''
+    @param switches Logical_Switch rows with _uuid, name and ports
+    @param ports Logical_Switch_Port rows with _uuid and name
+    '''
+
+    port_names = dict((port["_uuid"], port["name"]) for port in ports)
 
-def parse_lswitch_list(lswitch_data):
     lswitches = []
-    for line in lswitch_data.splitlines():
-        lswitches.append({"name": line.split(" ")[1].strip('()')})
+    for row in switches:
+        name = row["name"]
+        if not name.startswith("lswitch_"):
+            continue
+        start_cidr = name[len("lswitch_"):]
+        if len(start_cidr):
+            cidr = netaddr.IPNetwork(start_cidr)
+        else:
+            cidr = ""
+        lports = [records.LPort(port_names[uuid])
+                  for uuid in set_value(row["ports"]) if uuid in port_names]
+        lswitches.append(records.LSwitch(name, row["_uuid"], cidr, lports))
+
     return lswitches
 
 def set_colval_args(*col_values):
@@ -206,10 +509,40 @@ class DdCtlMixin(object):
         self.run("get", args=args, stdout=stdout)
         return stdout.getvalue()
 
-    def list(self, table, records):
-        args = [table]
-        args += records
-        self.run("list", args=args)
+    def _query(self, cmd, table, args, columns=None):
+        # Queries need their result right away, pending batched commands
+        # are sent first.
+        opts = ["--format=json", "--data=json"]
+        if columns:
+            opts.append("--columns=%s" % ",".join(columns))
+
+        batch_mode = self.batch_mode
+        if batch_mode:
+            self.flush()
+            self.batch_mode = False
+        stdout = StringIO()
+        try:
+            self.run(cmd, opts=opts, args=[table] + list(args),
+                     stdout=stdout)
+        finally:
+            self.batch_mode = batch_mode
+        return parse_json_table(stdout.getvalue())
+
+    def list(self, table, records, columns=None):
+        return self._query("list", table, records or [], columns)
+
+    def find(self, table, *conditions, **kwargs):
+        return self._query("find", table, set_colval_args(*conditions),
+                           kwargs.get("columns"))
+
+    def get_many(self, table, records, *columns):
+        """Read columns of several records in one command.
+
+        Returns a dict per record, in the order of records.
+        """
+        if not records:
+            return []
+        return self.list(table, records, columns=list(columns) or None)
 
     def wait_until(self, table, record, *col_values):
         args = [table, record]
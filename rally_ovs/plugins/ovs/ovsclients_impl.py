@@ -16,8 +16,12 @@ import sys
 import itertools
 import logging
 import pipes
+import time
 from io import StringIO
 from rally_ovs.plugins.ovs.ovsclients import *
+from rally_ovs.plugins.ovs import ovsdb
+from rally_ovs.plugins.ovs import records
+from rally_ovs.plugins.ovs import transport
 from rally_ovs.plugins.ovs.utils import get_ssh_from_credential
 from rally_ovs.plugins.ovs.utils import is_root_credential
 
@@ -36,7 +40,8 @@ class SshClient(OvsClient):
 class OvnNbctl(OvsClient):
 
 
-    class _OvnNbctl(DdCtlMixin, OvsClientLogger):
+    class _OvnNbctl(DdCtlMixin, BatchSplitMixin, CoalesceMixin,
+                    WriteBehindMixin, OvsClientLogger):
         def __init__(self, credential):
             self.ssh = get_ssh_from_credential(credential)
             self.is_root = is_root_credential(credential)
@@ -64,10 +69,10 @@ class OvnNbctl(OvsClient):
             self.cmds = self.cmds or []
 
             if self.batch_mode:
-                cmd = itertools.chain([" -- "], opts, [cmd], args)
-                self.cmds.append(" ".join(cmd))
+                self._batch(cmd, opts, args)
                 return
 
+            self.barrier()
             if self.sandbox:
                 sudo_s = "sudo " if not self.is_root else ""
                 cmd_prefix = []
@@ -106,14 +111,19 @@ class OvnNbctl(OvsClient):
             if self.cmds == None or len(self.cmds) == 0:
                 return
 
+            for cmds in self._split_batch(self.cmds):
+                self._flush_batch(cmds)
+            self.cmds = None
+
+        def _flush(self, cmds):
             run_cmds = []
             if self.sandbox:
                 sudo_s = "sudo " if not self.is_root else ""
                 if self.install_method == "sandbox":
                     run_cmds.append(". %s/sandbox.rc" % self.sandbox)
-                    run_cmds.append("ovn-nbctl" + " ".join(self.cmds))
+                    run_cmds.append("ovn-nbctl" + " ".join(cmds))
                 elif self.install_method == "docker":
-                    run_cmds.append(sudo_s + "docker exec ovn-north-database ovn-nbctl " + " ".join(self.cmds))
+                    run_cmds.append(sudo_s + "docker exec ovn-north-database ovn-nbctl " + " ".join(cmds))
                 elif self.install_method == "physical":
                     if self.host_container:
                         cmd_prefix = sudo_s + "docker exec " + self.host_container
@@ -126,13 +136,11 @@ class OvnNbctl(OvsClient):
                         ovn_cmd = "ovn-nbctl"
 
                     run_cmds.append("{} {} {}".format(cmd_prefix, ovn_cmd,
-                                                      " ".join(self.cmds)))
+                                                      " ".join(cmds)))
             self.log_cmds(" ".join(run_cmds))
             self.ssh.run("\n".join(run_cmds),
                          stdout=sys.stdout, stderr=sys.stderr)
 
-            self.cmds = None
-
 
         def db_set(self, table, record, *col_values):
             args = [table, record]
@@ -174,7 +182,7 @@ class OvnNbctl(OvsClient):
                 params = ['Logical_Switch', name, param_cfg]
                 self.run("set", args=params)
 
-            return {"name":name}
+            return records.LSwitch(name)
 
         def lswitch_del(self, name):
             params = [name]
@@ -182,16 +190,15 @@ class OvnNbctl(OvsClient):
 
 
         def lswitch_list(self):
-            stdout = StringIO()
-            self.run("ls-list", stdout=stdout)
-            output = stdout.getvalue()
-            return parse_lswitch_list(output)
+            return self._list_names("Logical_Switch")
 
         def lrouter_list(self):
-            stdout = StringIO()
-            self.run("lr-list", stdout=stdout)
-            output = stdout.getvalue()
-            return parse_lswitch_list(output)
+            return self._list_names("Logical_Router")
+
+        def _list_names(self, table):
+            rows = self.list(table, [], columns=["_uuid", "name"])
+            return [{"uuid": row["_uuid"], "name": row["name"]}
+                    for row in rows]
 
         def lrouter_del(self, name):
             params = [name]
@@ -201,7 +208,7 @@ class OvnNbctl(OvsClient):
             params =[lswitch, name]
             self.run("lsp-add", args=params)
 
-            return {"name":name, "mac":mac, "ip":ip, "gw":gw, "ext-gw":ext_gw}
+            return records.LPort(name, mac, ip, gw, ext_gw)
 
 
         def lport_list(self, lswitch):
@@ -283,12 +290,13 @@ class OvnNbctl(OvsClient):
             self.run("pg-del", [], params)
 
         def show(self, lswitch=None):
-            params = [lswitch] if lswitch else []
-            stdout = StringIO()
-            self.run("show", args=params, stdout=stdout)
-            output = stdout.getvalue()
+            records = [lswitch] if lswitch else []
+            switches = self.list("Logical_Switch", records,
+                                 columns=["_uuid", "name", "ports"])
+            ports = self.list("Logical_Switch_Port", [],
+                              columns=["_uuid", "name"])
 
-            return get_lswitch_info(output)
+            return get_lswitch_info(switches, ports)
 
         def sync(self, wait='hv'):
             # sync command should always be flushed
@@ -303,14 +311,20 @@ class OvnNbctl(OvsClient):
 
         def start_daemon(self, nbctld_config):
             stdout = StringIO()
-            opts = ["--detach",  "--pidfile", "--log-file"]
+            name = nbctld_config.get("name")
+            if name:
+                opts = ["--detach", "--pidfile=%s.pid" % name,
+                        "--log-file=%s.log" % name]
+            else:
+                opts = ["--detach",  "--pidfile", "--log-file"]
 
             if "remote" in nbctld_config:
                 ovn_remote = nbctld_config["remote"]
                 prot = nbctld_config["prot"]
                 central_ips = [ip.strip() for ip in ovn_remote.split('-')]
-                # If there is only one ip, then we can use unixctl socket.
-                if len(central_ips) > 1:
+                # If there is only one ip, then we can use unixctl socket,
+                # unless the daemon is pinned to that RAFT member.
+                if len(central_ips) > 1 or nbctld_config.get("pinned"):
                     remote = ",".join(["{}:{}:6641".format(prot, r)
                                       for r in central_ips])
                     opts.append("--db=" + remote)
@@ -336,7 +350,8 @@ class OvnNbctl(OvsClient):
 @configure("ovn-sbctl")
 class OvnSbctl(OvsClient):
 
-    class _OvnSbctl(DdCtlMixin, OvsClientLogger):
+    class _OvnSbctl(DdCtlMixin, BatchSplitMixin, WriteBehindMixin,
+                    OvsClientLogger):
         def __init__(self, credential):
             self.ssh = get_ssh_from_credential(credential)
             self.is_root = is_root_credential(credential)
@@ -364,6 +379,7 @@ class OvnSbctl(OvsClient):
                 self.cmds.append(" ".join(cmd))
                 return
 
+            self.barrier()
             if self.sandbox:
                 sudo_s = "sudo " if not self.is_root else ""
                 cmd_prefix = []
@@ -391,26 +407,29 @@ class OvnSbctl(OvsClient):
             if self.cmds == None or len(self.cmds) == 0:
                 return
 
+            for cmds in self._split_batch(self.cmds):
+                self._flush_batch(cmds)
+            self.cmds = None
+
+        def _flush(self, cmds):
             run_cmds = []
             if self.sandbox:
                 sudo_s = "sudo " if not self.is_root else ""
                 if self.install_method == "sandbox":
                     run_cmds.append(". %s/sandbox.rc" % self.sandbox)
-                    run_cmds.append(self.sbctl_cmd + " ".join(self.cmds))
+                    run_cmds.append(self.sbctl_cmd + " ".join(cmds))
                 elif self.install_method == "docker":
-                    run_cmds.append(sudo_s + "docker exec ovn-north-database " + self.sbctl_cmd + " ".join(self.cmds))
+                    run_cmds.append(sudo_s + "docker exec ovn-north-database " + self.sbctl_cmd + " ".join(cmds))
                 elif self.install_method == "physical":
                     if self.host_container:
-                        run_cmds.append(sudo_s + "docker exec " + self.host_container + " " + self.sbctl_cmd  + " ".join(self.cmds))
+                        run_cmds.append(sudo_s + "docker exec " + self.host_container + " " + self.sbctl_cmd  + " ".join(cmds))
                     else:
-                        run_cmds.append(sudo_s + self.sbctl_cmd + " ".join(self.cmds))
+                        run_cmds.append(sudo_s + self.sbctl_cmd + " ".join(cmds))
 
             self.log_cmds(" ".join(run_cmds))
             self.ssh.run("\n".join(run_cmds),
                          stdout=sys.stdout, stderr=sys.stderr)
 
-            self.cmds = None
-
 
         def db_set(self, table, record, *col_values):
             args = [table, record]
@@ -418,20 +437,16 @@ class OvnSbctl(OvsClient):
             self.run("set", args=args)
 
         def count_igmp_flows(self, lswitch, network_prefix='239'):
-            stdout = StringIO()
-            self.ssh.run(
-                self.sbctl_cmd + " list datapath_binding | grep {sw} -B 1 | "
-                "grep uuid | cut -f 2 -d ':'".format(sw=lswitch),
-                stdout=stdout)
-            uuid = stdout.getvalue().rstrip()
-            stdout = StringIO()
-            self.ssh.run(
-                self.sbctl_cmd + " list logical_flow | grep 'dst == {nw}' -B 1 | "
-                "grep {uuid} -B 1 | wc -l".format(
-                uuid=uuid, nw=network_prefix),
-                stdout=stdout
-            )
-            return int(stdout.getvalue())
+            datapaths = self.find("Datapath_Binding",
+                                  ("external_ids", {"name": lswitch}),
+                                  columns=["_uuid"])
+            if not datapaths:
+                return 0
+            flows = self.find("Logical_Flow",
+                              ("logical_datapath", datapaths[0]["_uuid"]),
+                              columns=["match"])
+            match = "dst == %s" % network_prefix
+            return len([f for f in flows if match in f["match"]])
 
         def sync(self, wait='hv'):
             # sync command should always be flushed
@@ -445,16 +460,9 @@ class OvnSbctl(OvsClient):
             self.batch_mode = batch_mode
 
         def chassis_bound(self, chassis_name):
-            batch_mode = self.batch_mode
-            if batch_mode:
-                self.flush()
-                self.batch_mode = False
-            stdout = StringIO()
-            self.run("find chassis", ["--bare", "--columns _uuid"],
-                     ["name={}".format(chassis_name)],
-                     stdout=stdout)
-            self.batch_mode = batch_mode
-            return len(stdout.getvalue().splitlines()) == 1
+            rows = self.find("Chassis", ("name", chassis_name),
+                             columns=["_uuid"])
+            return len(rows) == 1
 
     def create_client(self):
         print("*********   call OvnSbctl.create_client")
@@ -463,10 +471,225 @@ class OvnSbctl(OvsClient):
 
         return client
 
+@configure("ovn-nb-idl")
+class OvnNbIdl(OvsClient):
+
+    class _OvnNbIdl(ovsdb.OvsdbClientMixin, OvsClientLogger):
+        db_name = "OVN_Northbound"
+
+        def set_daemon_socket(self, socket=None):
+            pass
+
+        def lrouter_port_add(self, lrouter, name, mac=None, ip_addr=None):
+            self._insert("Logical_Router_Port",
+                         {"name": name, "mac": mac, "networks": ip_addr},
+                         name, ("Logical_Router", lrouter, "ports"))
+            return {"name":name}
+
+        def lrouter_add(self, name):
+            self._insert("Logical_Router", {"name": name}, name)
+            return {"name":name}
+
+        def lrouter_route_add(self, lrouter, dest, gw, policy=None):
+            self._insert("Logical_Router_Static_Route",
+                         {"ip_prefix": dest, "nexthop": gw, "policy": policy},
+                         parent=("Logical_Router", lrouter, "static_routes"))
+
+        def lrouter_nat_add(self, lrouter, nat_type, external_ip, logical_ip):
+            self._insert("NAT", {"type": nat_type, "external_ip": external_ip,
+                                 "logical_ip": logical_ip},
+                         parent=("Logical_Router", lrouter, "nat"))
+
+        def lswitch_add(self, name, other_cfg={}):
+            self._insert("Logical_Switch",
+                         {"name": name, "other_config": other_cfg or None},
+                         name)
+            return records.LSwitch(name)
+
+        def lswitch_del(self, name):
+            self.destroy("Logical_Switch", name)
+
+        def lswitch_list(self):
+            return self._list_names("Logical_Switch")
+
+        def lrouter_list(self):
+            return self._list_names("Logical_Router")
+
+        def lrouter_del(self, name):
+            self.destroy("Logical_Router", name)
+
+        def _list_names(self, table):
+            rows = self._select(table, [], ["_uuid", "name"])
+            return [{"uuid": row["_uuid"], "name": row["name"]}
+                    for row in rows]
+
+        def _get_children(self, parent_table, record, column, child_table):
+            rows = self._select(parent_table,
+                                self._where(parent_table, record), [column])
+            if not rows:
+                raise ovsdb.OvsdbError("%s %s not found" % (parent_table,
+                                                            record))
+            ops = [{"op": "select", "table": child_table,
+                    "where": [["_uuid", "==", ["uuid", uuid]]]}
+                   for uuid in set_value(rows[0][column])]
+            if not ops:
+                return []
+            return [dict((k, from_datum(v)) for k, v in row.items())
+                    for result in self._read(ops) for row in result["rows"]]
+
+        def lswitch_port_add(self, lswitch, name, mac='', ip='', gw='', ext_gw=None):
+            self._insert("Logical_Switch_Port", {"name": name}, name,
+                         ("Logical_Switch", lswitch, "ports"))
+            return records.LPort(name, mac, ip, gw, ext_gw)
+
+        def lport_list(self, lswitch):
+            return self._get_children("Logical_Switch", lswitch, "ports",
+                                      "Logical_Switch_Port")
+
+        def lport_del(self, name):
+            uuid = self._row_uuid("Logical_Switch_Port", name)
+            # Ports are not root rows, unlinking them deletes them.
+            self._transact([self._mutate_op(
+                "Logical_Switch", [["ports", "includes", uuid]],
+                "ports", "delete", [uuid])])
+
+        '''
+        param address: [mac], [mac,ip], [mac,ip1,ip2] ...
+        '''
+        def lport_set_addresses(self, name, *addresses):
+            addresses = [" ".join(filter(lambda x: x, i)) for i in addresses]
+            self._transact([self._update_op(
+                "Logical_Switch_Port", name,
+                {"addresses": [i for i in addresses if i]})])
+
+        def lport_set_port_security(self, name, *addresses):
+            self._transact([self._update_op(
+                "Logical_Switch_Port", name,
+                {"port_security": list(addresses)})])
+
+        def lport_set_type(self, name, type):
+            self._transact([self._update_op("Logical_Switch_Port", name,
+                                            {"type": type})])
+
+        def lport_set_options(self, name, *options):
+            self._transact([self._update_op("Logical_Switch_Port", name,
+                                            {"options": list(options)})])
+
+        def _acl_parent(self, entity):
+            return "Logical_Switch" if entity == "switch" else "Port_Group"
+
+        def acl_add(self, lswitch, direction, priority, match, action,
+                    log=False, entity="switch"):
+            self._insert("ACL", {"direction": direction,
+                                 "priority": int(priority), "match": match,
+                                 "action": action, "log": log},
+                         parent=(self._acl_parent(entity), lswitch, "acls"))
+
+        def acl_list(self, lswitch, entity="switch"):
+            return self._get_children(self._acl_parent(entity), lswitch,
+                                      "acls", "ACL")
+
+        def acl_del(self, lswitch, direction=None,
+                    priority=None, match=None, entity="switch"):
+            parent = self._acl_parent(entity)
+            if not (direction or priority or match):
+                self._transact([self._update_op(parent, lswitch,
+                                                {"acls": []})])
+                return
+
+            uuids = [acl["_uuid"] for acl in self.acl_list(lswitch, entity)
+                     if (not direction or acl["direction"] == direction) and
+                     (not priority or acl["priority"] == int(priority)) and
+                     (not match or acl["match"] == match)]
+            self._transact([self._mutate_op(parent, lswitch, "acls",
+                                            "delete", uuids)])
+
+        def _port_uuids(self, port_list):
+            return [self._row_uuid("Logical_Switch_Port", port)
+                    for port in port_list.split()]
+
+        def port_group_add(self, port_group, port_list):
+            self._insert("Port_Group",
+                         {"name": port_group,
+                          "ports": self._port_uuids(port_list)},
+                         port_group)
+
+        def port_group_set(self, port_group, port_list):
+            self._transact([self._update_op(
+                "Port_Group", port_group,
+                {"ports": self._port_uuids(port_list)})])
+
+        def port_group_del(self, port_group):
+            self.destroy("Port_Group", port_group)
+
+        def show(self, lswitch=None):
+            where = self._where("Logical_Switch", lswitch) if lswitch else []
+            switches = self._select("Logical_Switch", where,
+                                    ["_uuid", "name", "ports"])
+            ports = self._select("Logical_Switch_Port", [], ["_uuid", "name"])
+
+            return get_lswitch_info(switches, ports)
+
+        def sync(self, wait='hv'):
+            # Same as "ovn-nbctl --wait=hv sync": bump nb_cfg and wait
+            # for the chassis (or ovn-northd) to catch up.
+            self.flush()
+            results = self._read([
+                {"op": "mutate", "table": "NB_Global", "where": [],
+                 "mutations": [["nb_cfg", "+=", 1]]},
+                {"op": "select", "table": "NB_Global", "where": [],
+                 "columns": ["nb_cfg"]}])
+            nb_cfg = results[1]["rows"][0]["nb_cfg"]
+            column = "hv_cfg" if wait == "hv" else "sb_cfg"
+            while True:
+                rows = self._select("NB_Global", [], [column])
+                if rows[0][column] >= nb_cfg:
+                    return
+                time.sleep(ovsdb.SYNC_POLL_INTERVAL)
+
+        def start_daemon(self, nbctld_config):
+            # The JSON-RPC connection is already kept open.
+            return None
+
+        def stop_daemon(self):
+            pass
+
+    def create_client(self):
+        return self._OvnNbIdl(self.credential)
+
+
+@configure("ovn-sb-idl")
+class OvnSbIdl(OvsClient):
+
+    class _OvnSbIdl(ovsdb.OvsdbClientMixin, OvsClientLogger):
+        db_name = "OVN_Southbound"
+
+        def count_igmp_flows(self, lswitch, network_prefix='239'):
+            datapaths = self._select(
+                "Datapath_Binding",
+                [["external_ids", "includes",
+                  ["map", [["name", lswitch]]]]], ["_uuid"])
+            if not datapaths:
+                return 0
+            flows = self._select(
+                "Logical_Flow",
+                [["logical_datapath", "==",
+                  ["uuid", datapaths[0]["_uuid"]]]], ["match"])
+            match = "dst == %s" % network_prefix
+            return len([f for f in flows if match in f["match"]])
+
+        def chassis_bound(self, chassis_name):
+            rows = self._select("Chassis", [["name", "==", chassis_name]],
+                                ["_uuid"])
+            return len(rows) == 1
+
+    def create_client(self):
+        return self._OvnSbIdl(self.credential)
+
 @configure("ovs-ssh")
 class OvsSsh(OvsClient):
 
-    class _OvsSsh(OvsClientLogger):
+    class _OvsSsh(BatchSplitMixin, OvsClientLogger):
         def __init__(self, credential):
             self.ssh = get_ssh_from_credential(credential)
             self.is_root = is_root_credential(credential)
@@ -505,11 +728,12 @@ class OvsSsh(OvsClient):
             if self.cmds == None:
                 return
 
-            cmds = "\n".join(self.cmds)
-            self.cmds = None
+            cmds, self.cmds = self.cmds, None
 
-            self.log_cmds(cmds)
-            self.ssh.run(cmds, stdout=stdout, stderr=sys.stderr)
+            for chunk in self._split_batch(cmds, sep="\n"):
+                chunk = "\n".join(chunk)
+                self.log_cmds(chunk)
+                self.ssh.run(chunk, stdout=stdout, stderr=sys.stderr)
 
     def create_client(self):
         print("*********   call OvsSsh.create_client")
@@ -520,7 +744,7 @@ class OvsSsh(OvsClient):
 @configure("ovs-vsctl")
 class OvsVsctl(OvsClient):
 
-    class _OvsVsctl(OvsClientLogger):
+    class _OvsVsctl(BatchSplitMixin, OvsClientLogger):
 
         def __init__(self, credential):
             self.ssh = get_ssh_from_credential(credential)
@@ -579,15 +803,16 @@ class OvsVsctl(OvsClient):
             if self.cmds == None:
                 return
 
-            run_cmds = []
-            if self.sandbox:
-                if self.install_method == "sandbox":
-                    run_cmds.append(". %s/sandbox.rc" % self.sandbox)
-                    run_cmds.append("ovs-vsctl" + " ".join(self.cmds))
+            for cmds in self._split_batch(self.cmds):
+                run_cmds = []
+                if self.sandbox:
+                    if self.install_method == "sandbox":
+                        run_cmds.append(". %s/sandbox.rc" % self.sandbox)
+                        run_cmds.append("ovs-vsctl" + " ".join(cmds))
 
-            self.log_cmds(" ".join(run_cmds))
-            self.ssh.run("\n".join(run_cmds),
-                         stdout=sys.stdout, stderr=sys.stderr)
+                self.log_cmds(" ".join(run_cmds))
+                self.ssh.run("\n".join(run_cmds),
+                             stdout=sys.stdout, stderr=sys.stderr)
 
             self.cmds = None
 
@@ -651,12 +876,14 @@ class OvsOfctl(OvsClient):
                          stdout=stdout, stderr=stderr)
 
         def dump_flows(self, bridge):
-            stdout = StringIO()
+            # Bridges can have hundreds of thousands of flows, count the
+            # lines as they are received. Through the agent the reply,
+            # hence the whole dump, is still held in memory first.
+            counter = transport.LineCounter()
             opts = []
-            self.run("dump-flows", opts, [bridge], stdout=stdout)
-            oflow_data = stdout.getvalue().strip()
-            oflow_data = oflow_data.split('\n')
-            return len(oflow_data)
+            self.run("dump-flows", opts, [bridge], stdout=counter)
+            counter.close()
+            return counter.count
 
     def create_client(self):
         print("*********   call OvsOfctl.create_client")
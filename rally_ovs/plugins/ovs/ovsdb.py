@@ -0,0 +1,734 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Minimal OVSDB JSON-RPC (RFC 7047) client.
+
+Used by the "ovn-nb-idl" and "ovn-sb-idl" clients to talk to the NB/SB
+ovsdb-servers directly instead of running ovn-nbctl/ovn-sbctl for every
+operation.
+"""
+
+import functools
+import itertools
+import json
+import os
+import re
+import select
+import socket
+import ssl
+import subprocess
+import threading
+import time
+
+import six
+
+from rally.common import logging
+from rally import exceptions
+
+from rally_ovs.plugins.ovs import ovsclients
+from rally_ovs.plugins.ovs import transport
+from rally_ovs.plugins.ovs import utils
+
+LOG = logging.getLogger(__name__)
+
+
+UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-"
+                     r"[0-9a-f]{4}-[0-9a-f]{12}$")
+
+DEFAULT_RELAY_CMD = "socat STDIO UNIX-CONNECT:{path}"
+
+RECV_SIZE = 65536
+
+SYNC_POLL_INTERVAL = 0.1
+
+
+class OvsdbError(exceptions.RallyException):
+    pass
+
+
+def strip_quotes(value):
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+class _SocketStream(object):
+    def __init__(self, sock):
+        self.sock = sock
+
+    def sendall(self, data):
+        self.sock.sendall(data)
+
+    def recv(self, size):
+        return self.sock.recv(size)
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def close(self):
+        self.sock.close()
+
+
+class _ProcessStream(object):
+    def __init__(self, proc):
+        self.proc = proc
+        self.timeout = None
+
+    def sendall(self, data):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def recv(self, size):
+        fd = self.proc.stdout.fileno()
+        if self.timeout is not None and \
+                not select.select([fd], [], [], self.timeout)[0]:
+            raise socket.timeout("timed out")
+        return os.read(fd, size)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def open_stream(remote, cred=None, host_container=None, is_root=True,
+                privkey=None, cert=None, cacert=None,
+                relay_cmd=DEFAULT_RELAY_CMD):
+    """Open a stream to an ovsdb-server.
+
+    :param remote: "tcp:IP:PORT", "ssl:IP:PORT" or "unix:PATH". Unix sockets
+                   are reached through the SSH connection of `cred', with
+                   `relay_cmd' bridging the SSH channel and the socket.
+    """
+    proto, _, addr = remote.partition(":")
+
+    if proto in ("tcp", "ssl"):
+        host, _, port = addr.rpartition(":")
+        sock = socket.create_connection((host.strip("[]"), int(port)))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if proto == "ssl":
+            sock = ssl.wrap_socket(sock, keyfile=privkey, certfile=cert,
+                                   ca_certs=cacert,
+                                   cert_reqs=ssl.CERT_REQUIRED if cacert
+                                   else ssl.CERT_NONE)
+        return _SocketStream(sock)
+
+    if proto != "unix":
+        raise OvsdbError("Unsupported OVSDB remote %s" % remote)
+
+    conn = utils.get_ssh_from_credential(cred)
+    while isinstance(conn, (transport.AgentTransport,
+                            transport.DockerExecTransport)):
+        conn = conn.conn
+
+    if isinstance(conn, transport.LocalTransport) and not host_container:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(addr)
+        return _SocketStream(sock)
+
+    cmd = relay_cmd.format(path=addr)
+    if host_container:
+        sudo_s = "sudo " if not is_root else ""
+        cmd = sudo_s + "docker exec -i " + host_container + " " + cmd
+
+    if isinstance(conn, transport.LocalTransport):
+        proc = subprocess.Popen(cmd, shell=True, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+        return _ProcessStream(proc)
+
+    channel = conn.ssh._get_client().get_transport().open_session()
+    channel.exec_command(cmd)
+    return channel
+
+
+class Schema(object):
+    def __init__(self, schema):
+        self.name = schema["name"]
+        self.tables = schema["tables"]
+
+    def column_type(self, table, column):
+        if column == "_uuid":
+            return {"key": {"type": "uuid"}, "min": 1, "max": 1}
+
+        try:
+            coltype = self.tables[table]["columns"][column]["type"]
+        except KeyError:
+            raise OvsdbError("Unknown column %s.%s" % (table, column))
+
+        if isinstance(coltype, six.string_types):
+            coltype = {"key": coltype}
+        coltype = dict(coltype)
+        for k in ("key", "value"):
+            if isinstance(coltype.get(k), six.string_types):
+                coltype[k] = {"type": coltype[k]}
+        coltype.setdefault("min", 1)
+        coltype.setdefault("max", 1)
+        return coltype
+
+    def find_table(self, name):
+        # ovn-nbctl accepts case insensitive table names.
+        for table in self.tables:
+            if table.lower() == name.lower():
+                return table
+        raise OvsdbError("Unknown table %s" % name)
+
+
+def to_atom(value, atom_type):
+    if isinstance(value, list) and len(value) == 2 and \
+            value[0] in ("uuid", "named-uuid"):
+        return value
+
+    if atom_type == "integer":
+        return int(value)
+    if atom_type == "real":
+        return float(value)
+    if atom_type == "boolean":
+        if isinstance(value, bool):
+            return value
+        return strip_quotes(str(value)).lower() == "true"
+    if atom_type == "uuid":
+        return ["uuid", strip_quotes(str(value))]
+    if isinstance(value, six.string_types):
+        return strip_quotes(value)
+    return str(value)
+
+
+def to_datum(value, coltype):
+    """Convert a python value to the OVSDB datum of a column."""
+    key_type = coltype["key"]["type"]
+
+    if "value" in coltype:
+        value_type = coltype["value"]["type"]
+        if not isinstance(value, dict):
+            value = dict(strip_quotes(v).split("=", 1) for v in value)
+        return ["map", [[to_atom(k, key_type), to_atom(v, value_type)]
+                        for k, v in sorted(value.items())]]
+
+    if coltype["max"] != 1 or coltype["min"] == 0:
+        if not isinstance(value, (list, tuple)):
+            value = [value] if value not in ("", "[]") else []
+        return ["set", [to_atom(v, key_type) for v in value]]
+
+    return to_atom(value, key_type)
+
+
+def format_datum(value):
+    """Format a python value like ovs-vsctl/ovn-nbctl do."""
+    def _atom(v):
+        if isinstance(v, bool):
+            return "true" if v else "false"
+        if isinstance(v, six.string_types) and \
+                not re.match(r"^[a-zA-Z_.][a-zA-Z0-9_.-]*$|^" +
+                             UUID_RE.pattern[1:], v):
+            return json.dumps(v)
+        return str(v)
+
+    if isinstance(value, dict):
+        return "{%s}" % ", ".join("%s=%s" % (_atom(k), _atom(v))
+                                  for k, v in sorted(value.items()))
+    if isinstance(value, list):
+        return "[%s]" % ", ".join(_atom(v) for v in value)
+    return _atom(value)
+
+
+class Connection(object):
+    """JSON-RPC session with one ovsdb-server.
+
+    Replies are dispatched by id, so blocking calls and the transactions
+    of a Pipeline can share the connection.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+        self._buf = ""
+        self._decoder = json.JSONDecoder()
+        self._ids = itertools.count(1)
+        self._schemas = {}
+        self._inflight = {}
+
+    def _send(self, msg):
+        self.stream.sendall(json.dumps(msg).encode("utf8"))
+
+    def _recv(self):
+        while True:
+            buf = self._buf.lstrip()
+            if buf:
+                try:
+                    msg, end = self._decoder.raw_decode(buf)
+                    self._buf = buf[end:]
+                    return msg
+                except ValueError:
+                    pass
+
+            data = self.stream.recv(RECV_SIZE)
+            if not data:
+                raise OvsdbError("Connection closed by ovsdb-server")
+            self._buf = buf + data.decode("utf8")
+
+    def _request(self, method, params, callback):
+        """Send a request, `callback' is called with its reply message.
+
+        Must be called with the connection lock held.
+        """
+        msg_id = next(self._ids)
+        self._inflight[msg_id] = callback
+        self._send({"method": method, "params": params, "id": msg_id})
+        return msg_id
+
+    def _process(self):
+        """Read and dispatch one message, with the connection lock held."""
+        msg = self._recv()
+        if msg.get("method") == "echo":
+            self._send({"id": msg["id"], "result": msg["params"],
+                        "error": None})
+            return
+        # Notifications ("update", "locked", ...) are not used.
+        callback = self._inflight.pop(msg.get("id"), None)
+        if callback:
+            callback(msg)
+
+    def call(self, method, params, timeout=None):
+        """Send a request and wait for its reply.
+
+        With a `timeout', each read waits at most that many seconds for
+        the server, OvsdbError is raised past it.
+        """
+        replies = []
+        with self._lock:
+            if timeout is not None:
+                self.stream.settimeout(timeout)
+            try:
+                self._request(method, params, replies.append)
+                while not replies:
+                    self._process()
+            except socket.timeout:
+                raise OvsdbError("%s got no reply in %ss" % (method,
+                                                             timeout))
+            finally:
+                if timeout is not None:
+                    self.stream.settimeout(None)
+
+        msg = replies[0]
+        if msg.get("error"):
+            raise OvsdbError("%s failed: %s" % (method, msg["error"]))
+        return msg["result"]
+
+    def get_schema(self, db, timeout=None):
+        if db not in self._schemas:
+            self._schemas[db] = Schema(self.call("get_schema", [db],
+                                                 timeout))
+        return self._schemas[db]
+
+    def transact(self, db, ops, timeout=None):
+        results = self.call("transact", [db] + list(ops), timeout)
+        check_transact_results(ops, results)
+        return results
+
+    def pipeline(self, db, depth):
+        return Pipeline(self, db, depth)
+
+    def close(self):
+        self.stream.close()
+
+
+def check_transact_results(ops, results):
+    for op, result in zip(list(ops) + [{"op": "commit"}], results):
+        if result and result.get("error"):
+            raise OvsdbError("%s %s: %s (%s)" % (
+                op["op"], op.get("table", ""), result["error"],
+                result.get("details", "")))
+
+
+class Pipeline(object):
+    """Keep up to `depth' transactions in flight on a connection.
+
+    submit() only waits when the pipeline is full. A failed transaction
+    does not stop the following ones, its error is recorded and raised
+    by drain() once every transaction has completed.
+    """
+
+    def __init__(self, conn, db, depth):
+        self.conn = conn
+        self.db = db
+        self.depth = depth
+        self.inflight = 0
+        self.latencies = []
+        self.errors = []
+
+    def _done(self, ops, start, msg):
+        self.inflight -= 1
+        self.latencies.append(time.time() - start)
+        try:
+            if msg.get("error"):
+                raise OvsdbError("transact failed: %s" % msg["error"])
+            check_transact_results(ops, msg["result"])
+        except OvsdbError as e:
+            LOG.error("Pipelined transaction failed: %s" % e)
+            self.errors.append(e)
+
+    def submit(self, ops):
+        conn = self.conn
+        with conn._lock:
+            while self.inflight >= self.depth:
+                conn._process()
+            self.inflight += 1
+            conn._request("transact", [self.db] + list(ops),
+                          functools.partial(self._done, ops, time.time()))
+
+    def drain(self):
+        with self.conn._lock:
+            while self.inflight:
+                self.conn._process()
+
+        errors, self.errors = self.errors, []
+        if errors:
+            raise OvsdbError("%d of the pipelined transactions failed, "
+                             "first error: %s" % (len(errors), errors[0]))
+
+    def pop_latencies(self):
+        latencies, self.latencies = self.latencies, []
+        return latencies
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def get_connection(remote, **kwargs):
+    """Return the connection to `remote', shared by the whole process."""
+    with _connections_lock:
+        if remote not in _connections:
+            LOG.info("Connecting to ovsdb-server at %s" % remote)
+            _connections[remote] = Connection(open_stream(remote, **kwargs))
+        return _connections[remote]
+
+
+def drop_connection(remote):
+    with _connections_lock:
+        conn = _connections.pop(remote, None)
+    if conn:
+        conn.close()
+
+
+class OvsdbClientMixin(ovsclients.WriteBehindMixin):
+    """ovn-nbctl/ovn-sbctl like database commands over JSON-RPC.
+
+    Mirrors DdCtlMixin and the batch mode of the ctl clients: in batch mode
+    operations are queued and committed as one transaction by flush().
+    With a pipeline depth above 1, flush() does not wait for the commit,
+    the transaction is left in flight until the next read, sync() or
+    drain().
+    """
+
+    db_name = None
+
+    def __init__(self, credential):
+        self.credential = credential
+        self.is_root = utils.is_root_credential(credential)
+        self.context = {}
+        self.sandbox = None
+        self.install_method = "sandbox"
+        self.host_container = None
+        self.batch_mode = False
+        self.ops = []
+        self.log_cmd = False
+        self.remote = None
+        self.remote_opts = {}
+        self._uuid_names = itertools.count(1)
+        self._pending = {}
+        self.pipeline_depth = 1
+        self.pipeline = None
+        self.latencies = []
+
+    def enable_batch_mode(self, value=True):
+        self.batch_mode = bool(value)
+
+    def set_sandbox(self, sandbox, install_method="sandbox",
+                    host_container=None):
+        self.sandbox = sandbox
+        self.install_method = install_method
+        self.host_container = host_container
+
+    def set_remote(self, remote, privkey=None, cert=None, cacert=None,
+                   relay_cmd=DEFAULT_RELAY_CMD):
+        self.remote = remote
+        self.remote_opts = {"privkey": privkey, "cert": cert,
+                            "cacert": cacert, "relay_cmd": relay_cmd}
+
+    def set_pipeline_depth(self, depth=1):
+        # Called for every helper getting the client: changing the depth
+        # waits for the transactions in flight, keeping it must not.
+        if depth == self.pipeline_depth:
+            return
+        self.drain()
+        self.pipeline_depth = depth
+        self.pipeline = None
+
+    @property
+    def conn(self):
+        if not self.remote:
+            raise OvsdbError("No OVSDB remote set for %s" % self.db_name)
+        return get_connection(self.remote, cred=self.credential,
+                              host_container=self.host_container,
+                              is_root=self.is_root, **self.remote_opts)
+
+    @property
+    def schema(self):
+        return self.conn.get_schema(self.db_name)
+
+    def _commit(self, ops, timeout=None):
+        self.log_cmds(ops)
+        try:
+            return self.conn.transact(self.db_name, ops, timeout)
+        except (socket.error, ssl.SSLError):
+            drop_connection(self.remote)
+            raise
+
+    def _transact(self, ops):
+        if self.batch_mode:
+            self.ops.extend(ops)
+            return None
+
+        self._pending.clear()
+        self.barrier()
+        return self._commit(ops)
+
+    def _read(self, ops, timeout=None):
+        # Reads are never batched, they need their result right away and
+        # must see the effect of every transaction sent before them.
+        self.drain()
+        return self._commit(ops, timeout)
+
+    def flush(self):
+        if not self.ops:
+            return
+
+        ops, self.ops = self.ops, []
+        self._pending.clear()
+        self._flush_batch(ops)
+
+    def _flush(self, ops):
+        if self.pipeline_depth <= 1:
+            start = time.time()
+            self._commit(ops)
+            self.latencies.append(time.time() - start)
+            return
+
+        if not self.pipeline:
+            self.pipeline = self.conn.pipeline(self.db_name,
+                                               self.pipeline_depth)
+        self.log_cmds(ops)
+        self.pipeline.submit(ops)
+
+    def drain(self):
+        """Wait for the pipelined transactions, raise if any failed."""
+        self.barrier()
+        if self.pipeline:
+            self.pipeline.drain()
+            self.latencies += self.pipeline.pop_latencies()
+
+    def pop_commit_latencies(self):
+        """Return the commit latency of each flushed transaction."""
+        self.drain()
+        latencies, self.latencies = self.latencies, []
+        return latencies
+
+    def _new_uuid_name(self):
+        return "row%d" % next(self._uuid_names)
+
+    def _table(self, table):
+        return self.schema.find_table(table)
+
+    def _datum(self, table, column, value):
+        return to_datum(value, self.schema.column_type(table, column))
+
+    def _row(self, table, values):
+        return {col: self._datum(table, col, val)
+                for col, val in values.items() if val is not None}
+
+    def _where(self, table, record):
+        record = strip_quotes(str(record))
+        if UUID_RE.match(record):
+            return [["_uuid", "==", ["uuid", record]]]
+
+        pending = self._pending.get((table, record))
+        if pending:
+            return [["_uuid", "==", ["named-uuid", pending]]]
+        return [["name", "==", record]]
+
+    def _select(self, table, where, columns=None, timeout=None):
+        op = {"op": "select", "table": table, "where": where}
+        if columns:
+            op["columns"] = columns
+        rows = self._read([op], timeout)[0]["rows"]
+        return [{k: ovsclients.from_datum(v) for k, v in row.items()}
+                for row in rows]
+
+    def _row_uuid(self, table, record):
+        """Return the uuid atom of a row, named-uuid if just inserted."""
+        record = strip_quotes(str(record))
+        if UUID_RE.match(record):
+            return ["uuid", record]
+
+        pending = self._pending.get((table, record))
+        if pending:
+            return ["named-uuid", pending]
+
+        rows = self._select(table, [["name", "==", record]], ["_uuid"])
+        if not rows:
+            raise OvsdbError("%s %s not found" % (table, record))
+        return ["uuid", rows[0]["_uuid"]]
+
+    def _insert_op(self, table, values, name=None):
+        uuid_name = self._new_uuid_name()
+        if name:
+            self._pending[(table, name)] = uuid_name
+        return {"op": "insert", "table": table,
+                "row": self._row(table, values), "uuid-name": uuid_name}
+
+    def _insert(self, table, values, name=None, parent=None):
+        """Insert a row, linking it to `parent' (table, record, column)."""
+        op = self._insert_op(table, values, name)
+        ops = [op]
+        if parent:
+            ptable, precord, pcolumn = parent
+            ops.append(self._mutate_op(ptable, precord, pcolumn, "insert",
+                                       [["named-uuid", op["uuid-name"]]]))
+        self._transact(ops)
+
+    def _mutate_op(self, table, record, column, mutator, value):
+        if isinstance(record, list):
+            where = record
+        else:
+            where = self._where(table, record)
+        return {"op": "mutate", "table": table, "where": where,
+                "mutations": [[column, mutator,
+                               self._datum(table, column, value)]]}
+
+    def _update_op(self, table, record, values):
+        return {"op": "update", "table": table,
+                "where": self._where(table, record),
+                "row": self._row(table, values)}
+
+    def _col_values(self, col_values):
+        for entry in col_values:
+            if len(entry) == 2:
+                yield entry[0], "=", entry[1]
+            else:
+                yield entry
+
+    # DdCtlMixin compatible database commands
+
+    def get(self, table, record, *columns, **kwargs):
+        # timeout: seconds to wait for each reply of the server.
+        timeout = kwargs.get("timeout")
+        self.conn.get_schema(self.db_name, timeout)
+        table = self._table(table)
+        rows = self._select(table, self._where(table, record), list(columns),
+                            timeout)
+        if not rows:
+            raise OvsdbError("%s %s not found" % (table, record))
+        return "\n".join(format_datum(rows[0][c]) for c in columns) + "\n"
+
+    def list(self, table, records, columns=None):
+        table = self._table(table)
+        if not records:
+            return self._select(table, [], columns)
+
+        ops = []
+        for record in records:
+            op = {"op": "select", "table": table,
+                  "where": self._where(table, record)}
+            if columns:
+                op["columns"] = columns
+            ops.append(op)
+        return [{k: ovsclients.from_datum(v) for k, v in row.items()}
+                for result in self._read(ops) for row in result["rows"]]
+
+    def get_many(self, table, records, *columns):
+        if not records:
+            return []
+        return self.list(table, records, list(columns) or None)
+
+    def find(self, table, *conditions, **kwargs):
+        table = self._table(table)
+        where = [[col, "==", self._datum(table, col, val)]
+                 for col, _, val in self._col_values(conditions)]
+        return self._select(table, where, kwargs.get("columns"))
+
+    def wait_until(self, table, record, *col_values):
+        table = self._table(table)
+        values = dict((col, val)
+                      for col, _, val in self._col_values(col_values))
+        self._transact([{"op": "wait", "table": table,
+                         "where": self._where(table, record),
+                         "columns": sorted(values), "until": "==",
+                         "rows": [self._row(table, values)]}])
+
+    def create(self, table, record, *col_values):
+        # ovn-nbctl style: "record" is the first column=value pair.
+        table = self._table(table)
+        values = {}
+        for entry in [record] + list(col_values):
+            if isinstance(entry, six.string_types):
+                entry = tuple(entry.split("=", 1))
+            col, _, val = next(self._col_values([entry]))
+            values[col] = val
+        self._transact([self._insert_op(table, values)])
+
+    def add(self, table, record, *col_values):
+        table = self._table(table)
+        self._transact([self._mutate_op(table, record, col, "insert", val)
+                        for col, _, val in self._col_values(col_values)])
+
+    def remove(self, table, record, *col_values):
+        table = self._table(table)
+        self._transact([self._mutate_op(table, record, col, "delete", val)
+                        for col, _, val in self._col_values(col_values)])
+
+    def set(self, table, record, *col_values):
+        table = self._table(table)
+        ops = []
+        for col, _, val in self._col_values(col_values):
+            if isinstance(val, dict):
+                # ovn-nbctl only updates the given keys of a map column.
+                coltype = self.schema.column_type(table, col)
+                keys = to_datum(list(val.keys()),
+                                {"key": coltype["key"], "min": 0,
+                                 "max": "unlimited"})
+                ops.append({"op": "mutate", "table": table,
+                            "where": self._where(table, record),
+                            "mutations": [[col, "delete", keys]]})
+                ops.append(self._mutate_op(table, record, col, "insert", val))
+            else:
+                ops.append(self._update_op(table, record, {col: val}))
+        self._transact(ops)
+
+    def db_set(self, table, record, *col_values):
+        self.set(table, record, *col_values)
+
+    def destroy(self, table, record):
+        table = self._table(table)
+        self._transact([{"op": "delete", "table": table,
+                         "where": self._where(table, record)}])
+
+    def sync(self, wait="hv"):
+        # A committed empty transaction guarantees that every earlier one
+        # has been committed too.
+        self.flush()
+        self._read([{"op": "comment", "comment": "sync"}])
@@ -0,0 +1,225 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import collections
+import threading
+
+import six
+
+
+class Record(object):
+    """Compact object with the dict interface task code expects.
+
+    Fields live in __slots__, so a record costs a fraction of the dict it
+    replaces. Dict keys are the field names, except for the fields listed
+    in _dashed: lport["ext-gw"] is lport.ext_gw. Unknown keys raise
+    KeyError.
+    """
+
+    __slots__ = ()
+
+    # Fields read with a dashed key, like the dicts they replace.
+    _dashed = ()
+
+    @classmethod
+    def _key(cls, field):
+        return field.replace("_", "-") if field in cls._dashed else field
+
+    @classmethod
+    def _field(cls, key):
+        field = key.replace("-", "_")
+        if field not in cls.__slots__ or cls._key(field) != key:
+            raise KeyError(key)
+        return field
+
+    def __getitem__(self, key):
+        return getattr(self, self._field(key))
+
+    def __setitem__(self, key, value):
+        setattr(self, self._field(key), value)
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [self._key(field) for field in self.__slots__]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    # Slotted objects need these to be pickled with protocols 0 and 1.
+    def __getstate__(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (field, getattr(self, field))
+            for field in self.__slots__))
+
+
+class LSwitch(Record):
+    __slots__ = ("name", "uuid", "cidr", "lports")
+
+    def __init__(self, name, uuid=None, cidr="", lports=None):
+        self.name = six.moves.intern(str(name))
+        self.uuid = uuid
+        self.cidr = cidr
+        self.lports = lports
+
+
+class LPort(Record):
+    __slots__ = ("name", "mac", "ip", "gw", "ext_gw")
+    _dashed = ("ext_gw",)
+
+    def __init__(self, name, mac="", ip="", gw="", ext_gw=None):
+        self.name = six.moves.intern(str(name))
+        self.mac = mac
+        self.ip = ip
+        self.gw = gw
+        self.ext_gw = ext_gw
+
+
+class Sandbox(Record):
+    __slots__ = ("name", "tag", "farm", "host_container")
+
+    def __init__(self, name, tag=None, farm=None, host_container=None):
+        self.name = six.moves.intern(str(name))
+        self.tag = tag
+        self.farm = six.moves.intern(str(farm)) if farm else farm
+        self.host_container = host_container
+
+
+class PortRegistry(object):
+    """Internal ports bound in sandboxes, indexed by port, sandbox and farm.
+
+    It reads like the dict it replaces: registry[port_name] is the
+    (lport, sandbox) pair the port was bound with.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ports = {}
+        self._sandbox_ports = collections.defaultdict(collections.OrderedDict)
+        self._farm_sandboxes = collections.defaultdict(set)
+
+    # Contexts are deep-copied for each iteration, locks can't be.
+    def __getstate__(self):
+        return self._ports, self._sandbox_ports, self._farm_sandboxes
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._ports, self._sandbox_ports, self._farm_sandboxes = state
+
+    def __getitem__(self, port_name):
+        return self._ports[port_name]
+
+    def __setitem__(self, port_name, entry):
+        lport, sandbox = entry
+        with self._lock:
+            self._remove(port_name)
+            self._ports[port_name] = entry
+            self._sandbox_ports[sandbox["name"]][port_name] = True
+            self._farm_sandboxes[sandbox["farm"]].add(sandbox["name"])
+
+    def __contains__(self, port_name):
+        return port_name in self._ports
+
+    def __iter__(self):
+        return iter(list(self._ports))
+
+    def __len__(self):
+        return len(self._ports)
+
+    def get(self, port_name, default=None):
+        return self._ports.get(port_name, default)
+
+    def items(self):
+        return list(self._ports.items())
+
+    def add(self, lport, sandbox):
+        self[lport["name"]] = (lport, sandbox)
+
+    def by_sandbox(self, sb_name):
+        with self._lock:
+            return [self._ports[name]
+                    for name in self._sandbox_ports.get(sb_name, ())]
+
+    def by_farm(self, farm):
+        with self._lock:
+            return [self._ports[name]
+                    for sb_name in self._farm_sandboxes.get(farm, ())
+                    for name in self._sandbox_ports.get(sb_name, ())]
+
+    def _remove(self, port_name):
+        entry = self._ports.pop(port_name, None)
+        if entry is None:
+            return None
+
+        sandbox = entry[1]
+        ports = self._sandbox_ports.get(sandbox["name"])
+        if ports is not None:
+            ports.pop(port_name, None)
+            if not ports:
+                del self._sandbox_ports[sandbox["name"]]
+                sandboxes = self._farm_sandboxes.get(sandbox["farm"])
+                if sandboxes is not None:
+                    sandboxes.discard(sandbox["name"])
+                    if not sandboxes:
+                        del self._farm_sandboxes[sandbox["farm"]]
+        return entry
+
+    def remove(self, port_names):
+        """Forget ports, return their (lport, sandbox) entries."""
+        with self._lock:
+            removed = [self._remove(name) for name in port_names]
+        return [entry for entry in removed if entry is not None]
+
+    def remove_sandboxes(self, sb_names):
+        """Forget every port of the sandboxes, return their entries."""
+        with self._lock:
+            removed = []
+            for sb_name in sb_names:
+                for name in list(self._sandbox_ports.get(sb_name, ())):
+                    removed.append(self._remove(name))
+        return removed
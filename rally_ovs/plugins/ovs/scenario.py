@@ -13,10 +13,35 @@
 # under the License.
 
 
+import collections
+
 import six
 
 from rally.task import scenario
 from rally_ovs.plugins.ovs import ovsclients
+from rally_ovs.plugins.ovs import transport
+
+
+class _AtomicActions(collections.OrderedDict):
+    """Atomic action durations leaving out the SSH retries.
+
+    rally's ActionTimer stores None under the name of an action when it
+    starts and its duration when it ends, so the time the thread spent
+    retrying SSH commands in between can be subtracted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._retry_start = {}
+        super(_AtomicActions, self).__init__(*args, **kwargs)
+
+    def __setitem__(self, name, value, *args):
+        if value is None:
+            self._retry_start[name] = transport.get_retry_time()
+        elif name in self._retry_start:
+            retry_time = (transport.get_retry_time() -
+                          self._retry_start.pop(name))
+            value = max(value - retry_time, 0)
+        super(_AtomicActions, self).__setitem__(name, value, *args)
 
 
 class OvsScenario(ovsclients.ClientsMixin, scenario.Scenario):
@@ -24,3 +49,70 @@ class OvsScenario(ovsclients.ClientsMixin, scenario.Scenario):
 
     def __init__(self, context=None):
         super(OvsScenario, self).__init__(context)
+
+    def setup(self):
+        super(OvsScenario, self).setup()
+        self._atomic_actions = _AtomicActions(self._atomic_actions)
+        pool = transport.get_pool()
+        self._ssh_pool_totals = pool.get_totals()
+        self._ssh_compress_totals = pool.get_compress_totals()
+        self._ssh_retry_stats = pool.get_retry_stats()
+
+    def atomic_actions(self):
+        return collections.OrderedDict(self._atomic_actions)
+
+    def _report_ssh_pool_stats(self):
+        """Add the SSH pool activity of this iteration to task output."""
+        totals = transport.get_pool().get_totals()
+        data = [[k, totals[k] - self._ssh_pool_totals.get(k, 0)]
+                for k in sorted(totals)]
+        self.add_output(additive={
+            "title": "SSH connection pool",
+            "description": "SSH connections opened, reused and evicted "
+                           "in each iteration",
+            "chart_plugin": "StackedArea", "data": data
+        })
+        self._report_ssh_compress_stats()
+        self._report_ssh_retry_stats()
+
+    def _report_ssh_compress_stats(self):
+        pool = transport.get_pool()
+        if not pool.compress_threshold:
+            return
+        totals = pool.get_compress_totals()
+        self.add_output(additive={
+            "title": "SSH compression",
+            "description": "Bytes saved by compressing the scripts and "
+                           "outputs above %d bytes in each iteration" %
+                           pool.compress_threshold,
+            "chart_plugin": "StackedArea",
+            "data": [["saved bytes", totals["saved_bytes"] -
+                      self._ssh_compress_totals["saved_bytes"]]]
+        })
+        self.add_output(additive={
+            "title": "SSH compression CPU time",
+            "description": "Seconds spent compressing and decompressing "
+                           "on the rally host in each iteration",
+            "chart_plugin": "StackedArea",
+            "data": [["cpu time", totals["cpu_time"] -
+                      self._ssh_compress_totals["cpu_time"]]]
+        })
+
+    def _report_ssh_retry_stats(self):
+        pool = transport.get_pool()
+        if not pool.retries_enabled():
+            return
+        stats = pool.get_retry_stats()
+        data = []
+        # Every host the pool talked to, even those without failures.
+        for host in sorted(set(pool.get_stats()) | set(stats)):
+            retries = stats.get(host, {}).get("retries", 0)
+            before = self._ssh_retry_stats.get(host, {}).get("retries", 0)
+            data.append([host, retries - before])
+        self.add_output(additive={
+            "title": "SSH retries",
+            "description": "SSH commands retried after a transport failure, "
+                           "per host in each iteration. Atomic action "
+                           "durations leave out the time spent retrying",
+            "chart_plugin": "StackedArea", "data": data
+        })
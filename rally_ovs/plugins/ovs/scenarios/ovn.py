@@ -17,15 +17,26 @@ from rally.task import atomic
 from rally.common import logging
 from rally import exceptions
 from rally_ovs.plugins.ovs import ovnclients
+from rally_ovs.plugins.ovs import ovsclients
+from rally_ovs.plugins.ovs import ovsdb
+from rally_ovs.plugins.ovs import records
+from rally_ovs.plugins.ovs import transport
 from rally_ovs.plugins.ovs import utils
+import collections
 import copy
 import random
+import time
 import netaddr
+import six
 from datetime import datetime
 from io import StringIO
 
 LOG = logging.getLogger(__name__)
 
+# Bounds of the jittered backoff between two pings of a port.
+PING_RETRY_MIN_DELAY = 0.05
+PING_RETRY_MAX_DELAY = 1.0
+
 
 class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
     RESOURCE_NAME_FORMAT = "lswitch_XXXXXX_XXXXXX"
@@ -33,10 +44,12 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
     def __init__(self, context=None):
         super(OvnScenario, self).__init__(context)
         self._ssh_conns = None
+        self._ssh_farm_conns = None
 
     def __del__(self):
         if self._ssh_conns:
             self._ssh_conns.clear()
+            self._ssh_farm_conns.clear()
 
     def _build_conn_hash(self, context):
         if not self._ssh_conns is None:
@@ -46,6 +59,7 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
             return
 
         self._ssh_conns = {}
+        self._ssh_farm_conns = {}
 
         for sandbox in context["sandboxes"]:
             sb_name = sandbox["name"]
@@ -56,20 +70,87 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
             ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
             ovs_ssh.enable_batch_mode()
             self._ssh_conns[sb_name] = ovs_ssh
+            self._ssh_farm_conns[farm] = ovs_ssh
 
     def _get_conn(self, sb_name):
         self._build_conn_hash(self.context)
         return self._ssh_conns[sb_name]
 
+    def _run_on_farms(self, action_name, func, farm_items):
+        '''
+        Call func(farm, items) for every farm in `farm_items' concurrently,
+        at most `farm_concurrency' farms at a time. Clients are per farm, so
+        all the work for one farm stays in the same thread.
+
+        The whole fan-out is timed as `action_name' atomic action, unless
+        the caller already times itself under that name, and the max and
+        mean farm durations are added to the task output.
+        '''
+        farms = sorted(farm_items)
+
+        def _run():
+            return utils.run_in_parallel(
+                lambda farm: func(farm, farm_items[farm]), farms,
+                self.farm_concurrency)
+
+        # rally stores None under the name of a running atomic action.
+        if action_name in self._atomic_actions and \
+                self._atomic_actions[action_name] is None:
+            results = _run()
+        else:
+            with atomic.ActionTimer(self, action_name):
+                results = _run()
+
+        farm_results = {}
+        durations = []
+        for farm, (result, duration) in zip(farms, results):
+            LOG.debug("%s on %s took %.3fs, result: %s" % (
+                action_name, farm, duration, result))
+            durations.append(duration)
+            farm_results[farm] = result
+
+        if durations:
+            self.add_output(additive={
+                "title": "%s per farm" % action_name,
+                "description": "Max and mean duration of %s on the %d "
+                               "farms, in seconds" % (action_name,
+                                                      len(durations)),
+                "chart_plugin": "StackedArea",
+                "data": [["max", max(durations)],
+                         ["mean", sum(durations) / len(durations)]]
+            })
+        return farm_results
+
     def _flush_conns(self, cmds=[]):
         if self._ssh_conns is None:
             return
 
-        for _, ovs_ssh in self._ssh_conns.items():
+        def _flush(farm, ovs_ssh):
             for cmd in cmds:
                 ovs_ssh.run(cmd)
             ovs_ssh.flush()
 
+        self._run_on_farms("ovn.flush_conns", _flush, self._ssh_farm_conns)
+
+    def _report_ovsdb_stats(self):
+        """Add the NB commit latency of each transaction to task output."""
+        ovn_nbctl = self._get_ovn_controller(self.install_method)
+        if not isinstance(ovn_nbctl, ovsdb.OvsdbClientMixin):
+            return
+
+        latencies = ovn_nbctl.pop_commit_latencies()
+        self.add_output(complete={
+            "title": "OVSDB transaction commit latency",
+            "description": "Seconds between sending each NB transaction "
+                           "and receiving its reply (pipeline depth %d)"
+                           % ovn_nbctl.pipeline_depth,
+            "chart_plugin": "Lines",
+            "axis_label": "Transaction",
+            "label": "Latency (s)",
+            "data": [["commit", [[i + 1, latency]
+                                 for i, latency in enumerate(latencies)]]]
+        })
+
     '''
     return: [{"name": "lswitch_xxxx_xxxxx", "cidr": netaddr.IPNetwork}, ...]
     '''
@@ -94,6 +175,7 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
 
         ovn_nbctl.flush()
         ovn_nbctl.enable_batch_mode(False)
+        self._get_nb_topology().remove_lswitches(lswitches)
 
     def _get_or_create_lswitch(self, lswitch_create_args=None):
         pass
@@ -117,13 +199,13 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
 
         self.RESOURCE_NAME_FORMAT = "lpXXXXXX_XXXXXX"
 
-        batch = lport_create_args.get("batch", lport_amount)
         port_security = lport_create_args.get("port_security", True)
 
         LOG.info("Create lports method: %s" % self.install_method)
 
         network_cidr = lswitch.get("cidr", None)
-        ip_addrs = None
+        ips = [""] * lport_amount
+        gw = ext_gw = None
         if network_cidr:
             end_ip = network_cidr.ip + lport_amount + lport_ip_shift
             if not end_ip in network_cidr:
@@ -131,28 +213,27 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
                 raise exceptions.InvalidConfigException(
                             message  % (network_cidr, lport_amount))
 
-            ip_addrs = netaddr.iter_iprange(network_cidr.ip + lport_ip_shift,
-                                            network_cidr.last)
+            ips = utils.ip_range(network_cidr.ip + lport_ip_shift,
+                                 lport_amount)
+            gw = str(self._get_gw_ip(network_cidr))
+            prefixlen = network_cidr.prefixlen
+        if ext_cidr:
+            ext_gw = str(self._get_gw_ip(ext_cidr, 2))
+        macs = self._allocate_macs(lport_amount)
 
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode()
 
-        base_mac = [i[:2] for i in self.task["uuid"].split('-')]
-        base_mac[0] = str(hex(int(base_mac[0], 16) & 254))
-        base_mac[3:] = ['00']*3
-
-        flush_count = batch
+        flusher = utils.BatchFlusher(ovn_nbctl, lport_create_args,
+                                     lport_amount)
         lports = []
-        for i in range(lport_amount):
-            ip = str(next(ip_addrs)) if ip_addrs else ""
-            if len(ip):
-                name = "lp_%s" % ip
+        for ip, mac in zip(ips, macs):
+            if ip:
+                name = "lp_" + ip
+                ip_mask = "%s/%d" % (ip, prefixlen)
             else:
                 name = self.generate_random_name()
-            mac = utils.get_random_mac(base_mac)
-            ip_mask = '{}/{}'.format(ip, network_cidr.prefixlen)
-            gw = str(self._get_gw_ip(network_cidr))
-            ext_gw = str(self._get_gw_ip(ext_cidr, 2)) if ext_cidr else None
+                ip_mask = ""
             lport = ovn_nbctl.lswitch_port_add(lswitch["name"], name, mac,
                                                ip_mask, gw, ext_gw)
 
@@ -161,14 +242,12 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
                 ovn_nbctl.lport_set_port_security(name, mac)
 
             lports.append(lport)
+            flusher.step()
 
-            flush_count -= 1
-            if flush_count < 1:
-                ovn_nbctl.flush()
-                flush_count = batch
-
-        ovn_nbctl.flush()  # ensure all commands be run
+        flusher.finish()  # ensure all commands be run
         ovn_nbctl.enable_batch_mode(False)
+        self._report_batch_sizes("Logical port", flusher)
+        self._get_nb_topology().add_lports(lswitch["name"], lports)
         return lports
 
 
@@ -182,15 +261,29 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
 
         ovn_nbctl.flush()
         ovn_nbctl.enable_batch_mode(False)
+        self._get_nb_topology().remove_lports(lports)
 
 
     @atomic.action_timer("ovn.list_lports")
     def _list_lports(self, lswitches):
         print("list lports")
         ovn_nbctl = self._get_ovn_controller(self.install_method)
-        for lswitch in lswitches:
-            LOG.info("list lports on lswitch %s" % lswitch["name"])
-            ovn_nbctl.lport_list(lswitch["name"])
+        names = [lswitch["name"] for lswitch in lswitches]
+        LOG.info("list lports on lswitches %s" % ", ".join(names))
+        return self._list_children(ovn_nbctl, "Logical_Switch", names,
+                                   "ports", "Logical_Switch_Port",
+                                   "_uuid", "name", "addresses")
+
+    def _list_children(self, ovn_nbctl, table, records, column, child_table,
+                       *columns):
+        # Two reads whatever the number of records: their references,
+        # then only the referenced rows of the child table.
+        uuids = set()
+        for row in ovn_nbctl.get_many(table, records, column):
+            uuids.update(ovsclients.set_value(row[column]))
+        if not uuids:
+            return []
+        return ovn_nbctl.get_many(child_table, sorted(uuids), *columns)
 
 
 
@@ -232,6 +325,7 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
                 ovn_nbctl.acl_add(sw, direction, priority, match, action,
                                   entity = acl_type)
             ovn_nbctl.flush()
+        ovn_nbctl.barrier()
         ovn_nbctl.enable_batch_mode(False)
 
 
@@ -239,9 +333,11 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
     def _list_acl(self, lswitches):
         LOG.info("list ACLs")
         ovn_nbctl = self._get_ovn_controller(self.install_method)
-        for lswitch in lswitches:
-            LOG.info("list ACLs on lswitch %s" % lswitch["name"])
-            ovn_nbctl.acl_list(lswitch["name"])
+        names = [lswitch["name"] for lswitch in lswitches]
+        LOG.info("list ACLs on lswitches %s" % ", ".join(names))
+        return self._list_children(ovn_nbctl, "Logical_Switch", names,
+                                   "acls", "ACL", "_uuid", "direction",
+                                   "priority", "match", "action")
 
 
     @atomic.action_timer("ovn.delete_all_acls")
@@ -274,12 +370,15 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
         ovn_nbctl.port_group_set(port_group, port_list)
 
     @atomic.optional_action_timer("ovn.pg-add-port")
-    def _port_group_add_port(self, port_group, port):
+    def _port_group_add_port(self, port_group, ports):
+        if isinstance(ports, six.string_types):
+            ports = [ports]
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode(False)
 
-        port_uuid = ovn_nbctl.get("logical_switch_port", port, '_uuid')
-        ovn_nbctl.add("port_group", port_group, ('ports', ' ', port_uuid))
+        rows = ovn_nbctl.get_many("Logical_Switch_Port", ports, "_uuid")
+        ovn_nbctl.add("Port_Group", port_group,
+                      ('ports', ' ', [row["_uuid"] for row in rows]))
 
     @atomic.optional_action_timer("ovn.pg-del")
     def _port_group_del(self, port_group):
@@ -316,12 +415,13 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
         super(OvnScenario, self)._connect_gw_routers_routes(dps, lnetwork_args)
 
     @atomic.action_timer("ovn_network.create_phynet")
-    def _create_phynet(self, lswitches, physnet, batch):
+    def _create_phynet(self, lswitches, physnet, batch, batch_args=None):
         LOG.info("Create phynet method: %s" % self.install_method)
         ovn_nbctl = self._get_ovn_controller(self.install_method)
         ovn_nbctl.enable_batch_mode()
 
-        flush_count = batch
+        flusher = utils.BatchFlusher(ovn_nbctl, batch_args or {}, batch)
+        topology = self._get_nb_topology()
         for lswitch in lswitches:
             network = lswitch["name"]
             port = "provnet-%s" % network
@@ -329,14 +429,12 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
             ovn_nbctl.lport_set_addresses(port, ["unknown"])
             ovn_nbctl.lport_set_type(port, "localnet")
             ovn_nbctl.lport_set_options(port, "network_name=%s" % physnet)
+            topology.add_lports(network, [records.LPort(port)])
+            flusher.step()
 
-            flush_count -= 1
-            if flush_count < 1:
-                ovn_nbctl.flush()
-                flush_count = batch
-
-        ovn_nbctl.flush()
+        flusher.finish()
         ovn_nbctl.enable_batch_mode(False)
+        self._report_batch_sizes("Provider network port", flusher)
 
     # NOTE(huikang): num_networks overides the "amount" in network_create_args
     def _create_networks(self, network_create_args, num_networks=-1):
@@ -345,7 +443,8 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
         batch = network_create_args.get("batch", len(lswitches))
 
         if physnet != None:
-            self._create_phynet(lswitches, physnet, batch)
+            self._create_phynet(lswitches, physnet, batch,
+                                batch_args=network_create_args)
 
         return lswitches
 
@@ -431,117 +530,146 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
         if wait_up:
             self._wait_up_port(lports, wait_sync, wait_timeout_s)
 
+    def _group_lport_sbs_by_farm(self, lport_sbs):
+        farm_sbs = collections.defaultdict(list)
+        for sb_name, (sandbox, lports) in lport_sbs.items():
+            farm_sbs[sandbox['farm']].append((sb_name, sandbox, lports))
+        return farm_sbs
+
     @atomic.action_timer("ovn.bind_ovs_vm")
     def _bind_ovs_port(self, lport_sbs, internal=True):
-        for sb_name, (sandbox, lports) in lport_sbs.items():
-            farm = sandbox['farm']
+        def _bind_farm_ports(farm, sbs):
             ovs_vsctl = self.farm_clients(farm, "ovs-vsctl")
-            ovs_vsctl.set_sandbox(sb_name, self.install_method,
-                                  sandbox['host_container'])
-            ovs_vsctl.set_log_cmd(self.context.get("log_cmd", False))
-            ovs_vsctl.enable_batch_mode()
-            for lport in lports:
-                port_name = lport["name"]
-                LOG.info("bind %s to %s on %s" % (port_name, sb_name, farm))
-
-                ovs_vsctl.add_port('br-int', port_name, internal=internal)
-                ovs_vsctl.db_set('Interface', port_name,
-                                ('external_ids', {"iface-id":port_name,
-                                                  "iface-status":"active"}),
-                                ('admin_state', 'up'))
-            ovs_vsctl.flush()
-            ovs_vsctl.enable_batch_mode(False)
+            bound = 0
+            for sb_name, sandbox, lports in sbs:
+                ovs_vsctl.set_sandbox(sb_name, self.install_method,
+                                      sandbox['host_container'])
+                ovs_vsctl.set_log_cmd(self.context.get("log_cmd", False))
+                ovs_vsctl.enable_batch_mode()
+                for lport in lports:
+                    port_name = lport["name"]
+                    LOG.info("bind %s to %s on %s" % (port_name, sb_name, farm))
+
+                    ovs_vsctl.add_port('br-int', port_name, internal=internal)
+                    ovs_vsctl.db_set('Interface', port_name,
+                                    ('external_ids', {"iface-id":port_name,
+                                                      "iface-status":"active"}),
+                                    ('admin_state', 'up'))
+                ovs_vsctl.flush()
+                ovs_vsctl.enable_batch_mode(False)
+                bound += len(lports)
+            return bound
+
+        self._run_on_farms("ovn.bind_ovs_vm", _bind_farm_ports,
+                           self._group_lport_sbs_by_farm(lport_sbs))
 
     @atomic.action_timer("ovn.bind_internal_vm")
     def _bind_ovs_internal_vm(self, lport_sbs):
-        for sb_name, (sandbox, lports) in lport_sbs.items():
-            farm = sandbox['farm']
+        def _bind_farm_vms(farm, sbs):
             ovs_ssh = self.farm_clients(farm, "ovs-ssh")
-            ovs_ssh.set_sandbox(sb_name, self.install_method,
-                                sandbox['host_container'])
-            ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
-            for lport in lports:
-                port_name = lport["name"]
-                port_mac = lport["mac"]
-                port_ip = lport["ip"]
-                port_gw = lport["gw"]
-                # TODO: some containers don't have ethtool installed
-                if not sandbox["host_container"]:
-                    # Disable tx offloading on the port
-                    ovs_ssh.run('ethtool -K {p} tx off &> /dev/null'.format(p=port_name))
-                ovs_ssh.run('ip netns add {p}'.format(p=port_name))
-                ovs_ssh.run('ip link set {p} netns {p}'.format(p=port_name))
-                ovs_ssh.run('ip netns exec {p} ip link set {p} address {m}'.format(
-                    p=port_name, m=port_mac)
-                )
-                ovs_ssh.run('ip netns exec {p} ip addr add {ip} dev {p}'.format(
-                    p=port_name, ip=port_ip)
-                )
-                ovs_ssh.run('ip netns exec {p} ip link set {p} up'.format(
-                    p=port_name)
-                )
-
-                # Add default route.
-                ovs_ssh.run('ip netns exec {p} ip route add default via {gw}'.format(
-                    p=port_name, gw=port_gw)
-                )
-                ovs_ssh.flush()
-
-                # Store the port in the context so we can use its information later
-                # on or at cleanup
-                self.context["ovs-internal-ports"][port_name] = (lport, sandbox)
+            bound = 0
+            for sb_name, sandbox, lports in sbs:
+                ovs_ssh.set_sandbox(sb_name, self.install_method,
+                                    sandbox['host_container'])
+                ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
+                self._bind_sandbox_internal_vms(ovs_ssh, sandbox, lports)
+                bound += len(lports)
+            return bound
+
+        self._run_on_farms("ovn.bind_internal_vm", _bind_farm_vms,
+                           self._group_lport_sbs_by_farm(lport_sbs))
+
+    def _bind_sandbox_internal_vms(self, ovs_ssh, sandbox, lports):
+        for lport in lports:
+            port_name = lport["name"]
+            port_mac = lport["mac"]
+            port_ip = lport["ip"]
+            port_gw = lport["gw"]
+            # TODO: some containers don't have ethtool installed
+            if not sandbox["host_container"]:
+                # Disable tx offloading on the port
+                ovs_ssh.run('ethtool -K {p} tx off &> /dev/null'.format(p=port_name))
+            ovs_ssh.run('ip netns add {p}'.format(p=port_name))
+            ovs_ssh.run('ip link set {p} netns {p}'.format(p=port_name))
+            ovs_ssh.run('ip netns exec {p} ip link set {p} address {m}'.format(
+                p=port_name, m=port_mac)
+            )
+            ovs_ssh.run('ip netns exec {p} ip addr add {ip} dev {p}'.format(
+                p=port_name, ip=port_ip)
+            )
+            ovs_ssh.run('ip netns exec {p} ip link set {p} up'.format(
+                p=port_name)
+            )
+
+            # Add default route.
+            ovs_ssh.run('ip netns exec {p} ip route add default via {gw}'.format(
+                p=port_name, gw=port_gw)
+            )
+            ovs_ssh.flush()
+
+            # Store the port in the context so we can use its information later
+            # on or at cleanup
+            self.context["ovs-internal-ports"].add(lport, sandbox)
 
     def _delete_ovs_internal_vm(self, port_name, ovs_ssh, ovs_vsctl):
         ovs_vsctl.del_port(port_name)
         ovs_ssh.run('ip netns del {p}'.format(p=port_name))
 
     def _flush_ovs_internal_ports(self, sandbox):
-        stdout = StringIO()
         host_container = sandbox["host_container"]
         sb_name = sandbox["name"]
         farm = sandbox["farm"]
 
+        names = []
+
+        def _add_port(name):
+            if "lp" in name:
+                names.append(name)
+
         ovs_vsctl = self.farm_clients(farm, "ovs-vsctl")
         ovs_vsctl.set_sandbox(sandbox, self.install_method, host_container)
         ovs_vsctl.set_log_cmd(self.context.get("log_cmd", False))
+        stdout = transport.LineWriter(_add_port)
         ovs_vsctl.run("find interface type=internal", ["--bare", "--columns", "name"], stdout=stdout)
-        output = stdout.getvalue()
+        stdout.close()
 
         ovs_ssh = self.farm_clients(farm, "ovs-ssh")
         ovs_ssh.set_sandbox(sb_name, self.install_method, host_container)
         ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
 
-        for name in list(filter(None, output.splitlines())):
-            if "lp" not in name:
-                continue
+        for name in names:
             self._delete_ovs_internal_vm(name, ovs_ssh, ovs_vsctl)
+        self.context["ovs-internal-ports"].remove_sandboxes([sb_name])
 
     def _cleanup_ovs_internal_ports(self, sandboxes):
-        conns = {}
-        for sandbox in sandboxes:
-            sb_name = sandbox["name"]
-            farm = sandbox["farm"]
-            host_container = sandbox["host_container"]
+        registry = self.context["ovs-internal-ports"]
+
+        farm_ports = collections.defaultdict(list)
+        for lport, sandbox in registry.remove_sandboxes(
+                sandbox["name"] for sandbox in sandboxes):
+            farm_ports[sandbox["farm"]].append((lport, sandbox))
+
+        def _cleanup_farm_ports(farm, ports):
             ovs_ssh = self.farm_clients(farm, "ovs-ssh")
-            ovs_ssh.set_sandbox(sb_name, self.install_method,
-                                host_container)
-            ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
-            ovs_ssh.enable_batch_mode()
             ovs_vsctl = self.farm_clients(farm, "ovs-vsctl")
-            ovs_vsctl.set_sandbox(sandbox, self.install_method,
-                                  host_container)
-            ovs_vsctl.set_log_cmd(self.context.get("log_cmd", False))
-            ovs_vsctl.enable_batch_mode()
-            conns[sb_name] = (ovs_ssh, ovs_vsctl)
-
-        for _, (lport, sandbox) in self.context["ovs-internal-ports"].items():
-            sb_name = sandbox["name"]
-            (ovs_ssh, ovs_vsctl) = conns[sb_name]
-            self._delete_ovs_internal_vm(lport["name"], ovs_ssh, ovs_vsctl)
+            for lport, sandbox in ports:
+                host_container = sandbox["host_container"]
+                ovs_ssh.set_sandbox(sandbox["name"], self.install_method,
+                                    host_container)
+                ovs_ssh.set_log_cmd(self.context.get("log_cmd", False))
+                ovs_ssh.enable_batch_mode()
+                ovs_vsctl.set_sandbox(sandbox, self.install_method,
+                                      host_container)
+                ovs_vsctl.set_log_cmd(self.context.get("log_cmd", False))
+                ovs_vsctl.enable_batch_mode()
+                self._delete_ovs_internal_vm(lport["name"], ovs_ssh, ovs_vsctl)
 
-        for _, (ovs_ssh, ovs_vsctl) in conns.items():
             ovs_vsctl.flush()
             ovs_ssh.flush()
+            return len(ports)
+
+        self._run_on_farms("ovn.cleanup_ovs_internal_ports",
+                           _cleanup_farm_ports, farm_ports)
 
     @atomic.action_timer("ovn_network.bind_port")
     def _bind_ports(self, lports, sandboxes, port_bind_args):
@@ -588,12 +716,13 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
             dest = lport["gw"]
 
         start_time = datetime.now()
+        delay = PING_RETRY_MIN_DELAY
         while True:
             try:
                 ovs_ssh.run("ip netns exec {} ping -q -c 1 -W 0.1 {}".format(
                                 lport["name"], dest))
                 break
-            except:
+            except (exceptions.SSHError, exceptions.SSHTimeout):
                 pass
 
             if (datetime.now() - start_time).seconds > wait_timeout_s:
@@ -601,6 +730,9 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
                         lport["name"], lport["gw"]))
                 raise exceptions.ThreadTimeoutException()
 
+            time.sleep(random.uniform(PING_RETRY_MIN_DELAY, delay))
+            delay = min(delay * 2, PING_RETRY_MAX_DELAY)
+
     @atomic.action_timer("ovn_network.wait_port_lsp_up")
     def _wait_up_port_lsp(self, lports, ovn_nbctl):
         for index, lport in enumerate(lports):
@@ -687,11 +819,9 @@ class OvnScenario(ovnclients.OvnClientMixin, scenario.OvsScenario):
         ovn_nbctl.remove("Address_Set", name, ('addresses', ' ', addr_list))
 
     def _list_address_set(self):
-        stdout = StringIO()
         ovn_nbctl = self._get_ovn_controller(self.install_method)
-        ovn_nbctl.run("list address_set", ["--bare", "--columns", "name"], stdout=stdout)
-        output = stdout.getvalue()
-        return output.splitlines()
+        return [row["name"] for row in
+                ovn_nbctl.list("Address_Set", [], columns=["name"])]
 
     def _remove_address_set(self, set_name):
         LOG.info("remove %s address_set" % set_name)
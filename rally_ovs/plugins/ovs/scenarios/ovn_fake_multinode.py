@@ -229,11 +229,8 @@ class OvnFakeMultinode(ovn.OvnScenario):
         sb = self._get_sandbox(farm)
         node_name = sb["host_container"]
 
-        ovn_sbctl = self.controller_client("ovn-sbctl")
-        ovn_sbctl.set_sandbox("controller-sandbox", self.install_method,
-                              self.context['controller']['host_container'])
+        ovn_sbctl = self._get_ovn_sb_controller(self.install_method)
         ovn_sbctl.enable_batch_mode(False)
-        ovn_sbctl.set_log_cmd(self.context.get("log_cmd", False))
         self._wait_chassis(ovn_sbctl, node_name, max_timeout_s)
 
     @scenario.configure(context={})
@@ -327,11 +324,8 @@ class OvnFakeMultinode(ovn.OvnScenario):
         node_prefix = fake_multinode_args.get("node_prefix", "")
         max_timeout_s = fake_multinode_args.get("max_timeout_s")
 
-        ovn_sbctl = self.controller_client("ovn-sbctl")
-        ovn_sbctl.set_sandbox("controller-sandbox", self.install_method,
-                              self.context['controller']['host_container'])
+        ovn_sbctl = self._get_ovn_sb_controller(self.install_method)
         ovn_sbctl.enable_batch_mode(False)
-        ovn_sbctl.set_log_cmd(self.context.get("log_cmd", False))
         for i in range(batch_size):
             index = iteration * batch_size + i
 
@@ -16,6 +16,7 @@ import netaddr
 from rally.common import logging
 from rally_ovs.plugins.ovs.scenarios import ovn
 from rally_ovs.plugins.ovs.scenarios import ovn_network
+from rally_ovs.plugins.ovs import transport
 from rally.task import scenario
 from rally.task import validation
 from rally.task import atomic
@@ -39,8 +40,7 @@ class OvnIGMP(ovn_network.OvnNetwork):
 
         for iteration in range(0, 60):
             LOG.info('Iteration {}'.format(iteration))
-            ovn_sbctl = self.controller_client("ovn-sbctl")
-            ovn_sbctl.set_log_cmd(self.context.get("log_cmd", False))
+            ovn_sbctl = self._get_ovn_sb_controller(self.install_method)
             igmp_flow_count = 0
             for lswitch in lswitches:
                 igmp_flow_count += ovn_sbctl.count_igmp_flows(lswitch['name'])
@@ -54,12 +54,20 @@ class OvnIGMP(ovn_network.OvnNetwork):
             time.sleep(0.5)
 
     def _install_mcast_tester(self, sandboxes, path):
+        # Name the source and binary after the source hash, so that each
+        # farm uploads and compiles a given tester only once.
+        digest = transport.file_digest(path)[:16]
+        source = '/tmp/mcast-tester-{}.c'.format(digest)
+        binary = '/tmp/mcast-tester-{}'.format(digest)
+
         for sandbox in sandboxes:
             ovs_ssh = self._get_conn(sandbox["name"])
-            ovs_ssh.ssh.put_file(path, '/tmp/test.c')
+            transport.put_file_cached(ovs_ssh.ssh, path, source)
 
         self._flush_conns(cmds=[
-            'gcc -lpthread -o /tmp/test /tmp/test.c'
+            'sh -c "test -x {b} || gcc -lpthread -o {b} {s}"'.format(
+                b=binary, s=source),
+            'ln -sf {} /tmp/test'.format(binary)
         ])
 
     def _build_config_testers(self, lswitches, ports, lports_per_lswitch,
@@ -147,8 +155,7 @@ class OvnIGMP(ovn_network.OvnNetwork):
                      mc_groups_per_network, test_dest_count, test_mcast_batch):
 
         # Avoid lazy connection creation:
-        ovn_sbctl = self.controller_client("ovn-sbctl")
-        ovn_sbctl.set_log_cmd(self.context.get("log_cmd", False))
+        ovn_sbctl = self._get_ovn_sb_controller(self.install_method)
 
         # Build configuration for each port for each iteration
         iterations = self._build_config_testers(lswitches, all_lports,
@@ -247,3 +254,6 @@ class OvnIGMP(ovn_network.OvnNetwork):
             LOG.info('Sleeping for a bit before cleaning up..')
             time.sleep(20)
             self._cleanup_mcast(lswitches, sandboxes)
+
+        self._report_ovsdb_stats()
+        self._report_ssh_pool_stats()
@@ -12,6 +12,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
 import netaddr
 import random
 import re
@@ -36,6 +37,8 @@ class OvnNorthbound(ovn.OvnScenario):
                                     lport_create_args,
                                     port_bind_args,
                                     create_mgmt_port)
+        self._report_ovsdb_stats()
+        self._report_ssh_pool_stats()
 
     @atomic.action_timer("ovn.create_or_update_network_policy_address_sets")
     def create_or_update_network_policy_address_sets(self, name, ipaddr,
@@ -244,6 +247,8 @@ class OvnNorthbound(ovn.OvnScenario):
                                     port_bind_args, ip_start_index,
                                     name_space_size, network_policy_size,
                                     create_acls)
+        self._report_ovsdb_stats()
+        self._report_ssh_pool_stats()
 
     @scenario.configure()
     def ovn_run_command(self, ext_cmd_args = {}):
@@ -268,9 +273,16 @@ class OvnNorthbound(ovn.OvnScenario):
                               background_opt)
 
         sandboxes = self.context.get("sandboxes", [])
-        for i in range(sandbox_size):
-            self.runFarmCmd(sandboxes[i], cmd, pid_opt, farm_pid_name,
-                            background_opt)
+        farm_sandboxes = collections.defaultdict(list)
+        for sandbox in sandboxes[:sandbox_size]:
+            farm_sandboxes[sandbox["farm"]].append(sandbox)
+
+        def _run_farm_cmds(farm, farm_sbs):
+            for sandbox in farm_sbs:
+                self.runFarmCmd(sandbox, cmd, pid_opt, farm_pid_name,
+                                background_opt)
+
+        self._run_on_farms("ovn.handle_cmd", _run_farm_cmds, farm_sandboxes)
 
     @scenario.configure(context={})
     def cleanup_routed_lswitches(self):
@@ -78,6 +78,8 @@ class OvnNetwork(ovn.OvnScenario):
         if (len(lports) < len(sandboxes)):
             LOG.warn("Number of ports less than chassis: random binding\n")
         self._bind_ports_and_wait(lports, sandboxes, port_bind_args)
+        self._report_ovsdb_stats()
+        self._report_ssh_pool_stats()
 
 
     @validation.number("ports_per_network", minval=1, integer_only=True)
@@ -115,6 +117,9 @@ class OvnNetwork(ovn.OvnScenario):
         if internal_ports_cleanup:
             self._cleanup_ovs_internal_ports(sandboxes)
 
+        self._report_ovsdb_stats()
+        self._report_ssh_pool_stats()
+
     def bind_ports(self):
         pass
 
@@ -20,6 +20,7 @@ from collections import defaultdict
 
 from rally import exceptions
 from rally_ovs.plugins.ovs import scenario
+from rally_ovs.plugins.ovs import utils
 from rally.task import atomic
 from rally.common import logging
 from rally.common import objects
@@ -88,6 +89,7 @@ class SandboxScenario(scenario.OvsScenario):
         info["sandboxes"] = sandboxes
         res.update({"info": info})
         res.save()
+        utils.invalidate_inventory()
 
 
     """
@@ -107,6 +109,7 @@ class SandboxScenario(scenario.OvsScenario):
         info["sandboxes"] = sandboxes
         res.update({"info": info})
         res.save()
+        utils.invalidate_inventory()
 
 
     @atomic.action_timer("sandbox.create_sandbox")
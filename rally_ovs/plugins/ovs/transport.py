@@ -0,0 +1,1193 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import base64
+import codecs
+import collections
+import contextlib
+import getpass
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+
+import six
+
+from rally.common import logging
+from rally.common import sshutils
+from rally import exceptions
+from rally_ovs.plugins.ovs.deployment.engines import get_script_path
+
+LOG = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_SIZE = 1
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_RETRY_BACKOFF = 0.5
+DEFAULT_BREAKER_TIMEOUT = 60
+# Cap on the exponential backoff between two SSH attempts, in seconds.
+MAX_RETRY_BACKOFF = 30
+
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+AGENT_SCRIPT = "rally-ovs-agent.py"
+AGENT_CMD = 'exec "$(command -v python3 || command -v python)" ' + AGENT_SCRIPT
+# Extra time given to the agent to report a command it killed on timeout.
+AGENT_TIMEOUT_MARGIN = 10
+
+# Scripts built by the clients start by sourcing the sandbox environment,
+# the agent sources it once and caches it.
+ENV_FILE_RE = re.compile(r"^\. (\S+)\n")
+
+DOCKER_EXEC_RE = re.compile(
+    r"^\s*(sudo\s+)?docker exec (?:-i )?(?!-)(\S+) (.+)$")
+# Characters the host shell would interpret in a "docker exec" line.
+SHELL_META_RE = re.compile(r"[\n|&;<>()$`\\*?\[\]{}~#!]")
+
+# Buffered command outputs past this many bytes are spooled to disk.
+SPOOL_MAX_SIZE = 1 << 20
+SPOOL_CHUNK_SIZE = 65536
+
+# Scripts sent compressed on stdin, unpacked by the remote shell.
+COMPRESSED_SCRIPT_CMD = 'eval "$(base64 -d | gzip -dc)"'
+
+# Run a script with its stdout buffered in a file, then send it flagged
+# "Z" and compressed if bigger than the threshold, or "P" and plain.
+COMPRESSED_OUTPUT_CMD = (
+    'O=$(mktemp) && {{ ( {script} ) > "$O"; R=$?; '
+    'if [ $(wc -c < "$O") -ge {threshold} ]; '
+    'then printf Z; gzip -c < "$O" | base64; '
+    'else printf P; cat "$O"; fi; rm -f "$O"; exit $R; }}')
+
+
+def credential_key(cred):
+    return (cred["user"], cred["host"], cred.get("port"), cred.get("key"))
+
+
+def is_local_credential(cred):
+    """Check if commands for `cred' can be run without SSH.
+
+    An explicit "transport" in the credential wins, otherwise loopback
+    hosts are considered local as long as the credential user is the user
+    running rally.
+    """
+    transport = cred.get("transport")
+    if transport:
+        return transport == "local"
+
+    return cred["host"] in LOCAL_HOSTS and cred["user"] == getpass.getuser()
+
+
+class PooledSSH(object):
+    """sshutils.SSH wrapper owned by SSHPool.
+
+    The wrapped connection is opened lazily by sshutils.SSH on first use
+    and kept open across scenario iterations until the pool evicts it.
+    """
+
+    def __init__(self, pool, key, ssh):
+        self.pool = pool
+        self.key = key
+        self.ssh = ssh
+        self.last_used = time.time()
+        # Commands and channel requests running on the connection.
+        self.users = 0
+
+    @property
+    def user(self):
+        return self.key[0]
+
+    @property
+    def host(self):
+        return self.key[1]
+
+    def is_connected(self):
+        return bool(self.ssh._client)
+
+    def run(self, cmd, stdin=None, stdout=None, stderr=None,
+            raise_on_error=True, timeout=3600):
+        self.pool.touch(self)
+        with self.pool.in_use(self):
+            return self._run_command(cmd, stdin, stdout, stderr,
+                                     raise_on_error, timeout)
+
+    def _run_command(self, cmd, stdin, stdout, stderr, raise_on_error,
+                     timeout):
+        threshold = self.pool.compress_threshold
+        if threshold and stdin is None and \
+                isinstance(cmd, six.string_types):
+            return self._run_compressed(cmd, threshold, stdout, stderr,
+                                        raise_on_error, timeout)
+        if not self.pool.retries_enabled():
+            return self.ssh.run(cmd, stdin=stdin, stdout=stdout,
+                                stderr=stderr, raise_on_error=raise_on_error,
+                                timeout=timeout)
+
+        if stdin is not None and not isinstance(stdin, six.string_types):
+            stdin = stdin.read()
+        exit_status, out, err = self._run_buffered(cmd, stdin, timeout)
+        with contextlib.closing(out):
+            _replay(out.chunks(), stdout)
+        return self._finish_run(cmd, exit_status, err, stderr,
+                                raise_on_error)
+
+    def _run_buffered(self, cmd, stdin, timeout):
+        """Run `cmd' with retries, return (exit_status, out, err).
+
+        Output is buffered so that a failed attempt doesn't leak partial
+        output to the caller: stdout in a _Spool, to replay to the caller
+        stream without holding big outputs in memory, stderr in a string.
+        """
+        def _run():
+            out = _Spool()
+            err = six.moves.StringIO()
+            try:
+                exit_status = self.ssh.run(cmd, stdin=stdin, stdout=out,
+                                           stderr=err, raise_on_error=False,
+                                           timeout=timeout)
+            except Exception:
+                out.close()
+                raise
+            return exit_status, out, err.getvalue()
+
+        return self._retry(_run)
+
+    def _retry(self, func, idempotent=False):
+        """Call `func', retrying the SSH failures as configured in the pool.
+
+        Only transport errors are retried, commands exiting with an error
+        and timeouts are not. Connection failures are retried for every
+        call since nothing ran yet, but a failure once `func' started is
+        retried only for idempotent calls: the command may have run
+        before its channel broke, and running a script twice could
+        duplicate its writes. Failures count towards the circuit breaker
+        of the host, and the time lost on failed attempts and backoff is
+        added to the retry time of the thread.
+        """
+        for attempt in itertools.count():
+            self.pool.check_breaker(self.host)
+            start = time.time()
+            started = False
+            try:
+                self.ssh._get_client()
+                started = True
+                result = func()
+            except exceptions.SSHTimeout:
+                raise
+            except Exception as e:
+                self.pool.count_failure(self.host)
+                if attempt >= self.pool.retries or \
+                        (started and not idempotent):
+                    raise
+                delay = random.uniform(0, min(
+                    self.pool.retry_backoff * 2 ** attempt, MAX_RETRY_BACKOFF))
+                LOG.warning("SSH to %s failed (%s), retrying in %.2fs" %
+                            (self.host, e, delay))
+                self._close_if_dead()
+                time.sleep(delay)
+                self.pool.count_retry(self.host, time.time() - start)
+                continue
+
+            self.pool.count_success(self.host)
+            return result
+
+    def _close_if_dead(self):
+        """Drop the connection only if its transport is gone.
+
+        Other threads may have commands in flight on the connection, a
+        failed channel alone is replaced on the next attempt.
+        """
+        client = self.ssh._client
+        if not client:
+            return
+        ssh_transport = client.get_transport()
+        if ssh_transport is None or not ssh_transport.is_active():
+            self.close()
+
+    def _finish_run(self, cmd, exit_status, err, stderr, raise_on_error):
+        if stderr is not None and err:
+            stderr.write(err)
+        if exit_status != 0 and raise_on_error:
+            details = "Command '%s' failed with exit_status %d." % (
+                cmd, exit_status)
+            if err:
+                details += " Last stderr data: '%s'." % err
+            raise exceptions.SSHError(details)
+        return exit_status
+
+    def _run_compressed(self, cmd, threshold, stdout, stderr,
+                        raise_on_error, timeout):
+        """Run `cmd', compressing the script and output past `threshold'.
+
+        Big scripts are sent gzipped on stdin instead of the command
+        line, and the remote shell gzips the output when it is big.
+        """
+        script, stdin = cmd, None
+        if len(cmd) >= threshold:
+            start = time.time()
+            data = cmd.encode("utf8")
+            stdin = base64.b64encode(gzip_compress(data)).decode("ascii")
+            self.pool.count_compressed(self.host, len(data), len(stdin),
+                                       time.time() - start)
+            script = COMPRESSED_SCRIPT_CMD
+
+        exit_status, out, err = self._run_buffered(
+            COMPRESSED_OUTPUT_CMD.format(script=script, threshold=threshold),
+            stdin, timeout)
+
+        with contextlib.closing(out):
+            if next(out.chunks(size=1), b"") == b"Z":
+                start = time.time()
+                sizes = {"raw": 0}
+
+                def _count(chunks):
+                    for chunk in chunks:
+                        sizes["raw"] += len(chunk)
+                        yield chunk
+
+                _replay(_count(gunzip_base64(out.chunks(offset=1))),
+                        stdout)
+                self.pool.count_compressed(self.host, sizes["raw"],
+                                           out.size(), time.time() - start)
+            else:
+                _replay(out.chunks(offset=1), stdout)
+
+        return self._finish_run(cmd, exit_status, err, stderr,
+                                raise_on_error)
+
+    def execute(self, cmd, stdin=None, timeout=3600):
+        self.pool.touch(self)
+        if stdin is not None and not isinstance(stdin, six.string_types):
+            stdin = stdin.read()
+        with self.pool.in_use(self):
+            return self._retry(
+                lambda: self.ssh.execute(cmd, stdin=stdin, timeout=timeout))
+
+    def put_file(self, localpath, remotepath, mode=None):
+        self.pool.touch(self)
+        with self.pool.in_use(self):
+            return self._retry(
+                lambda: self.ssh.put_file(localpath, remotepath, mode=mode),
+                idempotent=True)
+
+    def close(self):
+        if self.is_connected():
+            self.ssh.close()
+
+
+class LocalTransport(object):
+    """Run commands with a local shell instead of SSH.
+
+    Follows the sshutils.SSH run() contract, including raising SSHError on
+    failures, so clients don't care which transport they were given.
+    """
+
+    def __init__(self, cred):
+        self.host = cred["host"]
+        self.user = cred["user"]
+
+    def run(self, cmd, stdin=None, stdout=None, stderr=None,
+            raise_on_error=True, timeout=3600):
+        if isinstance(cmd, (list, tuple)):
+            cmd = " ".join(six.moves.shlex_quote(str(p)) for p in cmd)
+
+        if stdin is not None and not isinstance(stdin, six.string_types):
+            stdin = stdin.read()
+        if isinstance(stdin, six.text_type):
+            stdin = stdin.encode("utf8")
+
+        proc = subprocess.Popen(cmd, shell=True, executable="/bin/bash",
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, _kill)
+            timer.start()
+        try:
+            out, err = proc.communicate(stdin)
+        finally:
+            if timer:
+                timer.cancel()
+
+        if timed_out.is_set():
+            raise exceptions.SSHTimeout("Timeout executing command '%s' on "
+                                        "host %s" % (cmd, self.host))
+
+        if stdout is not None and out:
+            stdout.write(out.decode("utf8"))
+        if stderr is not None and err:
+            stderr.write(err.decode("utf8"))
+
+        if proc.returncode != 0 and raise_on_error:
+            details = "Command '%s' failed with exit_status %d." % (
+                cmd, proc.returncode)
+            if err:
+                details += " Last stderr data: '%s'." % err.decode("utf8")
+            raise exceptions.SSHError(details)
+        return proc.returncode
+
+    def execute(self, cmd, stdin=None, timeout=3600):
+        stdout = six.moves.StringIO()
+        stderr = six.moves.StringIO()
+        exit_status = self.run(cmd, stdin=stdin, stdout=stdout,
+                               stderr=stderr, raise_on_error=False,
+                               timeout=timeout)
+        return (exit_status, stdout.getvalue(), stderr.getvalue())
+
+    def put_file(self, localpath, remotepath, mode=None):
+        remotepath = os.path.expanduser(remotepath)
+        if os.path.abspath(localpath) != os.path.abspath(remotepath):
+            shutil.copyfile(localpath, remotepath)
+        if mode is None:
+            mode = 0o777 & os.stat(localpath).st_mode
+        os.chmod(remotepath, mode)
+
+    def close(self):
+        pass
+
+
+class _SSHChannel(object):
+    """Long-lived remote process reached over a pooled SSH connection."""
+
+    def __init__(self, ssh, cmd):
+        client = ssh._get_client()
+        self.session = client.get_transport().open_session()
+        self.session.exec_command(cmd)
+        self.stdin = self.session.makefile("wb")
+        self.stdout = self.session.makefile("rb")
+
+    def write(self, data):
+        self.stdin.write(data)
+        self.stdin.flush()
+
+    def readline(self):
+        return self.stdout.readline()
+
+    def read(self, size):
+        return self.stdout.read(size)
+
+    def abort(self):
+        self.session.close()
+
+    def close(self):
+        self.session.close()
+
+
+class _LocalChannel(object):
+    """Long-lived local process, same interface as _SSHChannel."""
+
+    def __init__(self, args):
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE)
+
+    def write(self, data):
+        self.proc.stdin.write(data)
+        self.proc.stdin.flush()
+
+    def readline(self):
+        return self.proc.stdout.readline()
+
+    def read(self, size):
+        return self.proc.stdout.read(size)
+
+    def abort(self):
+        self.proc.kill()
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except IOError:
+            pass
+        self.proc.wait()
+
+
+class _Watchdog(object):
+    """Abort `channel' when the `with' block lasts more than `timeout'."""
+
+    def __init__(self, channel, timeout):
+        self.fired = threading.Event()
+        self._timer = None
+        if timeout:
+            self._timer = threading.Timer(timeout, self._fire, [channel])
+            self._timer.daemon = True
+
+    def _fire(self, channel):
+        self.fired.set()
+        channel.abort()
+
+    def __enter__(self):
+        if self._timer:
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._timer:
+            self._timer.cancel()
+
+
+def _open_channel(conn, cmd):
+    """Start `cmd' on the host of `conn' (PooledSSH or LocalTransport)."""
+    if isinstance(conn, LocalTransport):
+        return _LocalChannel(["/bin/bash", "-c", cmd])
+    return _SSHChannel(conn.ssh, cmd)
+
+
+@contextlib.contextmanager
+def _in_use(conn):
+    """Keep the pool from evicting the connection of `conn' meanwhile."""
+    if isinstance(conn, LocalTransport):
+        yield
+    else:
+        with conn.pool.in_use(conn):
+            yield
+
+
+def _check_channel(conn, channel):
+    """Return `channel' if still usable, None if it must be reopened."""
+    if isinstance(conn, LocalTransport):
+        return channel
+    # The pool may have evicted the SSH connection the channel ran on.
+    if not conn.is_connected():
+        channel = None
+    conn.pool.touch(conn)
+    return channel
+
+
+class AgentTransport(object):
+    """Run commands through the rally-ovs-agent.py started on the host.
+
+    Agents are started on demand, one per concurrent caller, and kept in
+    a pool of idle channels; commands are then sent as JSON lines over
+    their stdin, so no remote shell is spawned for each of them. Every
+    result carries the remote execution time. A command output comes
+    whole in its JSON reply, so it is not streamed to the stdout given
+    to run().
+
+    :param conn: PooledSSH or LocalTransport used to reach the host
+    """
+
+    def __init__(self, cred, conn):
+        self.host = cred["host"]
+        self.conn = conn
+        self._lock = threading.Lock()
+        self._idle = []
+        self._next_id = 0
+        self.stats = {"commands": 0, "remote_duration": 0.0}
+
+    def _open_agent(self):
+        if isinstance(self.conn, LocalTransport):
+            return _LocalChannel(
+                [sys.executable, get_script_path(AGENT_SCRIPT)])
+        return _SSHChannel(self.conn.ssh, AGENT_CMD)
+
+    def _get_channel(self):
+        """Take an idle agent channel, or start a new agent."""
+        with self._lock:
+            while self._idle:
+                channel = _check_channel(self.conn, self._idle.pop())
+                if channel is not None:
+                    return channel
+        return self._open_agent()
+
+    def _put_channel(self, channel):
+        with self._lock:
+            self._idle.append(channel)
+
+    def run_batch(self, cmds, timeout=None):
+        """Run a batch of commands with a single agent round trip.
+
+        :param cmds: list of {"cmd": str, "env_file": str, "stdin": str,
+                     "timeout": float}
+        :param timeout: default timeout of the commands, in seconds; the
+                        agent kills a command running for longer
+        :returns: list of {"exit_status", "stdout", "stderr", "duration",
+                  "timed_out"}
+        """
+        cmds = [dict(cmd, timeout=cmd.get("timeout", timeout))
+                for cmd in cmds]
+        # Backstop in case the agent itself does not answer.
+        timeouts = [cmd["timeout"] for cmd in cmds]
+        backstop = None
+        if all(timeouts):
+            backstop = sum(timeouts) + AGENT_TIMEOUT_MARGIN
+
+        with self._lock:
+            self._next_id += 1
+            request = {"id": self._next_id, "cmds": cmds}
+
+        channel = self._get_channel()
+        watchdog = _Watchdog(channel, backstop)
+        try:
+            with _in_use(self.conn), watchdog:
+                channel.write((json.dumps(request) + "\n").encode("utf8"))
+                line = channel.readline()
+            if not line:
+                raise exceptions.SSHError("Agent on host %s exited" %
+                                          self.host)
+            results = json.loads(line.decode("utf8"))["results"]
+        except Exception:
+            channel.close()
+            if watchdog.fired.is_set():
+                raise exceptions.SSHTimeout(
+                    "Timeout waiting for agent on host %s" % self.host)
+            raise
+        self._put_channel(channel)
+
+        with self._lock:
+            self.stats["commands"] += len(results)
+            self.stats["remote_duration"] += sum(r["duration"]
+                                                 for r in results)
+        return results
+
+    def run(self, cmd, stdin=None, stdout=None, stderr=None,
+            raise_on_error=True, timeout=3600):
+        if isinstance(cmd, (list, tuple)):
+            cmd = " ".join(six.moves.shlex_quote(str(p)) for p in cmd)
+        if stdin is not None and not isinstance(stdin, six.string_types):
+            stdin = stdin.read()
+        if isinstance(stdin, six.binary_type):
+            stdin = stdin.decode("utf8")
+
+        env_file = None
+        match = ENV_FILE_RE.match(cmd)
+        if match:
+            env_file = match.group(1)
+            cmd = cmd[match.end():]
+
+        result = self.run_batch([{"cmd": cmd, "env_file": env_file,
+                                  "stdin": stdin}], timeout=timeout)[0]
+        LOG.debug("Agent on %s ran '%s' in %.3fs" % (self.host, cmd,
+                                                     result["duration"]))
+        if result.get("timed_out"):
+            raise exceptions.SSHTimeout(
+                "Timeout executing command '%s' on host %s" % (cmd,
+                                                               self.host))
+
+        if stdout is not None and result["stdout"]:
+            stdout.write(result["stdout"])
+        if stderr is not None and result["stderr"]:
+            stderr.write(result["stderr"])
+
+        exit_status = result["exit_status"]
+        if exit_status != 0 and raise_on_error:
+            details = "Command '%s' failed with exit_status %d." % (
+                cmd, exit_status)
+            if result["stderr"]:
+                details += " Last stderr data: '%s'." % result["stderr"]
+            raise exceptions.SSHError(details)
+        return exit_status
+
+    def execute(self, cmd, stdin=None, timeout=3600):
+        stdout = six.moves.StringIO()
+        stderr = six.moves.StringIO()
+        exit_status = self.run(cmd, stdin=stdin, stdout=stdout,
+                               stderr=stderr, raise_on_error=False,
+                               timeout=timeout)
+        return (exit_status, stdout.getvalue(), stderr.getvalue())
+
+    def put_file(self, localpath, remotepath, mode=None):
+        return self.conn.put_file(localpath, remotepath, mode=mode)
+
+    def close(self):
+        """Stop the idle agents; busy ones are kept until released."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for channel in idle:
+            channel.close()
+
+
+class DockerExecSession(object):
+    """Shell kept running in a container with "docker exec -i".
+
+    Commands are written to the shell stdin one at a time, so running a
+    command in the container does not pay for a new "docker exec" (and a
+    new SSH session) each time. Each command is followed by a marker line
+    carrying its exit status and the size of its stderr, which is captured
+    in a temporary file and sent after the marker.
+    """
+
+    def __init__(self, conn, container, sudo=False):
+        self.conn = conn
+        self.container = container
+        self.shell_cmd = "%sdocker exec -i %s sh" % ("sudo " if sudo else "",
+                                                      container)
+        self.marker = "__rally_ovs_%s__" % uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._channel = None
+
+    def _get_channel(self):
+        self._channel = _check_channel(self.conn, self._channel)
+        if self._channel is None:
+            self._channel = _open_channel(self.conn, self.shell_cmd)
+            self._channel.write(b'E=$(mktemp)\n')
+        return self._channel
+
+    def _script(self, cmd, stdin):
+        if stdin:
+            stdin = base64.b64encode(stdin.encode("utf8")).decode("ascii")
+            cmd = "printf %%s %s | base64 -d | ( %s )" % (stdin, cmd)
+        else:
+            cmd = "( %s ) < /dev/null" % cmd
+        return ('%s 2>"$E"; printf "\\n%s %%d %%d\\n" $? '
+                '$(wc -c < "$E"); cat "$E"\n' % (cmd, self.marker))
+
+    def _read(self, channel, size):
+        data = b""
+        while len(data) < size:
+            chunk = channel.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def execute(self, cmd, stdin=None, timeout=None):
+        """Run `cmd' in the container, return (exit_status, out, err).
+
+        Past `timeout' seconds the session is closed and SSHTimeout
+        raised.
+        """
+        marker = self.marker.encode("ascii")
+        with self._lock:
+            channel = self._get_channel()
+            watchdog = _Watchdog(channel, timeout)
+            try:
+                with _in_use(self.conn), watchdog:
+                    channel.write(self._script(cmd, stdin).encode("utf8"))
+                    lines = []
+                    while True:
+                        line = channel.readline()
+                        if not line:
+                            raise exceptions.SSHError(
+                                "docker exec session to %s exited" %
+                                self.container)
+                        if line.startswith(marker):
+                            break
+                        lines.append(line)
+                    exit_status, err_size = [int(v)
+                                             for v in line.split()[1:]]
+                    err = self._read(channel, err_size)
+            except Exception:
+                self.close()
+                if watchdog.fired.is_set():
+                    raise exceptions.SSHTimeout(
+                        "Timeout executing command '%s' in container %s" %
+                        (cmd, self.container))
+                raise
+
+        # Drop the newline printed before the marker.
+        out = b"".join(lines)[:-1]
+        return (exit_status, out.decode("utf8", "replace"),
+                err.decode("utf8", "replace"))
+
+    def close(self):
+        if self._channel is not None:
+            try:
+                self._channel.close()
+            finally:
+                self._channel = None
+
+
+class DockerExecTransport(object):
+    """Run "[sudo] docker exec <container> <argv>" in DockerExecSession.
+
+    Wraps the transport of a host running containers. A command that is
+    a single "docker exec" line with a plain argv goes to the session of
+    that container, shared by every client of the process. Anything the
+    host shell would interpret (pipes, redirections, expansions, several
+    lines) runs on the wrapped transport as before, so shell semantics
+    do not change.
+    """
+
+    def __init__(self, cred, conn):
+        self.cred = cred
+        self.host = cred["host"]
+        self.conn = conn
+
+    def _get_session(self, container, sudo):
+        base = self.conn
+        if isinstance(base, AgentTransport):
+            base = base.conn
+        return get_docker_session(self.cred, base, container, sudo)
+
+    @staticmethod
+    def _parse_exec(cmd):
+        """Return (container, sudo, argv) of a plain "docker exec" line."""
+        cmd = cmd.strip()
+        match = DOCKER_EXEC_RE.match(cmd)
+        if not match or SHELL_META_RE.search(cmd):
+            return None
+        try:
+            argv = shlex.split(match.group(3))
+        except ValueError:
+            return None
+        # "VAR=value cmd" is an assignment for sh, a command for docker.
+        if not argv or "=" in argv[0]:
+            return None
+        return match.group(2), bool(match.group(1)), argv
+
+    def run(self, cmd, stdin=None, stdout=None, stderr=None,
+            raise_on_error=True, timeout=3600):
+        if isinstance(cmd, (list, tuple)):
+            cmd = " ".join(six.moves.shlex_quote(str(p)) for p in cmd)
+
+        parsed = self._parse_exec(cmd) if stdin is None else None
+        if parsed is None:
+            return self.conn.run(cmd, stdin=stdin, stdout=stdout,
+                                 stderr=stderr,
+                                 raise_on_error=raise_on_error,
+                                 timeout=timeout)
+
+        container, sudo, argv = parsed
+        session = self._get_session(container, sudo)
+        exit_status, out, err = session.execute(
+            " ".join(six.moves.shlex_quote(arg) for arg in argv),
+            timeout=timeout)
+        if stdout is not None and out:
+            stdout.write(out)
+        if stderr is not None and err:
+            stderr.write(err)
+
+        if exit_status != 0 and raise_on_error:
+            raise exceptions.SSHError(
+                "Command '%s' failed with exit_status %d." % (cmd,
+                                                               exit_status))
+        return exit_status
+
+    def execute(self, cmd, stdin=None, timeout=3600):
+        stdout = six.moves.StringIO()
+        stderr = six.moves.StringIO()
+        exit_status = self.run(cmd, stdin=stdin, stdout=stdout,
+                               stderr=stderr, raise_on_error=False,
+                               timeout=timeout)
+        return (exit_status, stdout.getvalue(), stderr.getvalue())
+
+    def put_file(self, localpath, remotepath, mode=None):
+        return self.conn.put_file(localpath, remotepath, mode=mode)
+
+    def close(self):
+        self.conn.close()
+
+
+_retry_clock = threading.local()
+
+
+def get_retry_time():
+    """Seconds the calling thread lost on failed SSH attempts and backoff.
+
+    Timings can subtract the difference taken around an operation to
+    leave the retries out.
+    """
+    return getattr(_retry_clock, "seconds", 0.0)
+
+
+def add_retry_time(seconds):
+    _retry_clock.seconds = get_retry_time() + seconds
+
+
+def gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gunzip_base64(chunks):
+    """Decode base64 gzipped data arriving in `chunks', chunk by chunk."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    rest = b""
+    for chunk in chunks:
+        data = rest + b"".join(chunk.split())
+        end = len(data) - len(data) % 4
+        rest = data[end:]
+        if end:
+            yield decompressor.decompress(base64.b64decode(data[:end]))
+    yield decompressor.flush()
+
+
+class _Spool(object):
+    """stdout for run() keeping the output in a temporary file.
+
+    Outputs up to SPOOL_MAX_SIZE bytes stay in memory.
+    """
+
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode("utf8")
+        self.file.write(data)
+
+    def size(self):
+        self.file.seek(0, os.SEEK_END)
+        return self.file.tell()
+
+    def chunks(self, offset=0, size=None):
+        self.file.seek(offset)
+        while True:
+            chunk = self.file.read(size or SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def _replay(chunks, stream):
+    """Write the utf8 byte `chunks' to the text `stream' as they come."""
+    decoder = codecs.getincrementaldecoder("utf8")("replace")
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is None:
+            text = decoder.decode(b"", True)
+        else:
+            text = decoder.decode(chunk)
+        if text and stream is not None:
+            stream.write(text)
+
+
+class LineWriter(object):
+    """stdout for run() passing each output line to a callback.
+
+    Lines are handed over as the transport reads them, only the current
+    unterminated line is kept. close() passes it on at the end.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._partial = ""
+
+    def write(self, data):
+        if not data:
+            return
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self.callback(line)
+
+    def close(self):
+        if self._partial:
+            line, self._partial = self._partial, ""
+            self.callback(line)
+
+
+class LineCounter(object):
+    """stdout for run() counting output lines without keeping them."""
+
+    def __init__(self):
+        self.count = 0
+        self._unterminated = False
+
+    def write(self, data):
+        if not data:
+            return
+        self.count += data.count("\n")
+        self._unterminated = not data.endswith("\n")
+
+    def close(self):
+        if self._unterminated:
+            self.count += 1
+            self._unterminated = False
+
+
+class SSHPool(object):
+    """Process wide pool of SSH connections keyed by credential.
+
+    Clients are created for every scenario iteration, but the connections
+    handed out by the pool outlive them, so the SSH handshake is paid once
+    per host (and per pool slot) for the whole task.
+
+    :param size: max number of connections kept per credential, clients
+                 are spread over them in a round-robin fashion
+    :param idle_timeout: seconds after which an unused connection is
+                         closed, 0 disables eviction
+    :param compress_threshold: scripts and outputs of at least this many
+                               bytes are sent gzipped, 0 disables
+                               compression
+    :param retries: number of times an SSH transport failure is retried
+    :param retry_backoff: base of the exponential backoff between retries,
+                          in seconds, each delay is jittered
+    :param breaker_threshold: consecutive failures after which commands to
+                              a host fail fast, 0 disables the breaker
+    :param breaker_timeout: seconds a tripped breaker fails fast before
+                            letting an attempt through again
+    """
+
+    def __init__(self, size=DEFAULT_POOL_SIZE,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, compress_threshold=0,
+                 retries=0, retry_backoff=DEFAULT_RETRY_BACKOFF,
+                 breaker_threshold=0,
+                 breaker_timeout=DEFAULT_BREAKER_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.compress_threshold = compress_threshold
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_timeout = breaker_timeout
+        self._lock = threading.Lock()
+        self._conns = {}
+        self._next = collections.defaultdict(int)
+        self._stats = collections.defaultdict(
+            lambda: {"connects": 0, "reuses": 0, "evictions": 0})
+        self._compress_stats = collections.defaultdict(
+            lambda: {"raw_bytes": 0, "sent_bytes": 0, "cpu_time": 0.0})
+        self._retry_stats = collections.defaultdict(
+            lambda: {"failures": 0, "retries": 0, "breaker_trips": 0})
+        # host -> (consecutive failures, time the breaker tripped)
+        self._breakers = {}
+
+    def configure(self, size=None, idle_timeout=None,
+                  compress_threshold=None, retries=None, retry_backoff=None,
+                  breaker_threshold=None, breaker_timeout=None):
+        with self._lock:
+            if size is not None:
+                self.size = size
+            if idle_timeout is not None:
+                self.idle_timeout = idle_timeout
+            if compress_threshold is not None:
+                self.compress_threshold = compress_threshold
+            if retries is not None:
+                self.retries = retries
+            if retry_backoff is not None:
+                self.retry_backoff = retry_backoff
+            if breaker_threshold is not None:
+                self.breaker_threshold = breaker_threshold
+            if breaker_timeout is not None:
+                self.breaker_timeout = breaker_timeout
+
+    def retries_enabled(self):
+        return bool(self.retries or self.breaker_threshold)
+
+    def check_breaker(self, host):
+        """Raise SSHError if the breaker of `host' is tripped."""
+        with self._lock:
+            failures, tripped = self._breakers.get(host, (0, None))
+            if tripped is None:
+                return
+            if time.time() - tripped < self.breaker_timeout:
+                raise exceptions.SSHError(
+                    "Not connecting to %s for %ds after %d consecutive "
+                    "failures" % (host, self.breaker_timeout, failures))
+            # Let one attempt through, its failure trips the breaker again.
+            self._breakers[host] = (self.breaker_threshold - 1, None)
+
+    def count_failure(self, host):
+        with self._lock:
+            self._retry_stats[host]["failures"] += 1
+            failures = self._breakers.get(host, (0, None))[0] + 1
+            tripped = None
+            if self.breaker_threshold and \
+                    failures >= self.breaker_threshold:
+                LOG.warning("Too many SSH failures on %s, failing fast "
+                            "for %ds" % (host, self.breaker_timeout))
+                self._retry_stats[host]["breaker_trips"] += 1
+                tripped = time.time()
+            self._breakers[host] = (failures, tripped)
+
+    def count_success(self, host):
+        with self._lock:
+            self._breakers.pop(host, None)
+
+    def count_retry(self, host, seconds):
+        add_retry_time(seconds)
+        with self._lock:
+            self._retry_stats[host]["retries"] += 1
+
+    def get_retry_stats(self):
+        """Return a copy of the per host failure and retry counters."""
+        with self._lock:
+            return {host: dict(stats)
+                    for host, stats in self._retry_stats.items()}
+
+    def get(self, cred):
+        key = credential_key(cred)
+
+        with self._lock:
+            self._evict_idle()
+
+            conns = self._conns.setdefault(key, [])
+            if len(conns) < self.size:
+                ssh = sshutils.SSH(cred["user"], cred["host"],
+                                   port=cred["port"],
+                                   key_filename=cred["key"],
+                                   password=cred["password"])
+                conn = PooledSSH(self, key, ssh)
+                conns.append(conn)
+                return conn
+
+            idx = self._next[key] % len(conns)
+            self._next[key] = idx + 1
+            return conns[idx]
+
+    def touch(self, conn):
+        with self._lock:
+            stats = self._stats[conn.host]
+            if conn.is_connected():
+                stats["reuses"] += 1
+            else:
+                stats["connects"] += 1
+            conn.last_used = time.time()
+
+    @contextlib.contextmanager
+    def in_use(self, conn):
+        """Keep `conn' from being evicted while the block runs on it."""
+        with self._lock:
+            conn.users += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                conn.users -= 1
+                conn.last_used = time.time()
+
+    def _evict_idle(self):
+        """Close the connections idle for longer than idle_timeout.
+
+        A connection running a command is never idle, however long ago
+        the command started.
+        """
+        if not self.idle_timeout:
+            return
+
+        deadline = time.time() - self.idle_timeout
+        for conns in self._conns.values():
+            for conn in conns:
+                if conn.users == 0 and conn.last_used < deadline and \
+                        conn.is_connected():
+                    LOG.debug("Evict idle ssh connection to %s" % conn.host)
+                    conn.close()
+                    self._stats[conn.host]["evictions"] += 1
+
+    def get_stats(self):
+        """Return a copy of the per host counters."""
+        with self._lock:
+            return {host: dict(stats)
+                    for host, stats in self._stats.items()}
+
+    def get_totals(self):
+        totals = {"connects": 0, "reuses": 0, "evictions": 0}
+        for stats in self.get_stats().values():
+            for k, v in stats.items():
+                totals[k] += v
+        return totals
+
+    def count_compressed(self, host, raw_bytes, sent_bytes, cpu_time):
+        with self._lock:
+            stats = self._compress_stats[host]
+            stats["raw_bytes"] += raw_bytes
+            stats["sent_bytes"] += sent_bytes
+            stats["cpu_time"] += cpu_time
+
+    def get_compress_totals(self):
+        """Return the bytes saved and local CPU seconds spent compressing."""
+        with self._lock:
+            stats = list(self._compress_stats.values())
+        return {"saved_bytes": sum(s["raw_bytes"] - s["sent_bytes"]
+                                   for s in stats),
+                "cpu_time": sum(s["cpu_time"] for s in stats)}
+
+    def clear(self):
+        with self._lock:
+            for conns in self._conns.values():
+                for conn in conns:
+                    conn.close()
+            self._conns = {}
+            self._next.clear()
+
+
+_pool = SSHPool()
+_agents = {}
+_agents_lock = threading.Lock()
+_docker_sessions = {}
+_uploads = {}
+_uploads_lock = threading.Lock()
+
+
+def get_pool():
+    return _pool
+
+
+def get_agent(cred, conn):
+    """Return the agent transport of `cred', shared by the process."""
+    key = credential_key(cred)
+    with _agents_lock:
+        if key not in _agents:
+            _agents[key] = AgentTransport(cred, conn)
+        return _agents[key]
+
+
+def get_docker_session(cred, conn, container, sudo=False):
+    """Return the exec session to `container' on the host of `cred'."""
+    key = credential_key(cred) + (container,)
+    with _agents_lock:
+        if key not in _docker_sessions:
+            _docker_sessions[key] = DockerExecSession(conn, container, sudo)
+        return _docker_sessions[key]
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of the local file `path'."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def put_file_cached(conn, localpath, remotepath, mode=None):
+    """Upload `localpath' unless `remotepath' already has its content.
+
+    Files uploaded by the process are remembered per host, with the mode
+    they were given, otherwise the sha256 of the remote file is checked
+    first. `mode' is applied even when the content was up to date.
+    Return True if the file was uploaded.
+
+    :param conn: any transport, or sshutils.SSH, with execute/put_file
+    """
+    digest = file_digest(localpath)
+    key = (conn.host, getattr(conn, "user", None), remotepath)
+    with _uploads_lock:
+        if _uploads.get(key) == (digest, mode):
+            return False
+
+    exit_status, out, _ = conn.execute(
+        "sha256sum %s" % six.moves.shlex_quote(remotepath))
+    uploaded = exit_status != 0 or out.split()[:1] != [digest]
+    if uploaded:
+        LOG.debug("Upload %s to %s:%s" % (localpath, conn.host, remotepath))
+        conn.put_file(localpath, remotepath)
+    if mode:
+        conn.run("chmod %s %s" % (mode, six.moves.shlex_quote(remotepath)))
+
+    with _uploads_lock:
+        _uploads[key] = (digest, mode)
+    return uploaded
@@ -12,19 +12,49 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import bisect
+import collections
+import hashlib
+import math
+import multiprocessing
+import os
 import random
+import socket
+import struct
+import sys
+import threading
+import time
 import netaddr
 import six
 
+from multiprocessing.pool import ThreadPool
+
 from consts import ResourceType
-from rally.common import sshutils
 from rally.common import objects
-from rally.common import utils
 
 from rally.common import db
+from rally import exceptions
+from rally_ovs.plugins.ovs import records
+from rally_ovs.plugins.ovs import transport
+
+
+# Counters in shared memory, inherited by the runner processes forked
+# after import: what is reserved from them never overlaps.
+_cidr_counter = multiprocessing.Value("I", 0)
+_mac_counter = multiprocessing.Value("I", 0)
+
+# MAC addresses reserved at once by a process, out of the 2^24 of a task.
+MAC_BLOCK_SIZE = 1024
+MAC_SPACE = 1 << 24
 
+_mac_allocators = {}
+_mac_allocators_lock = threading.Lock()
 
-cidr_incr = utils.RAMInt()
+# Bumped when sandboxes are created or deleted, so that the inventory
+# cached by each runner process is read again.
+_inventory_generation = multiprocessing.Value("I", 0)
+_inventory = None
+_inventory_lock = threading.Lock()
 
 
 '''
@@ -46,11 +76,16 @@ def get_credential_from_resource(deployment):
 
 
 def get_ssh_from_credential(cred):
-    sshcli = sshutils.SSH(cred["user"], cred["host"],
-                       port = cred["port"],
-                       key_filename = cred["key"],
-                       password = cred["password"])
-    return sshcli
+    if transport.is_local_credential(cred):
+        conn = transport.LocalTransport(cred)
+    else:
+        conn = transport.get_pool().get(cred)
+
+    if cred.get("agent"):
+        conn = transport.get_agent(cred, conn)
+    if cred.get("docker_exec_sessions"):
+        conn = transport.DockerExecTransport(cred, conn)
+    return conn
 
 
 def get_ssh_client_from_deployment(deployment):
@@ -71,29 +106,278 @@ def get_random_sandbox(sandboxes):
 
 
 
-def get_random_mac(base_mac):
-    mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-           int(base_mac[2], 16), random.randint(0x00, 0xff),
-           random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-    if base_mac[3] != '00':
-        mac[3] = int(base_mac[3], 16)
-    return ':'.join(["%02x" % x for x in mac])
-
-
-
 def generate_cidr(start_cidr="10.2.0.0/24"):
     """Generate next CIDR for network or subnet, without IP overlapping.
 
-    This is process and thread safe, because `cidr_incr' points to
-    value stored directly in RAM. This guarantees that CIDRs will be
-    serial and unique even under hard multiprocessing/threading load.
-
     :param start_cidr: start CIDR str
     :returns: next available CIDR str
     """
-    cidr = str(netaddr.IPNetwork(start_cidr).next(next(cidr_incr)))
-    return cidr
+    return generate_cidrs(start_cidr, 1)[0]
+
+
+def generate_cidrs(start_cidr, count):
+    """Reserve `count' consecutive CIDRs following `start_cidr'.
+
+    The reservation is a single step on a counter in shared memory, so
+    CIDRs are serial and unique even across the runner processes.
+
+    :returns: list of CIDR str
+    """
+    network = netaddr.IPNetwork(start_cidr)
+    first = _reserve(_cidr_counter, count)
+    return [str(network.next(first + i)) for i in six.moves.range(count)]
+
+
+def _reserve(counter, count):
+    with counter.get_lock():
+        start = counter.value
+        counter.value += count
+    return start
+
+
+def ip_range(first, count):
+    """Return `count' consecutive addresses from netaddr.IPAddress `first'."""
+    start = int(first)
+    if first.version == 4:
+        return [socket.inet_ntoa(struct.pack("!I", start + i))
+                for i in six.moves.range(count)]
+    return [str(netaddr.IPAddress(start + i, 6))
+            for i in six.moves.range(count)]
+
 
+def format_mac(value):
+    digits = "%012x" % value
+    return ":".join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+def mac_prefix(task_uuid):
+    """Return the three first bytes of the MACs of a task, as an int."""
+    groups = task_uuid.split("-")
+    return ((int(groups[0][:2], 16) & 0xfe) << 16 |
+            int(groups[1][:2], 16) << 8 | int(groups[2][:2], 16))
+
+
+class MacAllocator(object):
+    """Hand out MAC addresses unique within a task.
+
+    The task uuid gives the three first bytes and the three last ones
+    count up, so unlike random picks they never collide. Counter values
+    are reserved MAC_BLOCK_SIZE at a time from a counter shared by the
+    runner processes, then used up with integer math.
+    """
+
+    def __init__(self, task_uuid):
+        self.prefix = mac_prefix(task_uuid) << 24
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = self._end = 0
+
+    def allocate(self, count=1):
+        macs = []
+        with self._lock:
+            if self._pid != os.getpid():
+                # The rest of a block reserved before a fork belongs to
+                # the parent process.
+                self._pid = os.getpid()
+                self._next = self._end = 0
+
+            while len(macs) < count:
+                if self._next == self._end:
+                    self._next = _reserve(_mac_counter, MAC_BLOCK_SIZE)
+                    self._end = self._next + MAC_BLOCK_SIZE
+                    if self._end > MAC_SPACE:
+                        raise exceptions.RallyException(
+                            "MAC addresses of task exhausted")
+                n = min(count - len(macs), self._end - self._next)
+                macs += [format_mac(self.prefix | i)
+                         for i in six.moves.range(self._next,
+                                                  self._next + n)]
+                self._next += n
+        return macs
+
+
+def get_mac_allocator(task_uuid):
+    with _mac_allocators_lock:
+        allocator = _mac_allocators.get(task_uuid)
+        if allocator is None:
+            allocator = _mac_allocators[task_uuid] = MacAllocator(task_uuid)
+    return allocator
+
+
+# Linux limit for a single argument, and so for the script passed to the
+# remote shell with "sh -c".
+MAX_ARG_STRLEN = 131072
+# Room left for the environment and for the command prefix.
+CMD_SIZE_MARGIN = 8192
+
+_cmd_size_limits = {}
+
+
+def get_cmd_size_limit(ssh):
+    """Return the longest command line that can be run through `ssh'.
+
+    The limit is probed with "getconf ARG_MAX" once per host.
+    """
+    if ssh.host not in _cmd_size_limits:
+        try:
+            arg_max = int(ssh.execute("getconf ARG_MAX")[1])
+        except (ValueError, exceptions.SSHError):
+            arg_max = MAX_ARG_STRLEN
+        _cmd_size_limits[ssh.host] = min(arg_max,
+                                         MAX_ARG_STRLEN) - CMD_SIZE_MARGIN
+    return _cmd_size_limits[ssh.host]
+
+
+def split_cmds(cmds, limit, sep=" "):
+    """Split `cmds' in the fewest consecutive chunks that, joined with
+    `sep', are at most `limit' bytes long.
+
+    A command longer than `limit' is left alone in its chunk.
+    """
+    chunks = []
+    chunk = []
+    size = 0
+    for cmd in cmds:
+        cmd_size = len(cmd.encode("utf8")) + len(sep)
+        if chunk and size + cmd_size > limit:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(cmd)
+        size += cmd_size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+class BatchFlusher(object):
+    """Flush a client in batch mode every `batch' objects.
+
+    With batch "auto" the flush size is tuned after every full batch by
+    hill climbing on the measured throughput (objects per second of flush
+    time): keep growing or shrinking while throughput improves, turn back
+    when it drops. Sizes stay within [batch_min, batch_max] and are
+    shrunk whenever a flush takes longer than batch_max_latency.
+
+    :param args: create args holding "batch" and the optional
+                 "batch_min", "batch_max", "batch_max_latency" settings
+    :param default: batch size used when args has no "batch"
+    """
+
+    STEP = 1.5
+
+    def __init__(self, client, args, default):
+        self.client = client
+        batch = args.get("batch", default)
+        self.auto = batch == "auto"
+        self.count = 0
+        self.sizes = []
+
+        if self.auto:
+            self.min = args.get("batch_min", 1)
+            self.max = max(args.get("batch_max", 1024), self.min)
+            self.max_latency = args.get("batch_max_latency")
+            self.size = min(max(16, self.min), self.max)
+            self.direction = 1
+            self.last_throughput = None
+        else:
+            self.size = batch
+
+    def step(self):
+        """Count one more object, flush when the batch is full."""
+        self.count += 1
+        if self.count >= self.size:
+            self.flush()
+
+    def flush(self):
+        count, self.count = self.count, 0
+        start = time.time()
+        self.client.flush()
+        latency = time.time() - start
+
+        if self.auto and count:
+            self.sizes.append(count)
+            # A partial batch, the last one, says nothing about its size.
+            if count >= self.size:
+                self._adapt(count, latency)
+
+    def finish(self):
+        """Flush the last batch and wait until every batch is written."""
+        self.flush()
+        self.client.barrier()
+
+    def _adapt(self, count, latency):
+        throughput = count / max(latency, 1e-6)
+        if self.max_latency and latency > self.max_latency:
+            self.direction = -1
+        elif (self.last_throughput is not None and
+              throughput < self.last_throughput):
+            self.direction = -self.direction
+        self.last_throughput = throughput
+
+        if self.direction > 0:
+            size = int(math.ceil(self.size * self.STEP))
+        else:
+            size = int(self.size / self.STEP)
+        self.size = min(max(size, self.min), self.max)
+
+
+class HashRing(object):
+    """Consistent hashing of keys over a list of nodes."""
+
+    def __init__(self, nodes, replicas=64):
+        self._ring = sorted((self._hash("%s-%d" % (node, i)), node)
+                            for node in nodes for i in range(replicas))
+        self._hashes = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(str(key).encode("utf8")).hexdigest()[:8], 16)
+
+    def get(self, key):
+        idx = bisect.bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[idx][1]
+
+
+def run_in_parallel(func, args_list, concurrency):
+    """Call `func' on every element of `args_list' from up to `concurrency'
+    threads.
+
+    :returns: a list of (result, duration) tuples, in `args_list' order. If
+              any call raised, the first exception is re-raised once every
+              call has completed. Durations leave out the time spent
+              retrying SSH commands, see transport.get_retry_time().
+    """
+    def _timed_call(arg):
+        start = time.time()
+        retry_start = transport.get_retry_time()
+        try:
+            result, exc_info = func(arg), None
+        except Exception:
+            result, exc_info = None, sys.exc_info()
+        retry_time = transport.get_retry_time() - retry_start
+        return result, exc_info, time.time() - start - retry_time, retry_time
+
+    if concurrency <= 1 or len(args_list) <= 1:
+        results = [_timed_call(arg) for arg in args_list]
+    else:
+        pool = ThreadPool(min(concurrency, len(args_list)))
+        try:
+            results = pool.map(_timed_call, args_list)
+        finally:
+            pool.close()
+            pool.join()
+
+        # The slowest call set the pace, charge its retries to the caller.
+        if results:
+            slowest = max(results, key=lambda r: r[2] + r[3])
+            transport.add_retry_time(slowest[3])
+
+    for _, exc_info, _, _ in results:
+        if exc_info:
+            six.reraise(*exc_info)
+
+    return [(result, duration) for result, _, duration, _ in results]
 
 
 
@@ -108,46 +392,87 @@ def py_to_val(pyval):
 
 
 
-def get_farm_nodes(deploy_uuid):
-    deployments = db.deployment_list(parent_uuid=deploy_uuid)
+class Inventory(object):
+    """Farm deployments of a multihost deployment and their sandboxes.
 
-    farm_nodes = []
-    for dep in deployments:
-        res = db.resource_get_all(dep["uuid"], type=ResourceType.SANDBOXES)
-        if len(res) == 0 or len(res[0].info["sandboxes"]) == 0:
-            continue
+    The database is read once, with one resource query per deployment,
+    and sandboxes are indexed by farm and by tag. The sandbox helpers
+    call invalidate_inventory() when they change the sandbox resources.
+    """
 
-        farm_nodes.append(res[0].info["farm"])
+    def __init__(self, deploy_uuid):
+        self.deploy_uuid = deploy_uuid
+        self.generation = None
+        # [{"name": ..., "config": ..., "credential": ...}, ...]
+        self.deployments = []
+        self._farms = collections.OrderedDict()
+        self._tags = collections.defaultdict(list)
+
+    def load(self):
+        for dep in db.deployment_list(parent_uuid=self.deploy_uuid):
+            resources = collections.defaultdict(list)
+            for res in db.resource_get_all(dep["uuid"]):
+                resources[res["type"]].append(res)
+
+            credentials = resources[ResourceType.CREDENTIAL]
+            self.deployments.append({
+                "name": dep["name"], "config": dep["config"],
+                "credential": credentials[0]["info"] if credentials else None,
+            })
+
+            sandboxes = resources[ResourceType.SANDBOXES]
+            if not sandboxes or not sandboxes[0]["info"]["sandboxes"]:
+                continue
 
-    return farm_nodes
+            info = sandboxes[0]["info"]
+            farm = self._farms.setdefault(info["farm"], [])
+            for name, tag in six.iteritems(info["sandboxes"]):
+                sandbox = records.Sandbox(name, tag, info["farm"],
+                                          info["host_container"])
+                farm.append(sandbox)
+                self._tags[tag].append(sandbox)
+
+    def farm_nodes(self):
+        return list(self._farms)
+
+    def sandboxes(self, farm="", tag=None):
+        """Return the sandboxes of `farm' with `tag', any if unset."""
+        if farm:
+            sandboxes = self._farms.get(farm, [])
+            if tag is not None:
+                sandboxes = [sb for sb in sandboxes if sb["tag"] == tag]
+            return list(sandboxes)
+        if tag is not None:
+            return list(self._tags.get(tag, []))
+        return [sb for sandboxes in six.itervalues(self._farms)
+                for sb in sandboxes]
+
+
+def get_inventory(deploy_uuid):
+    """Return the inventory of a deployment, loading it if needed."""
+    global _inventory
+    with _inventory_lock:
+        generation = _inventory_generation.value
+        if (_inventory is None or _inventory.deploy_uuid != deploy_uuid or
+                _inventory.generation != generation):
+            _inventory = Inventory(deploy_uuid)
+            _inventory.load()
+            _inventory.generation = generation
+        return _inventory
+
+
+def invalidate_inventory():
+    """Make every process read the inventory again on its next use."""
+    with _inventory_generation.get_lock():
+        _inventory_generation.value += 1
 
 
+def get_farm_nodes(deploy_uuid):
+    return get_inventory(deploy_uuid).farm_nodes()
 
 
 def get_sandboxes(deploy_uuid, farm="", tag=""):
-
-    sandboxes = []
-    deployments = db.deployment_list(parent_uuid=deploy_uuid)
-    for dep in deployments:
-        res = db.resource_get_all(dep["uuid"], type=ResourceType.SANDBOXES)
-        if len(res) == 0 or len(res[0].info["sandboxes"]) == 0:
-            continue
-
-        info = res[0].info
-
-        if farm and farm != info["farm"]:
-            continue
-
-        for k,v in six.iteritems(info["sandboxes"]):
-            if tag and tag != v:
-                continue
-
-            sandbox = {"name": k, "tag": v, "farm": info["farm"],
-                       "host_container": info["host_container"]}
-            sandboxes.append(sandbox)
-
-
-    return sandboxes
+    return get_inventory(deploy_uuid).sandboxes(farm, tag or None)
 
 
 
@@ -239,8 +239,9 @@ class DatapathTestCase(test.TestCase):
         def fake_lrouter_port_add(name, *args, **kwargs):
             router_port_count[name] += 1
 
-        def fake_lswitch_port_add(name, *args, **kwargs):
+        def fake_lswitch_port_add(name, port_name, *args, **kwargs):
             switch_port_count[name] += 1
+            return {"name": port_name}
 
         mock_client.lrouter_port_add = fake_lrouter_port_add
         mock_client.lswitch_port_add = fake_lswitch_port_add
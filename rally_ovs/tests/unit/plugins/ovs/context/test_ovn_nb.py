@@ -15,31 +15,85 @@
 import mock
 
 from rally_ovs.plugins.ovs.context import ovn_nb
+from rally_ovs.plugins.ovs import ovnclients
+from rally_ovs.plugins.ovs import records
 from rally_ovs.tests.unit.plugins.ovs import utils
 from tests.unit import test
 
+
+@mock.patch.object(ovnclients, "_nb_topology", None)
+@mock.patch("rally_ovs.plugins.ovs.ovsclients_impl.OvnNbctl.create_client")
 class OvnNorthboundContextTestCase(test.TestCase):
 
-    @mock.patch("rally_ovs.plugins.ovs.ovsclients_impl.OvnNbctl.create_client")
+    ovn_nbctl_show_output = [
+        records.LSwitch("lswitch_c52f4c_xFG42O",
+                        "48732e5d-b018-4bad-a1b6-8dbc762f4126", "",
+                        [records.LPort("lport_c52f4c_LXzXCE"),
+                         records.LPort("lport_c52f4c_dkZSDg")]),
+        records.LSwitch("lswitch_c52f4c_Rv0Jcj",
+                        "7f55c582-c007-4fba-810d-a14ead480851", "",
+                        [records.LPort("lport_c52f4c_cm8SIf"),
+                         records.LPort("lport_c52f4c_8h7hn2")]),
+    ]
+
     def test_setup(self, mock_create_client):
-        ovn_nbctl_show_output = """\
-switch 48732e5d-b018-4bad-a1b6-8dbc762f4126 (lswitch_c52f4c_xFG42O)
-    port lport_c52f4c_LXzXCE
-    port lport_c52f4c_dkZSDg
-switch 7f55c582-c007-4fba-810d-a14ead480851 (lswitch_c52f4c_Rv0Jcj)
-    port lport_c52f4c_cm8SIf
-    port lport_c52f4c_8h7hn2
-switch 9fea76cf-d73e-4dc8-a2a3-1e98b9d8eab0 (lswitch_c52f4c_T0m6Ce)
-    port lport_c52f4c_X3px3u
-    port lport_c52f4c_92dhqb
-"""
         mock_client = mock_create_client.return_value
-        mock_client.show.return_value = ovn_nbctl_show_output
+        mock_client.show.return_value = self.ovn_nbctl_show_output
 
         context = utils.get_fake_context(ovn_nb={})
         nb_context = ovn_nb.OvnNorthboundContext(context)
         nb_context.setup()
 
-        expected_setup_output = ovn_nbctl_show_output
+        expected_setup_output = self.ovn_nbctl_show_output
         actual_setup_output = nb_context.context["ovn-nb"]
         self.assertEqual(expected_setup_output, actual_setup_output)
+
+    def test_setup_reuses_topology(self, mock_create_client):
+        mock_client = mock_create_client.return_value
+        mock_client.show.return_value = self.ovn_nbctl_show_output
+
+        first_context = ovn_nb.OvnNorthboundContext(
+            utils.get_fake_context(ovn_nb={}))
+        first_context.setup()
+        topology = first_context._get_nb_topology()
+        topology.remove_lports([records.LPort("lport_c52f4c_LXzXCE")])
+        topology.add_lswitches([records.LSwitch("lswitch_c52f4c_T0m6Ce")])
+
+        nb_context = ovn_nb.OvnNorthboundContext(
+            utils.get_fake_context(
+                ovn_nb={"lswitch_prefix": "lswitch_c52f4c_xF"}))
+        nb_context.setup()
+
+        self.assertEqual(1, mock_client.show.call_count)
+        self.assertEqual(
+            [records.LSwitch("lswitch_c52f4c_xFG42O",
+                             "48732e5d-b018-4bad-a1b6-8dbc762f4126", "",
+                             [records.LPort("lport_c52f4c_dkZSDg")])],
+            nb_context.context["ovn-nb"])
+        self.assertEqual(3, len(topology.get_lswitches()))
+
+    def test_setup_reloads_topology_changed_by_runner(self,
+                                                      mock_create_client):
+        mock_client = mock_create_client.return_value
+        mock_client.show.return_value = self.ovn_nbctl_show_output
+
+        first_context = ovn_nb.OvnNorthboundContext(
+            utils.get_fake_context(ovn_nb={}))
+        first_context.setup()
+        topology = first_context._get_nb_topology()
+
+        # A runner process forked from this one deletes a switch from its
+        # copy of the topology.
+        with mock.patch.object(ovnclients.os, "getpid", return_value=-1):
+            topology.remove_lswitches([records.LSwitch(
+                "lswitch_c52f4c_xFG42O")])
+        self.assertFalse(topology.is_current())
+        mock_client.show.return_value = self.ovn_nbctl_show_output[1:]
+
+        nb_context = ovn_nb.OvnNorthboundContext(
+            utils.get_fake_context(ovn_nb={}))
+        nb_context.setup()
+
+        self.assertEqual(2, mock_client.show.call_count)
+        self.assertEqual(self.ovn_nbctl_show_output[1:],
+                         nb_context.context["ovn-nb"])
@@ -0,0 +1,55 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import mock
+
+from rally import exceptions
+from rally_ovs.plugins.ovs.context import ovn_warmup
+from rally_ovs.tests.unit.plugins.ovs import utils
+from tests.unit import test
+
+
+@mock.patch("rally_ovs.plugins.ovs.ovsclients_impl.OvsVsctl.create_client")
+@mock.patch("rally_ovs.plugins.ovs.ovsclients_impl.OvnNbctl.create_client")
+@mock.patch("rally_ovs.plugins.ovs.ovsclients_impl.SshClient.create_client")
+class OvnWarmupTestCase(test.TestCase):
+
+    def _get_context(self):
+        context = utils.get_fake_context(ovn_warmup={"probe_timeout": 5})
+        # Probe one host at a time, mocks do not count calls atomically.
+        context["ovn_multihost"]["farm_concurrency"] = 1
+        context["controller"] = {"host_container": None}
+        context["sandboxes"] = [
+            {"name": "sb-0", "farm": "fake-farm-node-0",
+             "host_container": None},
+            {"name": "sb-1", "farm": "fake-farm-node-0",
+             "host_container": None},
+        ]
+        return context
+
+    def test_setup(self, mock_ssh, mock_nbctl, mock_vsctl):
+        warmup = ovn_warmup.OvnWarmup(self._get_context())
+        warmup.setup()
+
+        self.assertEqual([mock.call("true", timeout=5)] * 2,
+                         mock_ssh.return_value.run.call_args_list)
+        self.assertEqual("get", mock_nbctl.return_value.run.call_args[0][0])
+        self.assertEqual(2, mock_vsctl.return_value.run.call_count)
+
+    def test_setup_unreachable(self, mock_ssh, mock_nbctl, mock_vsctl):
+        mock_ssh.return_value.run.side_effect = exceptions.SSHError(
+            "Connection refused")
+        warmup = ovn_warmup.OvnWarmup(self._get_context())
+
+        self.assertRaises(exceptions.ContextSetupFailure, warmup.setup)
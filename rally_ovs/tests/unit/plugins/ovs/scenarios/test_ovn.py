@@ -0,0 +1,84 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import mock
+
+from rally_ovs.plugins.ovs.scenarios import ovn
+from rally_ovs.tests.unit.plugins.ovs import utils
+from tests.unit import test
+
+
+class OvnScenarioTestCase(test.TestCase):
+
+    def setUp(self):
+        super(OvnScenarioTestCase, self).setUp()
+        self.scenario = ovn.OvnScenario(utils.get_fake_context())
+        self.ovn_nbctl = mock.Mock()
+        patcher = mock.patch.object(self.scenario, "_get_ovn_controller",
+                                    return_value=self.ovn_nbctl)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _check_two_reads(self, table, column, child_table):
+        reads = self.ovn_nbctl.get_many.call_args_list
+        self.assertEqual(2, len(reads))
+        self.assertEqual((table, ["lswitch_0", "lswitch_1"], column),
+                         reads[0][0])
+        self.assertEqual((child_table, ["uuid-0", "uuid-1", "uuid-2"]),
+                         reads[1][0][:2])
+        self.assertFalse(self.ovn_nbctl.list.called)
+
+    def test_list_lports(self):
+        self.ovn_nbctl.get_many.side_effect = [
+            [{"ports": ["uuid-1", "uuid-0"]}, {"ports": "uuid-2"}],
+            [{"name": "lport_0"}, {"name": "lport_1"}, {"name": "lport_2"}],
+        ]
+
+        lports = self.scenario._list_lports([{"name": "lswitch_0"},
+                                             {"name": "lswitch_1"}])
+
+        self.assertEqual(3, len(lports))
+        self._check_two_reads("Logical_Switch", "ports",
+                              "Logical_Switch_Port")
+
+    def test_list_acl(self):
+        self.ovn_nbctl.get_many.side_effect = [
+            [{"acls": ["uuid-0", "uuid-1"]}, {"acls": ["uuid-2"]}],
+            [{"match": "ip4"}] * 3,
+        ]
+
+        self.scenario._list_acl([{"name": "lswitch_0"},
+                                 {"name": "lswitch_1"}])
+
+        self._check_two_reads("Logical_Switch", "acls", "ACL")
+
+    def test_list_lports_empty(self):
+        self.ovn_nbctl.get_many.return_value = [{"ports": []}]
+
+        self.assertEqual([], self.scenario._list_lports(
+            [{"name": "lswitch_0"}]))
+        self.assertEqual(1, self.ovn_nbctl.get_many.call_count)
+
+    def test_port_group_add_port(self):
+        self.ovn_nbctl.get_many.return_value = [{"_uuid": "uuid-0"},
+                                                {"_uuid": "uuid-1"}]
+
+        self.scenario._port_group_add_port("pg_0", ["lport_0", "lport_1"])
+
+        self.ovn_nbctl.get_many.assert_called_once_with(
+            "Logical_Switch_Port", ["lport_0", "lport_1"], "_uuid")
+        self.ovn_nbctl.add.assert_called_once_with(
+            "Port_Group", "pg_0", ("ports", " ", ["uuid-0", "uuid-1"]))
+        self.assertFalse(self.ovn_nbctl.list.called)
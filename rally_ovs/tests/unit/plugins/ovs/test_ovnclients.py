@@ -0,0 +1,45 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+
+import collections
+
+import mock
+
+from rally_ovs.plugins.ovs import ovnclients
+from tests.unit import test
+
+
+class DaemonSocketTestCase(test.TestCase):
+
+    def setUp(self):
+        super(DaemonSocketTestCase, self).setUp()
+        patcher = mock.patch.object(ovnclients, "_daemon_clients",
+                                    collections.Counter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_least_loaded_release(self):
+        sockets = ["sock-0", "sock-1"]
+        first = ovnclients.select_daemon_socket(sockets, 0, "least-loaded")
+        second = ovnclients.select_daemon_socket(sockets, 1, "least-loaded")
+        self.assertEqual(set(sockets), {first, second})
+
+        ovnclients.release_daemon_socket(second)
+        self.assertEqual(second, ovnclients.select_daemon_socket(
+            sockets, 2, "least-loaded"))
+
+        ovnclients.release_daemon_socket(first)
+        ovnclients.release_daemon_socket(first)
+        self.assertEqual(0, ovnclients._daemon_clients[first])
@@ -12,8 +12,11 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import threading
+
 import ddt
 import mock
+import six
 
 from rally_ovs.plugins.ovs import ovsclients
 # We won't be using ovsclients_impl directly but we need decorators to run.
@@ -21,6 +24,15 @@ from rally_ovs.plugins.ovs import ovsclients_impl
 from tests.unit import test
 
 
+FAKE_CREDENTIAL = {
+    "user": "root",
+    "host": "fake_host",
+    "port": -1,
+    "key": "fake_key",
+    "password": "fake_password",
+}
+
+
 @ddt.ddt
 class OvnNbctlTestCase(test.TestCase):
 
@@ -79,3 +91,227 @@ class OvnNbctlTestCase(test.TestCase):
         nbctl.run = mock.Mock()
         nbctl.lport_set_addresses(port, *addresses)
         nbctl.run.assert_called_once_with("lsp-set-addresses", args=run_args)
+
+
+class WriteBehindWorkerTestCase(test.TestCase):
+
+    def test_barrier(self):
+        written = []
+        worker = ovsclients.WriteBehindWorker(written.append, 2)
+
+        for batch in range(5):
+            worker.submit(batch)
+        worker.barrier()
+
+        self.assertEqual([0, 1, 2, 3, 4], written)
+
+    def test_barrier_error(self):
+        written = []
+
+        def _write(batch):
+            if batch == 1:
+                raise ValueError("fake error")
+            written.append(batch)
+
+        worker = ovsclients.WriteBehindWorker(_write, 2)
+        for batch in range(3):
+            worker.submit(batch)
+
+        error = self.assertRaises(ovsclients.WriteBehindError,
+                                  worker.barrier)
+        self.assertEqual(1, error.batch)
+        # Batches after the failed one are dropped.
+        self.assertEqual([0], written)
+        worker.barrier()
+
+
+class CoalesceTestCase(test.TestCase):
+
+    def setUp(self):
+        super(CoalesceTestCase, self).setUp()
+        self.nbctl = ovsclients_impl.OvnNbctl._OvnNbctl(FAKE_CREDENTIAL)
+        self.nbctl.enable_batch_mode()
+        self.nbctl.set_coalesce_create()
+
+    def test_set_same_record(self):
+        self.nbctl.set("Logical_Switch", "ls0", ("other_config", {"a": 1}))
+        self.nbctl.set("Logical_Switch", "ls0", ("external_ids", {"b": 2}))
+        self.nbctl.set("Logical_Switch", "ls1", ("other_config", {"a": 1}))
+
+        self.assertEqual(
+            [" --  set Logical_Switch ls0 other_config:a=1 external_ids:b=2",
+             " --  set Logical_Switch ls1 other_config:a=1"],
+            self.nbctl.cmds)
+
+    def test_lswitch_add_other_config(self):
+        self.nbctl.lswitch_add("ls0", {"subnet": "10.0.0.0/8"})
+
+        self.assertEqual(
+            [" --  create Logical_Switch 'name=\"ls0\"' "
+             "other_config:subnet=\"10.0.0.0/8\""],
+            self.nbctl.cmds)
+
+    def test_lswitch_port_add_fold(self):
+        self.nbctl.lswitch_port_add("ls0", "lp0")
+        self.nbctl.lport_set_addresses("lp0", ["00:00:00:00:00:01", "1.2.3.4"])
+        self.nbctl.lport_set_port_security("lp0", "00:00:00:00:00:01")
+        self.nbctl.lswitch_port_add("ls0", "lp1")
+        self.nbctl.lport_set_addresses("lp0", ["00:00:00:00:00:02"])
+
+        self.assertEqual(
+            [" --  --id=@row0 create Logical_Switch_Port 'name=\"lp0\"' "
+             "'addresses=\"00:00:00:00:00:01 1.2.3.4\"' "
+             "'port_security=\"00:00:00:00:00:01\"' "
+             "-- add Logical_Switch ls0 ports @row0",
+             " --  lsp-add ls0 lp1",
+             " --  lsp-set-addresses lp0 00:00:00:00:00:02"],
+            self.nbctl.cmds)
+
+    def test_no_coalesce_create(self):
+        self.nbctl.set_coalesce_create(False)
+        self.nbctl.lswitch_port_add("ls0", "lp0")
+        self.nbctl.lport_set_addresses("lp0", ["00:00:00:00:00:01"])
+        self.nbctl.set("Logical_Switch", "ls0", ("other_config", {"a": 1}))
+        self.nbctl.set("Logical_Switch", "ls0", ("external_ids", {"b": 2}))
+
+        self.assertEqual(
+            [" --  lsp-add ls0 lp0",
+             " --  lsp-set-addresses lp0 00:00:00:00:00:01",
+             " --  set Logical_Switch ls0 other_config:a=1 external_ids:b=2"],
+            self.nbctl.cmds)
+
+    def test_flush_resets(self):
+        self.nbctl._flush = mock.Mock()
+        self.nbctl.set("Logical_Switch", "ls0", ("other_config", {"a": 1}))
+        self.nbctl.flush()
+        self.nbctl.set("Logical_Switch", "ls0", ("other_config", {"b": 2}))
+
+        self.assertEqual([" --  set Logical_Switch ls0 other_config:b=2"],
+                         self.nbctl.cmds)
+
+
+class JsonQueryTestCase(test.TestCase):
+
+    SWITCHES = ('{"data":[[["uuid","8f5c43d0-0c66-4b63-9a3b-1e6ab8d1a0a1"],'
+                '"lswitch_10.0.0.0/24",'
+                '["set",[["uuid","c1a2b3d4-0000-0000-0000-000000000001"],'
+                '["uuid","c1a2b3d4-0000-0000-0000-000000000002"]]]],'
+                '[["uuid","0d4b9c8e-1f2a-4c3b-8d7e-6f5a4b3c2d1e"],'
+                '"lswitch_10.0.1.0/24",'
+                '["uuid","c1a2b3d4-0000-0000-0000-000000000003"]],'
+                '[["uuid","2b7f1e6a-5c4d-4e3f-9a8b-7c6d5e4f3a2b"],'
+                '"join",["set",[]]]],'
+                '"headings":["_uuid","name","ports"]}\n')
+    PORTS = ('{"data":[[["uuid","c1a2b3d4-0000-0000-0000-000000000001"],'
+             '"lp0"],'
+             '[["uuid","c1a2b3d4-0000-0000-0000-000000000002"],"lp1"],'
+             '[["uuid","c1a2b3d4-0000-0000-0000-000000000003"],"lp2"]],'
+             '"headings":["_uuid","name"]}\n')
+
+    def _mock_run(self, client, *outputs):
+        outputs = list(outputs)
+
+        def run(cmd, opts=[], args=[], stdout=None, **kwargs):
+            stdout.write(six.text_type(outputs.pop(0)))
+
+        client.run = mock.Mock(side_effect=run)
+
+    def test_parse_json_table(self):
+        rows = ovsclients.parse_json_table(
+            '{"data":[[["uuid","2b7f1e6a-5c4d-4e3f-9a8b-7c6d5e4f3a2b"],'
+            '42,true,["map",[["a","1"]]],["set",["x","y"]]]],'
+            '"headings":["_uuid","tunnel_key","up","options","addresses"]}')
+
+        self.assertEqual(
+            [{"_uuid": "2b7f1e6a-5c4d-4e3f-9a8b-7c6d5e4f3a2b",
+              "tunnel_key": 42, "up": True, "options": {"a": "1"},
+              "addresses": ["x", "y"]}],
+            rows)
+        self.assertEqual([], ovsclients.parse_json_table(""))
+
+    def test_show(self):
+        nbctl = ovsclients_impl.OvnNbctl._OvnNbctl(FAKE_CREDENTIAL)
+        self._mock_run(nbctl, self.SWITCHES, self.PORTS)
+
+        lswitches = nbctl.show()
+
+        self.assertEqual(["lswitch_10.0.0.0/24", "lswitch_10.0.1.0/24"],
+                         [ls["name"] for ls in lswitches])
+        self.assertEqual(["lp0", "lp1"],
+                         [lport["name"] for lport in lswitches[0]["lports"]])
+        self.assertEqual(["lp2"],
+                         [lport["name"] for lport in lswitches[1]["lports"]])
+        self.assertEqual("10.0.1.0/24", str(lswitches[1]["cidr"]))
+        self.assertEqual(
+            mock.call("list", opts=["--format=json", "--data=json",
+                                    "--columns=_uuid,name,ports"],
+                      args=["Logical_Switch"], stdout=mock.ANY),
+            nbctl.run.call_args_list[0])
+
+    def test_get_many(self):
+        nbctl = ovsclients_impl.OvnNbctl._OvnNbctl(FAKE_CREDENTIAL)
+        self._mock_run(nbctl, self.PORTS)
+
+        rows = nbctl.get_many("Logical_Switch_Port", ["lp0", "lp1", "lp2"],
+                              "_uuid", "name")
+
+        self.assertEqual(["lp0", "lp1", "lp2"], [r["name"] for r in rows])
+        nbctl.run.assert_called_once_with(
+            "list", opts=["--format=json", "--data=json",
+                          "--columns=_uuid,name"],
+            args=["Logical_Switch_Port", "lp0", "lp1", "lp2"],
+            stdout=mock.ANY)
+        self.assertEqual([], nbctl.get_many("Logical_Switch_Port", []))
+
+    def test_chassis_bound_flushes_batch(self):
+        sbctl = ovsclients_impl.OvnSbctl._OvnSbctl(FAKE_CREDENTIAL)
+        sbctl.enable_batch_mode()
+        sbctl.flush = mock.Mock()
+        self._mock_run(sbctl,
+                       '{"data":[[["uuid",'
+                       '"2b7f1e6a-5c4d-4e3f-9a8b-7c6d5e4f3a2b"]]],'
+                       '"headings":["_uuid"]}\n')
+
+        self.assertTrue(sbctl.chassis_bound("ch0"))
+        sbctl.flush.assert_called_once_with()
+        self.assertTrue(sbctl.batch_mode)
+        sbctl.run.assert_called_once_with(
+            "find", opts=["--format=json", "--data=json", "--columns=_uuid"],
+            args=["Chassis", "name=ch0"], stdout=mock.ANY)
+
+
+class ClientCacheTestCase(test.TestCase):
+
+    def _in_thread(self, func):
+        result = []
+        thread = threading.Thread(target=lambda: result.append(func()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_get_per_thread(self):
+        cache = ovsclients.ClientCache()
+        client = cache.get("nbctl", object)
+
+        self.assertIs(client, cache.get("nbctl", object))
+        self.assertIsNot(client,
+                         self._in_thread(lambda: cache.get("nbctl", object)))
+        self.assertEqual(2, len(cache))
+
+    def test_evict_finished_threads_first(self):
+        cache = ovsclients.ClientCache(size=2)
+        client = cache.get("nbctl", object)
+        self._in_thread(lambda: cache.get("nbctl", object))
+        cache.get("sbctl", object)
+
+        self.assertEqual(2, len(cache))
+        self.assertIs(client, cache.get("nbctl", object))
+
+    def test_keep_clients_of_live_threads(self):
+        cache = ovsclients.ClientCache(size=1)
+        nbctl = cache.get("nbctl", object)
+        sbctl = cache.get("sbctl", object)
+
+        self.assertEqual(2, len(cache))
+        self.assertIs(nbctl, cache.get("nbctl", object))
+        self.assertIs(sbctl, cache.get("sbctl", object))
@@ -0,0 +1,212 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import json
+import socket
+
+import mock
+
+from rally_ovs.plugins.ovs import ovsclients_impl
+from rally_ovs.plugins.ovs import ovsdb
+from tests.unit import test
+
+
+FAKE_SCHEMA = {
+    "name": "OVN_Northbound",
+    "tables": {
+        "Logical_Switch": {"columns": {
+            "name": {"type": "string"},
+            "ports": {"type": {"key": {"type": "uuid",
+                                       "refTable": "Logical_Switch_Port"},
+                               "min": 0, "max": "unlimited"}},
+            "other_config": {"type": {"key": "string", "value": "string",
+                                      "min": 0, "max": "unlimited"}},
+        }},
+        "Logical_Switch_Port": {"columns": {
+            "name": {"type": "string"},
+            "addresses": {"type": {"key": "string", "min": 0,
+                                   "max": "unlimited"}},
+        }},
+    },
+}
+
+
+class FakeOvsdbServer(object):
+    """In-memory stream answering like an ovsdb-server."""
+
+    def __init__(self, echo_first=False):
+        self.requests = []
+        self.replies = []
+        self.echo_first = echo_first
+
+    def sendall(self, data):
+        msg = json.loads(data.decode("utf8"))
+        if "method" not in msg:
+            # Reply to our echo request.
+            return
+        self.requests.append(msg)
+
+        if self.echo_first:
+            self.replies.append({"method": "echo", "params": [], "id": "e"})
+        if msg["method"] == "get_schema":
+            result = FAKE_SCHEMA
+        else:
+            result = [{"uuid": ["uuid", "fake"]} for _ in msg["params"][1:]]
+        self.replies.append({"id": msg["id"], "result": result,
+                             "error": None})
+
+    def recv(self, size):
+        # One reply per read, so that pipelined replies stay queued.
+        data = json.dumps(self.replies.pop(0))
+        return data.encode("utf8")
+
+    def close(self):
+        pass
+
+
+class ConnectionTestCase(test.TestCase):
+
+    def test_call_answers_echo(self):
+        server = FakeOvsdbServer(echo_first=True)
+        conn = ovsdb.Connection(server)
+
+        schema = conn.get_schema("OVN_Northbound")
+
+        self.assertEqual("OVN_Northbound", schema.name)
+        self.assertEqual([{"method": "get_schema",
+                           "params": ["OVN_Northbound"], "id": 1}],
+                         server.requests)
+
+    def test_transact_error(self):
+        server = FakeOvsdbServer()
+        server.sendall = lambda data: server.replies.append(
+            {"id": 1, "error": None,
+             "result": [{"error": "constraint violation"}]})
+        conn = ovsdb.Connection(server)
+
+        self.assertRaises(ovsdb.OvsdbError, conn.transact, "OVN_Northbound",
+                          [{"op": "insert", "table": "Logical_Switch"}])
+
+    def test_to_datum(self):
+        schema = ovsdb.Schema(FAKE_SCHEMA)
+
+        self.assertEqual("sw0", ovsdb.to_datum(
+            '"sw0"', schema.column_type("Logical_Switch", "name")))
+        self.assertEqual(["set", ["mac ip"]], ovsdb.to_datum(
+            "mac ip",
+            schema.column_type("Logical_Switch_Port", "addresses")))
+        self.assertEqual(["map", [["a", "1"], ["b", "2"]]], ovsdb.to_datum(
+            {"b": "2", "a": "1"},
+            schema.column_type("Logical_Switch", "other_config")))
+
+
+class PipelineTestCase(test.TestCase):
+
+    def test_submit_keeps_depth_in_flight(self):
+        server = FakeOvsdbServer()
+        pipeline = ovsdb.Connection(server).pipeline("OVN_Northbound", 2)
+
+        pipeline.submit([{"op": "comment"}])
+        pipeline.submit([{"op": "comment"}])
+        self.assertEqual(2, len(server.replies))
+
+        pipeline.submit([{"op": "comment"}])
+        self.assertEqual(2, pipeline.inflight)
+
+        pipeline.drain()
+        self.assertEqual(0, pipeline.inflight)
+        self.assertEqual(3, len(pipeline.pop_latencies()))
+
+    def test_error_does_not_stall(self):
+        server = FakeOvsdbServer()
+        pipeline = ovsdb.Connection(server).pipeline("OVN_Northbound", 4)
+
+        pipeline.submit([{"op": "comment"}])
+        server.replies[-1]["result"] = [{"error": "constraint violation"}]
+        pipeline.submit([{"op": "comment"}])
+
+        self.assertRaises(ovsdb.OvsdbError, pipeline.drain)
+        self.assertEqual(0, pipeline.inflight)
+        self.assertEqual(2, len(pipeline.pop_latencies()))
+
+
+class OvnNbIdlTestCase(test.TestCase):
+
+    def setUp(self):
+        super(OvnNbIdlTestCase, self).setUp()
+        self.server = FakeOvsdbServer()
+        conn = ovsdb.Connection(self.server)
+        patcher = mock.patch("rally_ovs.plugins.ovs.ovsdb.get_connection",
+                             return_value=conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = ovsclients_impl.OvnNbIdl._OvnNbIdl(
+            {"user": "root", "host": "fake_host"})
+        self.client.set_remote("tcp:127.0.0.1:6641")
+
+    def _transacts(self):
+        return [r["params"][1:] for r in self.server.requests
+                if r["method"] == "transact"]
+
+    def test_batch_mode(self):
+        self.client.enable_batch_mode()
+        self.client.lswitch_add("lswitch_0")
+        self.client.lswitch_port_add("lswitch_0", "lport_0")
+
+        self.assertEqual([], self._transacts())
+        self.client.flush()
+
+        ops = self._transacts()[0]
+        self.assertEqual(["insert", "insert", "mutate"],
+                         [op["op"] for op in ops])
+        self.assertEqual([["_uuid", "==", ["named-uuid",
+                                           ops[0]["uuid-name"]]]],
+                         ops[2]["where"])
+        self.assertEqual([["ports", "insert",
+                           ["set", [["named-uuid", ops[1]["uuid-name"]]]]]],
+                         ops[2]["mutations"])
+
+    def test_set_same_depths(self):
+        self.client.set_pipeline_depth(4)
+        self.client.set_write_behind(2)
+        worker = self.client.write_behind
+
+        with mock.patch.object(self.client, "drain") as mock_drain:
+            self.client.set_pipeline_depth(4)
+            self.client.set_write_behind(2)
+        self.assertFalse(mock_drain.called)
+        self.assertIs(worker, self.client.write_behind)
+
+        with mock.patch.object(self.client, "drain") as mock_drain:
+            self.client.set_pipeline_depth(1)
+        mock_drain.assert_called_once_with()
+        self.assertEqual(1, self.client.pipeline_depth)
+
+    def test_get_timeout(self):
+        self.server.settimeout = mock.Mock()
+        self.server.recv = mock.Mock(side_effect=socket.timeout("timed out"))
+
+        self.assertRaises(ovsdb.OvsdbError, self.client.get, "NB_Global",
+                          ".", "nb_cfg", timeout=5)
+        self.assertEqual([mock.call(5), mock.call(None)],
+                         self.server.settimeout.call_args_list)
+
+    def test_lport_set_addresses(self):
+        self.client.lport_set_addresses("lport_0", ["mac", "ip"])
+
+        self.assertEqual([[{"op": "update", "table": "Logical_Switch_Port",
+                            "where": [["name", "==", "lport_0"]],
+                            "row": {"addresses": ["set", ["mac ip"]]}}]],
+                         self._transacts())
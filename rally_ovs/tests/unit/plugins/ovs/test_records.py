@@ -0,0 +1,113 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import copy
+import pickle
+
+from rally_ovs.plugins.ovs import records
+from tests.unit import test
+
+
+class RecordTestCase(test.TestCase):
+
+    def test_dict_access(self):
+        lport = records.LPort("lp0", "00:00:00:00:00:01", "10.0.0.2/24",
+                              "10.0.0.1", "172.16.0.1")
+
+        self.assertEqual("00:00:00:00:00:01", lport["mac"])
+        self.assertEqual("172.16.0.1", lport["ext-gw"])
+        self.assertEqual("172.16.0.1", lport.get("ext-gw"))
+        self.assertIsNone(lport.get("ext_gw"))
+        self.assertIn("ext-gw", lport)
+        self.assertNotIn("cidr", lport)
+        self.assertRaises(KeyError, lport.__getitem__, "cidr")
+        self.assertRaises(KeyError, lport.__setitem__, "cidr", "")
+        self.assertFalse(hasattr(lport, "__dict__"))
+
+        lport["ip"] = "10.0.0.3/24"
+        self.assertEqual(
+            {"name": "lp0", "mac": "00:00:00:00:00:01", "ip": "10.0.0.3/24",
+             "gw": "10.0.0.1", "ext-gw": "172.16.0.1"},
+            dict(lport))
+
+    def test_equal_to_dict(self):
+        sandbox = records.Sandbox("sb-0", "ToR1", "farm-0", None)
+
+        self.assertEqual({"name": "sb-0", "tag": "ToR1", "farm": "farm-0",
+                          "host_container": None}, sandbox)
+        self.assertNotEqual(records.Sandbox("sb-1", "ToR1", "farm-0"),
+                            sandbox)
+
+    def test_pickle_and_copy(self):
+        lswitch = records.LSwitch("lswitch_0", "fake-uuid", "",
+                                  [records.LPort("lp0")])
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(lswitch,
+                             pickle.loads(pickle.dumps(lswitch, protocol)))
+        clone = copy.deepcopy(lswitch)
+        self.assertEqual(lswitch, clone)
+        self.assertIsNot(lswitch["lports"], clone["lports"])
+
+
+class PortRegistryTestCase(test.TestCase):
+
+    def setUp(self):
+        super(PortRegistryTestCase, self).setUp()
+        self.sandboxes = [records.Sandbox("sb-0", farm="farm-0"),
+                          records.Sandbox("sb-1", farm="farm-0"),
+                          records.Sandbox("sb-2", farm="farm-1")]
+        self.registry = records.PortRegistry()
+        for i in range(6):
+            self.registry.add(records.LPort("lp%d" % i),
+                              self.sandboxes[i % 3])
+
+    def _names(self, entries):
+        return sorted(lport["name"] for lport, _ in entries)
+
+    def test_lookups(self):
+        self.assertEqual(6, len(self.registry))
+        self.assertEqual(self.sandboxes[1], self.registry["lp4"][1])
+        self.assertEqual(["lp0", "lp3"],
+                         self._names(self.registry.by_sandbox("sb-0")))
+        self.assertEqual(["lp0", "lp1", "lp3", "lp4"],
+                         self._names(self.registry.by_farm("farm-0")))
+        self.assertEqual([], self.registry.by_farm("farm-2"))
+
+    def test_remove(self):
+        self.assertEqual(["lp2", "lp5"], self._names(
+            self.registry.remove_sandboxes(["sb-2", "sb-3"])))
+        self.assertEqual(["lp0"], self._names(
+            self.registry.remove(["lp0", "lp2"])))
+
+        self.assertEqual(3, len(self.registry))
+        self.assertNotIn("lp0", self.registry)
+        self.assertEqual([], self.registry.by_farm("farm-1"))
+        self.assertEqual(["lp3"],
+                         self._names(self.registry.by_sandbox("sb-0")))
+
+    def test_move_port(self):
+        self.registry.add(records.LPort("lp0"), self.sandboxes[2])
+
+        self.assertEqual(["lp3"],
+                         self._names(self.registry.by_sandbox("sb-0")))
+        self.assertEqual(["lp0", "lp2", "lp5"],
+                         self._names(self.registry.by_farm("farm-1")))
+
+    def test_deepcopy(self):
+        clone = copy.deepcopy(self.registry)
+        clone.remove(["lp0"])
+
+        self.assertIn("lp0", self.registry)
+        self.assertEqual(["lp3"], self._names(clone.by_sandbox("sb-0")))
@@ -0,0 +1,505 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import os
+import tempfile
+import threading
+import time
+
+import mock
+import six
+
+from rally import exceptions
+from rally_ovs.plugins.ovs import transport
+from tests.unit import test
+
+
+def get_fake_credential(host="fake_host"):
+    return {
+        "user": "fake_user",
+        "host": host,
+        "port": 22,
+        "key": "fake_key",
+        "password": "fake_password",
+    }
+
+
+class SSHPoolTestCase(test.TestCase):
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_get_reuses_connection(self, mock_ssh):
+        pool = transport.SSHPool(size=1)
+        cred = get_fake_credential()
+
+        conn1 = pool.get(cred)
+        conn2 = pool.get(dict(cred))
+
+        self.assertIs(conn1, conn2)
+        self.assertEqual(1, mock_ssh.call_count)
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_get_round_robin(self, mock_ssh):
+        mock_ssh.side_effect = lambda *args, **kwargs: mock.Mock()
+        pool = transport.SSHPool(size=2)
+        cred = get_fake_credential()
+
+        conns = [pool.get(cred) for _ in range(4)]
+
+        self.assertIsNot(conns[0], conns[1])
+        self.assertIs(conns[0], conns[2])
+        self.assertIs(conns[1], conns[3])
+        self.assertEqual(2, mock_ssh.call_count)
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_stats(self, mock_ssh):
+        pool = transport.SSHPool()
+        conn = pool.get(get_fake_credential())
+
+        mock_ssh.return_value._client = False
+        conn.run("true")
+        mock_ssh.return_value._client = mock.Mock()
+        conn.run("true")
+        conn.run("true")
+
+        self.assertEqual({"fake_host": {"connects": 1, "reuses": 2,
+                                        "evictions": 0}},
+                         pool.get_stats())
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.time")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_evict_idle(self, mock_ssh, mock_time):
+        pool = transport.SSHPool(idle_timeout=10)
+        mock_time.return_value = 100
+        conn = pool.get(get_fake_credential())
+        mock_ssh.return_value._client = mock.Mock()
+
+        mock_time.return_value = 105
+        pool.get(get_fake_credential("other_host"))
+        self.assertFalse(mock_ssh.return_value.close.called)
+
+        mock_time.return_value = 111
+        self.assertIs(conn, pool.get(get_fake_credential()))
+        mock_ssh.return_value.close.assert_called_once_with()
+        self.assertEqual(1, pool.get_totals()["evictions"])
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.time")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_evict_idle_skips_busy(self, mock_ssh, mock_time):
+        pool = transport.SSHPool(idle_timeout=10)
+        mock_time.return_value = 100
+        conn = pool.get(get_fake_credential())
+        ssh = mock_ssh.return_value
+        ssh._client = mock.Mock()
+        mock_ssh.return_value = mock.Mock(_client=False)
+
+        def long_run(*args, **kwargs):
+            mock_time.return_value = 200
+            pool.get(get_fake_credential("other_host"))
+            return 0
+
+        ssh.run.side_effect = long_run
+        conn.run("sleep 100")
+        self.assertFalse(ssh.close.called)
+
+        # Idle from the end of the command.
+        mock_time.return_value = 205
+        pool.get(get_fake_credential("other_host"))
+        self.assertFalse(ssh.close.called)
+        mock_time.return_value = 211
+        pool.get(get_fake_credential("other_host"))
+        ssh.close.assert_called_once_with()
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_run_compressed(self, mock_ssh):
+        pool = transport.SSHPool(compress_threshold=64)
+        conn = pool.get(get_fake_credential())
+        # Let a local shell play the remote host.
+        local = transport.LocalTransport({"host": "localhost",
+                                          "user": "fake_user"})
+        mock_ssh.return_value.run.side_effect = local.run
+
+        stdout = six.moves.StringIO()
+        conn.run("seq 1000\n" + "true\n" * 20, stdout=stdout)
+
+        self.assertEqual("".join("%d\n" % i for i in range(1, 1001)),
+                         stdout.getvalue())
+        self.assertIsNotNone(mock_ssh.return_value.run.call_args[1]["stdin"])
+        self.assertGreater(pool.get_compress_totals()["saved_bytes"], 0)
+
+        stdout = six.moves.StringIO()
+        self.assertEqual(3, conn.run("echo small; exit 3", stdout=stdout,
+                                     raise_on_error=False))
+        self.assertEqual("small\n", stdout.getvalue())
+        self.assertRaises(exceptions.SSHError, conn.run, "false")
+
+    @mock.patch.multiple("rally_ovs.plugins.ovs.transport",
+                         SPOOL_MAX_SIZE=64, SPOOL_CHUNK_SIZE=100)
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_run_buffered_streams_lines(self, mock_ssh):
+        local = transport.LocalTransport({"host": "localhost",
+                                          "user": "fake_user"})
+        mock_ssh.return_value.run.side_effect = local.run
+        expected = [u"%d \u00e9" % i for i in range(1, 1001)]
+
+        for options in [{"retries": 1}, {"compress_threshold": 64}]:
+            pool = transport.SSHPool(**options)
+            conn = pool.get(get_fake_credential())
+            lines = []
+            writer = transport.LineWriter(lines.append)
+
+            conn.run("seq 1000 | sed 's/$/ \\xc3\\xa9/'", stdout=writer)
+            writer.close()
+
+            self.assertEqual(expected, lines)
+
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.sleep")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_run_retries(self, mock_ssh, mock_sleep):
+        pool = transport.SSHPool(retries=2)
+        conn = pool.get(get_fake_credential())
+        mock_ssh.return_value._get_client.side_effect = [
+            exceptions.SSHError("Connection refused"), mock.Mock()]
+        mock_ssh.return_value.run.return_value = 0
+        retry_time = transport.get_retry_time()
+
+        stdout = six.moves.StringIO()
+        self.assertEqual(0, conn.run("true", stdout=stdout))
+
+        self.assertEqual(1, mock_ssh.return_value.run.call_count)
+        self.assertEqual(1, mock_sleep.call_count)
+        self.assertEqual({"fake_host": {"failures": 1, "retries": 1,
+                                        "breaker_trips": 0}},
+                         pool.get_retry_stats())
+        self.assertGreaterEqual(transport.get_retry_time(), retry_time)
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.sleep")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_run_does_not_retry_started_commands(self, mock_ssh,
+                                                 mock_sleep):
+        pool = transport.SSHPool(retries=2)
+        conn = pool.get(get_fake_credential())
+        mock_ssh.return_value.run.side_effect = exceptions.SSHError(
+            "Socket error.")
+
+        self.assertRaises(exceptions.SSHError, conn.run, "true")
+
+        self.assertEqual(1, mock_ssh.return_value.run.call_count)
+        self.assertFalse(mock_sleep.called)
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.sleep")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_put_file_retries_on_same_connection(self, mock_ssh,
+                                                 mock_sleep):
+        pool = transport.SSHPool(retries=2)
+        conn = pool.get(get_fake_credential())
+        ssh = mock_ssh.return_value
+        ssh._client.get_transport.return_value.is_active.return_value = True
+        ssh.put_file.side_effect = [exceptions.SSHError("Channel closed."),
+                                    None]
+
+        conn.put_file("local", "remote")
+
+        self.assertEqual(2, ssh.put_file.call_count)
+        # The connection is shared by other threads, keep it.
+        self.assertFalse(ssh.close.called)
+
+        ssh.put_file.side_effect = [exceptions.SSHError("Socket error."),
+                                    None]
+        ssh._client.get_transport.return_value.is_active.return_value = False
+        conn.put_file("local", "remote")
+        ssh.close.assert_called_once_with()
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_run_does_not_retry_command_errors(self, mock_ssh):
+        pool = transport.SSHPool(retries=2)
+        conn = pool.get(get_fake_credential())
+        mock_ssh.return_value.run.return_value = 1
+
+        self.assertRaises(exceptions.SSHError, conn.run, "false")
+        self.assertEqual(1, mock_ssh.return_value.run.call_count)
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.time.time")
+    @mock.patch("rally_ovs.plugins.ovs.transport.sshutils.SSH")
+    def test_breaker(self, mock_ssh, mock_time):
+        pool = transport.SSHPool(breaker_threshold=2, breaker_timeout=10)
+        conn = pool.get(get_fake_credential())
+        mock_ssh.return_value.run.side_effect = exceptions.SSHError(
+            "Socket error.")
+        mock_time.return_value = 100
+
+        for _ in range(2):
+            self.assertRaises(exceptions.SSHError, conn.run, "true")
+        self.assertEqual(2, mock_ssh.return_value.run.call_count)
+
+        # Tripped, fail without trying.
+        self.assertRaises(exceptions.SSHError, conn.run, "true")
+        self.assertEqual(2, mock_ssh.return_value.run.call_count)
+
+        # Past the timeout, one attempt goes through and closes it.
+        mock_time.return_value = 111
+        mock_ssh.return_value.run.side_effect = None
+        mock_ssh.return_value.run.return_value = 0
+        self.assertEqual(0, conn.run("true"))
+        self.assertEqual(1, pool.get_retry_stats()[
+            "fake_host"]["breaker_trips"])
+
+
+class LocalTransportTestCase(test.TestCase):
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.getpass.getuser",
+                return_value="fake_user")
+    def test_is_local_credential(self, mock_getuser):
+        cred = get_fake_credential("127.0.0.1")
+        self.assertTrue(transport.is_local_credential(cred))
+
+        cred["user"] = "other_user"
+        self.assertFalse(transport.is_local_credential(cred))
+
+        cred["transport"] = "local"
+        self.assertTrue(transport.is_local_credential(cred))
+
+        cred = get_fake_credential("127.0.0.1")
+        cred["transport"] = "ssh"
+        self.assertFalse(transport.is_local_credential(cred))
+
+        self.assertFalse(transport.is_local_credential(get_fake_credential()))
+
+    def test_run(self):
+        local = transport.LocalTransport(get_fake_credential("127.0.0.1"))
+        stdout = six.moves.StringIO()
+
+        local.run("read a; echo $a world", stdin="hello\n", stdout=stdout)
+
+        self.assertEqual("hello world\n", stdout.getvalue())
+
+    def test_run_error(self):
+        local = transport.LocalTransport(get_fake_credential("127.0.0.1"))
+
+        self.assertEqual(3, local.run("exit 3", raise_on_error=False))
+        self.assertRaises(exceptions.SSHError, local.run, "exit 3")
+
+
+class AgentTransportTestCase(test.TestCase):
+
+    def setUp(self):
+        super(AgentTransportTestCase, self).setUp()
+        cred = get_fake_credential("127.0.0.1")
+        self.agent = transport.AgentTransport(
+            cred, transport.LocalTransport(cred))
+        self.addCleanup(self.agent.close)
+
+    def test_run(self):
+        stdout = six.moves.StringIO()
+
+        self.agent.run("read a; echo $a world", stdin="hello\n",
+                       stdout=stdout)
+
+        self.assertEqual("hello world\n", stdout.getvalue())
+        self.assertEqual(1, self.agent.stats["commands"])
+
+    def test_run_error(self):
+        self.assertEqual(3, self.agent.run("exit 3", raise_on_error=False))
+        self.assertRaises(exceptions.SSHError, self.agent.run, "exit 3")
+
+    def test_run_batch(self):
+        results = self.agent.run_batch([{"cmd": "echo 1"},
+                                        {"cmd": "echo 2 >&2; false"}])
+
+        self.assertEqual([(0, "1\n", ""), (1, "", "2\n")],
+                         [(r["exit_status"], r["stdout"], r["stderr"])
+                          for r in results])
+        self.assertEqual(2, self.agent.stats["commands"])
+
+    def test_run_timeout(self):
+        start = time.time()
+        self.assertRaises(exceptions.SSHTimeout, self.agent.run,
+                          "sleep 5", timeout=0.2)
+        self.assertLess(time.time() - start, 5)
+        # The agent survives the command it killed.
+        self.assertEqual(0, self.agent.run("true", timeout=5))
+
+    def test_concurrent_channels(self):
+        threads = [threading.Thread(target=self.agent.run, args=("sleep 0.5",))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # One agent per concurrent caller, all reused afterwards.
+        self.assertEqual(3, len(self.agent._idle))
+        self.agent.run("true")
+        self.assertEqual(3, len(self.agent._idle))
+
+
+class DockerExecSessionTestCase(test.TestCase):
+
+    def setUp(self):
+        super(DockerExecSessionTestCase, self).setUp()
+        cred = get_fake_credential("127.0.0.1")
+        self.session = transport.DockerExecSession(
+            transport.LocalTransport(cred), "fake_container")
+        # Same protocol, without needing docker.
+        self.session.shell_cmd = "sh"
+        self.addCleanup(self.session.close)
+
+    def test_execute(self):
+        self.assertEqual((0, "out", ""),
+                         self.session.execute("printf out"))
+        self.assertEqual((3, "", "err\n"),
+                         self.session.execute("echo err >&2; exit 3"))
+        self.assertEqual((0, "hello\n", ""),
+                         self.session.execute("cat", stdin="hello\n"))
+
+    def test_execute_timeout(self):
+        self.assertRaises(exceptions.SSHTimeout,
+                          self.session.execute, "sleep 5", timeout=0.2)
+        # A new session is started for the next command.
+        self.assertEqual((0, "out", ""),
+                         self.session.execute("printf out", timeout=5))
+
+
+class DockerExecTransportTestCase(test.TestCase):
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.get_docker_session")
+    def test_run(self, mock_get_docker_session):
+        conn = mock.Mock()
+        session = mock_get_docker_session.return_value
+        session.execute.return_value = (0, "out\n", "")
+        docker = transport.DockerExecTransport(get_fake_credential(), conn)
+        stdout = six.moves.StringIO()
+
+        docker.run("sudo docker exec ovn-central ovn-nbctl --timeout=10 "
+                   "lr-add 'lrouter 1'", stdout=stdout, timeout=30)
+
+        self.assertFalse(conn.run.called)
+        mock_get_docker_session.assert_called_once_with(
+            docker.cred, conn, "ovn-central", True)
+        session.execute.assert_called_once_with(
+            "ovn-nbctl --timeout=10 lr-add 'lrouter 1'", timeout=30)
+        self.assertEqual("out\n", stdout.getvalue())
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.get_docker_session")
+    def test_run_error(self, mock_get_docker_session):
+        session = mock_get_docker_session.return_value
+        session.execute.return_value = (1, "", "err\n")
+        docker = transport.DockerExecTransport(get_fake_credential(),
+                                               mock.Mock())
+
+        self.assertRaises(exceptions.SSHError, docker.run,
+                          "docker exec ovn-scale-1 ovs-vsctl show")
+        self.assertEqual(1, docker.run("docker exec ovn-scale-1 ovs-vsctl "
+                                       "show", raise_on_error=False))
+
+    @mock.patch("rally_ovs.plugins.ovs.transport.get_docker_session")
+    def test_run_passthrough(self, mock_get_docker_session):
+        conn = mock.Mock()
+        docker = transport.DockerExecTransport(get_fake_credential(), conn)
+
+        for cmd in ["ovs-vsctl show",
+                    "docker exec ovn-central ovn-nbctl show\nip netns",
+                    "docker exec ovn-central ovn-nbctl show | grep lr",
+                    "docker exec ovn-central ovn-nbctl show > out",
+                    "docker exec ovn-central ovn-nbctl lr-add $NAME",
+                    "docker exec ovn-central FOO=1 ovn-nbctl show",
+                    "docker exec -e FOO=1 ovn-central ovn-nbctl show"]:
+            conn.run.reset_mock()
+            docker.run(cmd, timeout=30)
+            conn.run.assert_called_once_with(cmd, stdin=None, stdout=None,
+                                             stderr=None,
+                                             raise_on_error=True,
+                                             timeout=30)
+        self.assertFalse(mock_get_docker_session.called)
+
+
+class PutFileCachedTestCase(test.TestCase):
+
+    def setUp(self):
+        super(PutFileCachedTestCase, self).setUp()
+        self.conn = mock.Mock(host="fake_host", user="fake_user")
+        self.localpath = self.tmp_file(b"fake content")
+        self.digest = transport.file_digest(self.localpath)
+
+        patcher = mock.patch.dict(transport._uploads, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tmp_file(self, content):
+        fd, path = tempfile.mkstemp()
+        os.write(fd, content)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_upload_once(self):
+        self.conn.execute.return_value = (1, "", "No such file")
+
+        self.assertTrue(transport.put_file_cached(
+            self.conn, self.localpath, "install.sh", "755"))
+        self.assertFalse(transport.put_file_cached(
+            self.conn, self.localpath, "install.sh", "755"))
+
+        self.conn.put_file.assert_called_once_with(self.localpath,
+                                                   "install.sh")
+        self.conn.run.assert_called_once_with("chmod 755 install.sh")
+        self.assertEqual(1, self.conn.execute.call_count)
+
+    def test_remote_up_to_date(self):
+        self.conn.execute.return_value = (
+            0, "%s  install.sh\n" % self.digest, "")
+
+        self.assertFalse(transport.put_file_cached(
+            self.conn, self.localpath, "install.sh"))
+        self.assertFalse(self.conn.put_file.called)
+
+    def test_mode_applied_when_up_to_date(self):
+        self.conn.execute.return_value = (
+            0, "%s  install.sh\n" % self.digest, "")
+
+        for _ in range(2):
+            self.assertFalse(transport.put_file_cached(
+                self.conn, self.localpath, "install.sh", "755"))
+        self.assertFalse(transport.put_file_cached(
+            self.conn, self.localpath, "install.sh", "700"))
+
+        self.assertFalse(self.conn.put_file.called)
+        self.assertEqual([mock.call("chmod 755 install.sh"),
+                          mock.call("chmod 700 install.sh")],
+                         self.conn.run.call_args_list)
+
+
+class LineOutputTestCase(test.TestCase):
+
+    def test_line_writer(self):
+        lines = []
+        writer = transport.LineWriter(lines.append)
+        for chunk in ["fir", "st\nsecond\n", "", "\nla", "st"]:
+            writer.write(chunk)
+
+        self.assertEqual(["first", "second", ""], lines)
+        writer.close()
+        self.assertEqual(["first", "second", "", "last"], lines)
+
+    def test_line_counter(self):
+        counter = transport.LineCounter()
+        for chunk in ["a\nb", "\nc\n"]:
+            counter.write(chunk)
+        counter.close()
+        self.assertEqual(3, counter.count)
+
+        counter = transport.LineCounter()
+        counter.write("a\nb")
+        counter.close()
+        self.assertEqual(2, counter.count)
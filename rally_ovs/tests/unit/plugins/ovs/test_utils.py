@@ -0,0 +1,238 @@
+# Copyright 2020 Red Hat, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+import multiprocessing
+import threading
+
+import ddt
+import mock
+import netaddr
+
+from rally import exceptions
+from rally_ovs.plugins.ovs.consts import ResourceType
+from rally_ovs.plugins.ovs import utils
+from tests.unit import test
+
+
+@ddt.ddt
+class RunInParallelTestCase(test.TestCase):
+
+    @ddt.data(1, 2, 8)
+    def test_run_in_parallel(self, concurrency):
+        results = utils.run_in_parallel(lambda x: x * 2, [1, 2, 3],
+                                        concurrency)
+        self.assertEqual([2, 4, 6], [result for result, _ in results])
+
+    def test_run_in_parallel_concurrent(self):
+        barrier = threading.Event()
+        started = []
+
+        def _wait(arg):
+            started.append(arg)
+            if len(started) == 2:
+                barrier.set()
+            return barrier.wait(5)
+
+        results = utils.run_in_parallel(_wait, ["farm-0", "farm-1"], 2)
+        self.assertEqual([True, True], [result for result, _ in results])
+
+    def test_run_in_parallel_error(self):
+        done = []
+
+        def _fail_first(arg):
+            if arg == 0:
+                raise ValueError("fake error")
+            done.append(arg)
+
+        self.assertRaises(ValueError, utils.run_in_parallel, _fail_first,
+                          [0, 1, 2], 2)
+        self.assertEqual([1, 2], sorted(done))
+
+
+class HashRingTestCase(test.TestCase):
+
+    def test_get(self):
+        nodes = ["sock-0", "sock-1", "sock-2"]
+        ring = utils.HashRing(nodes)
+
+        mapping = dict((key, ring.get(key)) for key in range(300))
+
+        self.assertEqual(set(nodes), set(mapping.values()))
+        self.assertEqual(mapping, dict((key, utils.HashRing(nodes).get(key))
+                                       for key in range(300)))
+
+    def test_get_remove_node(self):
+        ring = utils.HashRing(["sock-0", "sock-1", "sock-2"])
+        smaller = utils.HashRing(["sock-0", "sock-1"])
+
+        for key in range(300):
+            if ring.get(key) != "sock-2":
+                self.assertEqual(ring.get(key), smaller.get(key))
+
+
+@ddt.ddt
+class SplitCmdsTestCase(test.TestCase):
+
+    @ddt.data((100, [["-- a", "-- b", "-- c"]]),
+              (10, [["-- a", "-- b"], ["-- c"]]),
+              (5, [["-- a"], ["-- b"], ["-- c"]]),
+              (2, [["-- a"], ["-- b"], ["-- c"]]))
+    @ddt.unpack
+    def test_split_cmds(self, limit, expected):
+        self.assertEqual(expected,
+                         utils.split_cmds(["-- a", "-- b", "-- c"], limit))
+
+    def test_get_cmd_size_limit(self):
+        ssh = mock.Mock(host="fake_host_limit")
+        ssh.execute.return_value = (0, "65536\n", "")
+
+        self.assertEqual(65536 - utils.CMD_SIZE_MARGIN,
+                         utils.get_cmd_size_limit(ssh))
+        self.assertEqual(65536 - utils.CMD_SIZE_MARGIN,
+                         utils.get_cmd_size_limit(ssh))
+        ssh.execute.assert_called_once_with("getconf ARG_MAX")
+
+
+class BatchFlusherTestCase(test.TestCase):
+
+    def test_fixed_batch(self):
+        client = mock.Mock()
+        flusher = utils.BatchFlusher(client, {"batch": 2}, 10)
+
+        for _ in range(5):
+            flusher.step()
+        flusher.flush()
+
+        self.assertEqual(3, client.flush.call_count)
+        self.assertFalse(flusher.auto)
+
+    @mock.patch("rally_ovs.plugins.ovs.utils.time.time")
+    def test_auto_batch(self, mock_time):
+        client = mock.Mock()
+        flusher = utils.BatchFlusher(client, {"batch": "auto",
+                                              "batch_min": 4,
+                                              "batch_max": 40}, 10)
+        # Every flush takes 1s: throughput grows with the batch size.
+        mock_time.side_effect = range(100)
+        for _ in range(16 + 24 + 36):
+            flusher.step()
+
+        self.assertEqual([16, 24, 36], flusher.sizes)
+        self.assertEqual(40, flusher.size)
+
+    @mock.patch("rally_ovs.plugins.ovs.utils.time.time")
+    def test_auto_batch_max_latency(self, mock_time):
+        client = mock.Mock()
+        flusher = utils.BatchFlusher(client, {"batch": "auto",
+                                              "batch_max_latency": 1}, 10)
+        # Every flush takes 2s.
+        mock_time.side_effect = range(0, 100, 2)
+        for _ in range(16 + 10):
+            flusher.step()
+
+        self.assertEqual([16, 10], flusher.sizes)
+        self.assertEqual(6, flusher.size)
+
+
+class AddressAllocationTestCase(test.TestCase):
+
+    def test_ip_range(self):
+        self.assertEqual(["10.0.0.255", "10.0.1.0", "10.0.1.1"],
+                         utils.ip_range(netaddr.IPAddress("10.0.0.255"), 3))
+        self.assertEqual(["fd00::ffff", "fd00::1:0"],
+                         utils.ip_range(netaddr.IPAddress("fd00::ffff"), 2))
+
+    @mock.patch("rally_ovs.plugins.ovs.utils._cidr_counter",
+                multiprocessing.Value("I", 0))
+    def test_generate_cidrs(self):
+        self.assertEqual(["10.2.0.0/24", "10.2.1.0/24"],
+                         utils.generate_cidrs("10.2.0.0/24", 2))
+        self.assertEqual("10.2.2.0/24", utils.generate_cidr("10.2.0.0/24"))
+
+    @mock.patch("rally_ovs.plugins.ovs.utils._mac_counter",
+                multiprocessing.Value("I", 0))
+    @mock.patch("rally_ovs.plugins.ovs.utils.MAC_BLOCK_SIZE", 2)
+    def test_mac_allocator(self):
+        allocator = utils.MacAllocator("0b2c3d4e-5f60-7182-93a4-b5c6d7e8f901")
+        other = utils.MacAllocator("0b2c3d4e-5f60-7182-93a4-b5c6d7e8f901")
+
+        self.assertEqual(["0a:5f:71:00:00:00", "0a:5f:71:00:00:01",
+                          "0a:5f:71:00:00:02"], allocator.allocate(3))
+        self.assertEqual(["0a:5f:71:00:00:04"], other.allocate())
+        self.assertEqual(["0a:5f:71:00:00:03", "0a:5f:71:00:00:06"],
+                         allocator.allocate(2))
+
+    @mock.patch("rally_ovs.plugins.ovs.utils._mac_counter",
+                multiprocessing.Value("I", utils.MAC_SPACE))
+    def test_mac_allocator_exhausted(self):
+        allocator = utils.MacAllocator("0b2c3d4e-5f60-7182-93a4-b5c6d7e8f901")
+        self.assertRaises(exceptions.RallyException, allocator.allocate)
+
+
+@mock.patch("rally_ovs.plugins.ovs.utils._inventory", None)
+@mock.patch("rally_ovs.plugins.ovs.utils.db")
+class InventoryTestCase(test.TestCase):
+
+    def _farm_resources(self, farm, sandboxes):
+        return [
+            {"type": ResourceType.CREDENTIAL, "info": {"host": farm}},
+            {"type": ResourceType.SANDBOXES,
+             "info": {"farm": farm, "sandboxes": sandboxes,
+                      "host_container": None}},
+        ]
+
+    def _setup_db(self, mock_db):
+        mock_db.deployment_list.return_value = [
+            {"uuid": "uuid-0", "name": "farm-0", "config": {}},
+            {"uuid": "uuid-1", "name": "farm-1", "config": {}},
+            {"uuid": "uuid-2", "name": "farm-2", "config": {}},
+        ]
+        resources = {
+            "uuid-0": self._farm_resources("farm-0", {"sb-0": "ToR1",
+                                                      "sb-1": "ToR2"}),
+            "uuid-1": self._farm_resources("farm-1", {"sb-2": "ToR1"}),
+            "uuid-2": self._farm_resources("farm-2", {}),
+        }
+        mock_db.resource_get_all.side_effect = resources.get
+
+    def test_get_sandboxes(self, mock_db):
+        self._setup_db(mock_db)
+
+        self.assertEqual(["farm-0", "farm-1"],
+                         utils.get_farm_nodes("deploy-uuid"))
+        self.assertEqual(["sb-0", "sb-1", "sb-2"], sorted(
+            sb["name"] for sb in utils.get_sandboxes("deploy-uuid")))
+        self.assertEqual(["sb-0", "sb-2"], sorted(
+            sb["name"] for sb in utils.get_sandboxes("deploy-uuid",
+                                                     tag="ToR1")))
+        self.assertEqual(
+            [{"name": "sb-0", "tag": "ToR1", "farm": "farm-0",
+              "host_container": None}],
+            utils.get_sandboxes("deploy-uuid", "farm-0", "ToR1"))
+        self.assertEqual([], utils.get_sandboxes("deploy-uuid", "farm-2"))
+        self.assertEqual({"host": "farm-1"}, utils.get_inventory(
+            "deploy-uuid").deployments[1]["credential"])
+
+        self.assertEqual(1, mock_db.deployment_list.call_count)
+        self.assertEqual(3, mock_db.resource_get_all.call_count)
+
+    def test_invalidate_inventory(self, mock_db):
+        self._setup_db(mock_db)
+
+        inventory = utils.get_inventory("deploy-uuid")
+        self.assertIs(inventory, utils.get_inventory("deploy-uuid"))
+
+        utils.invalidate_inventory()
+        self.assertIsNot(inventory, utils.get_inventory("deploy-uuid"))
+        self.assertEqual(2, mock_db.deployment_list.call_count)
@@ -26,7 +26,7 @@ def get_fake_context(**config):
 
     return {
         "task": {
-            "uuid": "fake_task_uuid",
+            "uuid": "fa4e7a5c-0f9b-4f0e-9d6a-2a4f5e6c7d8e",
         },
         "ovn_multihost": {
             "controller": {
@@ -43,5 +43,8 @@ def get_fake_context(**config):
             },
             "install_method": "fake_install_method",
         },
+        "controller": {
+            "host_container": None,
+        },
         "config": config,
     }